@@ -0,0 +1,99 @@
+# Micro-benchmark: colorizer.insert_args against the Team Code insert_ansi_colored_text.
+#
+#   python bench_colorizer.py [log file]
+#
+# Both run against a stand-in widget that only counts insert calls, so the numbers
+# show the Python-side cost per line and how many Tk calls each approach makes.
+import os
+import re
+import sys
+import time
+
+from colorizer import insert_args
+
+DEFAULT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                           "CIAP - Team Code", "serial_log_20241007_151727.log")
+
+
+class CountingWidget:
+    def __init__(self):
+        self.calls = 0
+
+    def insert(self, index, *args):
+        self.calls += 1
+
+    def yview(self, *args):
+        self.calls += 1
+
+
+class LegacyConsole:
+    # insert_ansi_colored_text from "CIAP - Team Code/main_changes.py", unchanged
+    def __init__(self):
+        self.log_console = CountingWidget()
+
+    def insert_ansi_colored_text(self, text):
+        ansi_escape = re.compile(r'\033\[(\d+)(;\d+)*m')
+        flags = {'AIS': 'ais', 'CVP': 'cvp', 'CAN': 'can', 'NET': 'net', 'PLA': 'pla', 'FOT': 'fot'}
+        current_tag = None
+        parts = ansi_escape.split(text)
+        for part in parts:
+            if ansi_escape.match(part):
+                codes = part.strip('\033[m').split(';')
+                for code in codes:
+                    if code == "32":
+                        current_tag = 'net'
+                    elif code == "34":
+                        current_tag = 'cvp'
+                    elif code == "35":
+                        current_tag = 'can'
+                    elif code == "33":
+                        current_tag = 'pla'
+                    elif code == "0":
+                        current_tag = None
+            else:
+                for flag, tag in flags.items():
+                    if flag in part:
+                        current_tag = tag
+                        break
+                else:
+                    current_tag = None
+                if current_tag:
+                    self.log_console.insert('end', part, current_tag)
+                else:
+                    self.log_console.insert('end', part)
+        self.log_console.insert('end', "\n")
+        self.log_console.yview('end')
+
+
+def load_lines(path):
+    with open(path, 'rb') as log:
+        return [raw.decode('utf-8', 'replace').rstrip('\r\n') for raw in log]
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOG
+    lines = load_lines(path)
+    batch = 50  # Lines per GUI frame in the new pipeline
+
+    legacy = LegacyConsole()
+    start = time.perf_counter()
+    for line in lines:
+        legacy.insert_ansi_colored_text(line)
+    legacy_time = time.perf_counter() - start
+
+    widget = CountingWidget()
+    start = time.perf_counter()
+    for i in range(0, len(lines), batch):
+        widget.insert('end', *insert_args(lines[i:i + batch]))
+    new_time = time.perf_counter() - start
+
+    print(f"lines            : {len(lines)} from {os.path.basename(path)}")
+    print(f"legacy           : {legacy_time * 1e6 / len(lines):6.2f} us/line, "
+          f"{legacy.log_console.calls} widget calls")
+    print(f"single-pass      : {new_time * 1e6 / len(lines):6.2f} us/line, "
+          f"{widget.calls} widget calls ({batch} lines per batch)")
+    print(f"speedup          : {legacy_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Throughput benchmark for line_parser.parse_line over the sample logs in the repo.
+#
+#   python bench_parser.py [log file ...]
+#
+# Also runs the obvious alternative, trying every line type's pattern with re.search
+# on each line, and compares the records the two produce.
+import glob
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from line_parser import PARSERS, build_record, parse_line
+
+REPO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DEFAULT_LOGS = (glob.glob(os.path.join(REPO, "CIAP - Team Code", "*.log")) +
+                glob.glob(os.path.join(REPO, "CIAP Make Change Files", "*.log")))
+
+
+def load_lines(paths):
+    lines = []
+    for path in paths:
+        with open(path, 'rb') as log:
+            lines.extend(raw.decode('utf-8', 'replace').rstrip() for raw in log)
+    return lines
+
+
+def search_every_type(line, parsers):
+    # Each line type's pattern is searched for anywhere in the line, in table order
+    for pattern, converters, record_class in parsers:
+        match = pattern.search(line)
+        if match is not None:
+            try:
+                return build_record(record_class, converters, match.groups())
+            except ValueError:
+                return None
+    return None
+
+
+def main():
+    paths = sys.argv[1:] or DEFAULT_LOGS
+    lines = load_lines(paths)
+    if not lines:
+        print("No lines to parse")
+        return
+    rounds = 3
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        records = [parse_line(line) for line in lines]
+    table_time = (time.perf_counter() - start) / rounds
+
+    parsers = [(re.compile(re.escape(f"[{module}]") + r'\s+' + re.escape(word) + pattern.pattern),
+                converters, record_class)
+               for (module, word), entries in PARSERS.items()
+               for pattern, converters, record_class in entries]
+    start = time.perf_counter()
+    naive = [search_every_type(line, parsers) for line in lines]
+    naive_time = time.perf_counter() - start
+
+    counts = Counter(record.kind for record in records if record is not None)
+    parsed = sum(counts.values())
+    print(f"lines            : {len(lines)} from {len(paths)} log(s), {parsed} parsed "
+          f"({parsed * 100 / len(lines):.1f}%)")
+    for kind, count in counts.most_common():
+        print(f"  {kind:<15}: {count}")
+    print(f"table-driven     : {table_time * 1e6 / len(lines):6.2f} us/line, "
+          f"{len(lines) / table_time:,.0f} lines/s")
+    print(f"search every type: {naive_time * 1e6 / len(lines):6.2f} us/line, "
+          f"{len(lines) / naive_time:,.0f} lines/s")
+    print(f"speedup          : {naive_time / table_time:.1f}x")
+    # Where firmware output got interleaved, searching can match a tag further along
+    # the line; parse_line only looks at the first tag
+    differences = sum(1 for a, b in zip(records, naive) if a != b)
+    print(f"differing lines  : {differences} (interleaved output)")
+
+
+if __name__ == "__main__":
+    main()
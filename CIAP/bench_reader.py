@@ -0,0 +1,119 @@
+# Throughput/latency benchmark for SerialReader against a pty-based fake device.
+#
+#   python bench_reader.py                  # 5000 lines paced at 115200 baud (about 61 s)
+#   python bench_reader.py --baud 0         # unpaced, as fast as the pty accepts
+#   python bench_reader.py --legacy         # old in_waiting/readline/sleep(0.1) loop
+#
+# Each line carries its send time so latency is measured end to end (write -> on_line).
+# A paced run can't go faster than the wire, so its lines/s is the baud rate, not the
+# reader's throughput; use --baud 0 for that. A run that times out before every line
+# arrived is reported as a failure.
+import argparse
+import os
+import sys
+import threading
+import time
+import tty
+
+import serial
+
+from reader import SerialReader, decode_line
+
+SAMPLE = ("DEBUG: [PLA] ACCEL   DDT (X Y): +0000.11 +0000.37 AXIS (X Y Z): +0018.52 "
+          "+0047.29 +2068.60 GRAD: +01.30 ROLL: +00.51 TILT: +01.40")
+
+
+def wire_time(count, baud):
+    # Seconds the fake device takes to send count lines at baud (0 = unpaced)
+    line = len(f"{time.perf_counter_ns()} {SAMPLE}\r\n")
+    return count * line * 10.0 / baud if baud else 0.0
+
+
+def fake_device(fd, count, baud, burst):
+    # 10 bits per byte on the wire (8N1)
+    byte_time = 10.0 / baud if baud else 0.0
+    next_send = time.perf_counter()
+    for i in range(0, count, burst):
+        chunk = b''.join(
+            f"{time.perf_counter_ns()} {SAMPLE}\r\n".encode() for _ in range(min(burst, count - i)))
+        os.write(fd, chunk)
+        if byte_time:
+            next_send += len(chunk) * byte_time
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def legacy_loop(port, on_line, stop):
+    while not stop.is_set() and port.is_open:
+        if port.in_waiting > 0:
+            on_line(decode_line(port.readline()))
+        time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SerialReader benchmark")
+    parser.add_argument("--lines", type=int, default=5000)
+    parser.add_argument("--baud", type=int, default=115200, help="pace the fake device (0 = unpaced)")
+    parser.add_argument("--burst", type=int, default=50, help="lines written per burst")
+    parser.add_argument("--legacy", action="store_true", help="benchmark the old polling loop instead")
+    parser.add_argument("--timeout", type=float, help="seconds to wait for every line (default: wire time + 50%% + 10 s)")
+    args = parser.parse_args()
+    if args.timeout is None:
+        args.timeout = wire_time(args.lines, args.baud) * 1.5 + 10
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    port = serial.Serial(os.ttyname(slave), baudrate=115200, timeout=1)
+
+    latencies = []
+    done = threading.Event()
+
+    def on_line(line, stamp=None):
+        now = time.perf_counter_ns()
+        sent = line.split(' ', 1)[0]
+        if sent.isdigit():
+            latencies.append((now - int(sent)) / 1e6)
+        if len(latencies) >= args.lines:
+            done.set()
+
+    stop = threading.Event()
+    if args.legacy:
+        worker = threading.Thread(target=legacy_loop, args=(port, on_line, stop), daemon=True)
+        worker.start()
+    else:
+        reader = SerialReader(port, on_line)
+        reader.start()
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    writer = threading.Thread(target=fake_device, args=(master, args.lines, args.baud, args.burst), daemon=True)
+    writer.start()
+    done.wait(args.timeout)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    stop.set()
+    if not args.legacy:
+        reader.stop()
+    port.close()
+    os.close(master)
+
+    received = len(latencies)
+    latencies.sort()
+    print(f"mode        : {'legacy poll' if args.legacy else 'SerialReader'}")
+    print(f"lines       : {received}/{args.lines} in {elapsed:.2f} s")
+    if received < args.lines:
+        print(f"FAILED: timed out after {args.timeout:.1f} s with {args.lines - received} lines missing")
+        sys.exit(1)
+    paced = f" (paced at {args.baud} baud)" if args.baud else ""
+    print(f"lines/s     : {received / elapsed:,.0f}{paced}")
+    print(f"cpu         : {cpu:.2f} s ({100 * cpu / elapsed:.0f}% of one core, incl. fake device)")
+    if latencies:
+        print(f"latency p50 : {latencies[received // 2]:.2f} ms")
+        print(f"latency p99 : {latencies[min(received - 1, int(received * 0.99))]:.2f} ms")
+        print(f"latency max : {latencies[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+# CAN capture and the merged CAN/serial timeline.
+#
+# CanCapture records every frame on a CAN interface into a .cap capture (see
+# log_writer.CanLogWriter), stamped with the same monotonic clock as the serial
+# readers. merge_timeline() then interleaves any number of serial logs and CAN
+# captures by time, so the frames on the bus can be read next to the device's
+# "[CAN] ... DTC_Code:0x900200" lines:
+#
+#   python3 can_capture.py record --channel vcan0 [-o can_log.cap]
+#   python3 can_capture.py timeline serial_log_20241007_151727.log can_log_20241007_151730.cap \
+#       [--dbc vehicle.dbc] [--from "2024-10-07 15:54:00"]
+#
+# The merge is a heapq.merge over one generator per file, so it reads each file
+# sequentially a line or record at a time and never loads one whole. A start time
+# goes through the capture index, or a binary search over byte offsets for text
+# logs. Frames are decoded with the DBC only when a line is actually formatted
+# (CanDecoder), not while merging.
+import argparse
+import gzip
+import heapq
+import os
+import threading
+import time
+
+import settings
+from can_sim import open_can_bus
+from capture_file import CaptureFile, can_frame, can_frame_text
+from log_writer import RECORD_CAN, RECORD_DECODED, CanLogWriter, new_can_log_path
+from replay import LOG_PREFIX
+from timestamps import clock, line_time_ms
+
+
+class CanCapture:
+    # Reads frames from a CAN interface on its own thread and writes them to path
+    def __init__(self, channel, path=None, on_error=None):
+        self.channel = channel
+        self.bus = open_can_bus(channel)
+        self.path = path or new_can_log_path()
+        try:
+            self.writer = CanLogWriter(self.path, channel=channel)
+        except OSError:
+            self.bus.close()
+            raise
+        self.on_error = on_error
+        self.running = False
+        self.thread = None
+        self.rate_sample = (time.monotonic(), 0)
+        self.rate = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+        self.bus.close()
+        self.writer.close()
+
+    def run(self):
+        bus = self.bus
+        write_frame = self.writer.write_frame
+        clock_ns = time.monotonic_ns
+        while self.running:
+            try:
+                frame = bus.recv(0.5)  # Wakes up now and then to notice stop()
+                if frame is None:
+                    continue
+                write_frame(clock_ns(), *frame)
+            except Exception as e:
+                if self.running:
+                    print(f"Error capturing CAN on {self.channel}: {e}")
+                    self.running = False
+                    if self.on_error:
+                        self.on_error(e)
+                break
+
+    def status_text(self):
+        now = time.monotonic()
+        sampled_at, sampled_frames = self.rate_sample
+        if now - sampled_at >= 1.0:
+            self.rate = (self.writer.frames - sampled_frames) / (now - sampled_at)
+            self.rate_sample = (now, self.writer.frames)
+        return f"CAN capture {self.channel}: {self.writer.frames} frames  {self.rate:.0f} frames/s"
+
+
+class CanDecoder:
+    # Signal values of frames from a DBC file. cantools and the DBC are only loaded on
+    # the first decode, and each distinct (id, data) is decoded once.
+    def __init__(self, path):
+        self.path = path
+        self.database = None
+        self.errors = ()
+        self.cache = {}
+
+    def decode(self, can_id, data):
+        # "EEC1 EngSpeed=1500.0 ..." or "" for frames the DBC doesn't describe
+        key = (can_id, data)
+        text = self.cache.get(key)
+        if text is not None:
+            return text
+        if self.database is None:
+            import cantools
+
+            try:
+                self.database = cantools.database.load_file(self.path)
+            except (OSError, cantools.database.errors.Error) as e:
+                raise ValueError(f"can't load {self.path}: {e}") from e
+            self.errors = (KeyError, ValueError, cantools.database.errors.Error)
+        try:
+            message = self.database.get_message_by_frame_id(can_id & 0x1FFFFFFF)
+            values = message.decode(data, decode_choices=True, allow_truncated=True)
+            text = message.name + " " + " ".join(f"{name}={value}" for name, value in values.items())
+        except self.errors:
+            text = ""
+        if len(self.cache) > 100000:
+            self.cache.clear()
+        self.cache[key] = text
+        return text
+
+
+def seek_text_time(log, size, start_ms, seconds):
+    # Leaves log at the start of a line shortly before the first one stamped start_ms
+    # or later: a binary search over byte offsets, reading a line or two per step
+    low, high = 0, size
+    while high - low > 65536:
+        middle = (low + high) // 2
+        log.seek(middle)
+        log.readline()  # Partial line
+        stamp = None
+        while stamp is None:
+            raw = log.readline()
+            if not raw:
+                break
+            stamp = line_time_ms(raw.decode('utf-8', 'replace'), seconds)
+        if stamp is None or stamp >= start_ms:
+            high = middle
+        else:
+            low = middle
+    log.seek(low)
+    if low:
+        log.readline()
+
+
+def text_events(path, source, start_ns=None):
+    # (wall ns, source, text, None) for each line of a text log. Lines without a
+    # timestamp (continued after a newline) get the time of the line before.
+    seconds = {}
+    start_ms = start_ns // 1_000_000 if start_ns is not None else None
+    compressed = path.endswith('.gz')
+    with (gzip.open(path, 'rb') if compressed else open(path, 'rb')) as log:
+        if start_ms is not None and not compressed:
+            seek_text_time(log, os.path.getsize(path), start_ms, seconds)
+        last_ns = None
+        for raw in log:
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            stamp_ms = line_time_ms(line, seconds)
+            if stamp_ms is None:
+                if last_ns is None:
+                    continue
+            else:
+                last_ns = stamp_ms * 1_000_000
+                prefix = LOG_PREFIX.match(line)
+                if prefix:
+                    line = line[prefix.end():]
+            if start_ns is not None and last_ns < start_ns:
+                continue
+            yield last_ns, source, line, None
+
+
+def capture_events(path, source, start_ns=None):
+    # The same for a capture; CAN records also carry (CAN id, data) for decoding
+    capture = CaptureFile(path)
+    try:
+        records = capture.records() if start_ns is None else capture.records_from(start_ns)
+        for _, wall_ns, _, flags, payload in records:
+            if flags & RECORD_CAN:
+                can_id, _, data = can_frame(payload)
+                yield wall_ns, source, can_frame_text(payload), (can_id, data)
+            else:
+                text = payload.decode('utf-8', 'replace')
+                yield wall_ns, source, text if flags & RECORD_DECODED else text.rstrip('\r\n'), None
+    finally:
+        capture.close()
+
+
+def source_name(path):
+    name = os.path.basename(path)
+    for suffix in ('.gz', '.cap', '.log'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def merge_timeline(paths, start_ns=None):
+    # (wall ns, source index, text, CAN frame or None) from all the files, in time
+    # order. Ties keep the order of paths.
+    sources = []
+    for index, path in enumerate(paths):
+        base = path[:-3] if path.endswith('.gz') else path
+        events = capture_events if base.endswith('.cap') else text_events
+        sources.append(events(path, index, start_ns))
+    return heapq.merge(*sources, key=lambda event: event[0])
+
+
+def event_text(event, names, decoder=None):
+    # One timeline line: time, source and text, with the decoded signals of a frame
+    wall_ns, source, text, frame = event
+    if frame is not None and decoder is not None:
+        decoded = decoder.decode(*frame)
+        if decoded:
+            text = f"{text}  {decoded}"
+    return f"{clock.format_wall(wall_ns)} {names[source]}: {text}"
+
+
+def parse_time(text):
+    # "YYYY-mm-dd HH:MM:SS[.mmm]" -> epoch ns
+    seconds, _, fraction = text.strip().partition('.')
+    wall = int(time.mktime(time.strptime(seconds, '%Y-%m-%d %H:%M:%S')))
+    return wall * 1_000_000_000 + int((fraction + "000")[:3]) * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture CAN frames, or merge captures and serial logs by time")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record the frames on a CAN interface")
+    record.add_argument("--channel", default=settings.CAN_CHANNEL,
+                        help=f"SocketCAN interface or python-can interface:channel (default {settings.CAN_CHANNEL})")
+    record.add_argument("-o", "--output", help="capture to write (default: can_log_<time>.cap)")
+    record.add_argument("--duration", type=float, default=0, help="seconds to record (default: until Ctrl+C)")
+    timeline = commands.add_parser("timeline", help="print serial logs and CAN captures merged by time")
+    timeline.add_argument("files", nargs="+", help="text logs and .cap captures")
+    timeline.add_argument("--dbc", help="decode CAN frames with this DBC file")
+    timeline.add_argument("--from", dest="start", help='start time, "YYYY-mm-dd HH:MM:SS[.mmm]"')
+    args = parser.parse_args()
+
+    if args.command == "timeline":
+        names = [source_name(path) for path in args.files]
+        decoder = CanDecoder(args.dbc) if args.dbc else None
+        start_ns = parse_time(args.start) if args.start else None
+        try:
+            for event in merge_timeline(args.files, start_ns):
+                print(event_text(event, names, decoder))
+        except BrokenPipeError:
+            pass  # | head
+        return
+
+    capture = CanCapture(args.channel, args.output)
+    print(f"Recording {capture.channel} to {capture.path}")
+    capture.start()
+    end = time.monotonic() + args.duration if args.duration else None
+    try:
+        while capture.running and (end is None or time.monotonic() < end):
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    capture.stop()
+    print(f"{capture.writer.frames} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+# CAN simulator: sends the periodic messages of a DBC file at their cycle times, so a
+# device can be fed "continuous CAN data" from the Pi without a vehicle:
+#
+#   python3 can_sim.py vehicle.dbc [--channel vcan0] [--only EEC1,CCVS] [--set EEC1.EngSpeed=1500]
+#
+# The DBC is loaded once with cantools (pip install cantools). Each message then gets
+# an encoder generated for its signal layout (shifts and masks into one integer, see
+# compile_encoder), and the finished frame is rebuilt only when a signal value
+# changes. Sending a frame is one syscall.
+#
+# Frames go out over SocketCAN ("vcan0", "can0") through the socket module, or through
+# python-can for any other adapter ("slcan:/dev/ttyACM0", "pcan:PCAN_USBBUS1",
+# "virtual:test"; pip install python-can). can_capture.py receives through the same
+# bus classes.
+#
+# The scheduler keeps the messages in a heap by next deadline. Deadline n of a
+# message is its start + n * cycle time, not "last send + cycle time", so lateness
+# never accumulates. It sleeps until CAN_SPIN_US before the next deadline and
+# busy-waits the rest, because sleeps overshoot by 0.1-0.5 ms. If a message falls a
+# whole cycle behind, the cycles it missed are skipped and counted, not sent in a burst.
+#
+# In the GUI the simulator runs in its own process (see CanSimProcess), so Tk and the
+# serial pipeline can't hold it up through the GIL.
+import argparse
+import heapq
+import multiprocessing
+import socket
+import struct
+import threading
+import time
+
+import settings
+from log_writer import CAN_BRS, CAN_FD
+
+CAN_FRAME = struct.Struct('=IB3x8s')      # struct can_frame: id, length, data
+CANFD_FRAME = struct.Struct('=IBB2x64s')  # struct canfd_frame: id, length, flags, data
+CAN_EFF_FLAG = 0x80000000                 # 29-bit id
+CANFD_BRS = 0x01                          # Bit rate switch for the data phase
+
+
+def signal_shift(start, length, little_endian, frame_bytes):
+    # Left shift of a signal's raw value in the frame, read as one integer: little
+    # endian for Intel signals, big endian for Motorola ones (whose DBC start bit is
+    # the MSB, numbered 7..0, 15..8, ... within the bytes)
+    if little_endian:
+        shift = start
+    else:
+        msb = start // 8 * 8 + 7 - start % 8  # Position counting from the frame's first bit
+        shift = frame_bytes * 8 - msb - length
+    if shift < 0 or shift + length > frame_bytes * 8:
+        raise ValueError(f"signal at bit {start} ({length} bits) doesn't fit in {frame_bytes} bytes")
+    return shift
+
+
+def compile_encoder(frame_bytes, layout):
+    # layout is [(shift, bits, little endian)] of the signals to encode; returns
+    # encode(raw values) -> frame bytes. The generated function, e.g.
+    #   lambda r: ((r[0] & 0xffff) << 0 | (r[1] & 0xff) << 16).to_bytes(8, 'little')
+    # packs an 8-byte frame in about 0.5 us, a sixth of cantools' encode().
+    little = " | ".join(f"(r[{i}] & {(1 << bits) - 1:#x}) << {shift}"
+                        for i, (shift, bits, little_endian) in enumerate(layout) if little_endian) or "0"
+    big = " | ".join(f"(r[{i}] & {(1 << bits) - 1:#x}) << {shift}"
+                     for i, (shift, bits, little_endian) in enumerate(layout) if not little_endian)
+    if big:
+        source = (f"lambda r: (({little}) | from_bytes(({big}).to_bytes({frame_bytes}, 'big'), 'little'))"
+                  f".to_bytes({frame_bytes}, 'little')")
+    else:
+        source = f"lambda r: ({little}).to_bytes({frame_bytes}, 'little')"
+    return eval(source, {'from_bytes': int.from_bytes})
+
+
+class SimSignal:
+    def __init__(self, signal, frame_bytes):
+        self.name = signal.name
+        self.bits = signal.length
+        self.shift = signal_shift(signal.start, signal.length, signal.byte_order == 'little_endian', frame_bytes)
+        self.little_endian = signal.byte_order == 'little_endian'
+        self.signed = signal.is_signed
+        self.float = signal.is_float
+        self.scale = signal.scale or 1
+        self.offset = signal.offset or 0
+        self.mux_ids = signal.multiplexer_ids  # Sent only while the multiplexer has one of these values
+        self.is_multiplexer = signal.is_multiplexer
+        if self.signed:
+            self.low, self.high = -(1 << self.bits - 1), (1 << self.bits - 1) - 1
+        else:
+            self.low, self.high = 0, (1 << self.bits) - 1
+        raw = getattr(signal, 'raw_initial', None)  # cantools < 38: initial is the raw value
+        if raw is None:
+            raw = getattr(signal, 'initial', None)
+        if raw is None:
+            value = signal.minimum if signal.minimum is not None and signal.minimum > 0 else 0
+        else:
+            value = raw * self.scale + self.offset
+        self.value = value
+
+    def raw(self, value):
+        if self.float:
+            return int.from_bytes(struct.pack('<f' if self.bits == 32 else '<d', value), 'little')
+        raw = round((value - self.offset) / self.scale)
+        return min(max(raw, self.low), self.high)
+
+
+class SimMessage:
+    def __init__(self, message):
+        self.name = message.name
+        self.frame_id = message.frame_id
+        self.extended = message.is_extended_frame
+        self.fd = message.is_fd or message.length > 8
+        self.length = message.length
+        self.period_ns = int(message.cycle_time * 1_000_000) if message.cycle_time else 0
+        self.signals = {signal.name: SimSignal(signal, message.length) for signal in message.signals}
+        self.multiplexer = next((signal for signal in self.signals.values() if signal.is_multiplexer), None)
+        self.enabled = bool(self.period_ns)
+        self.bus = None
+        self.frame = None  # What the bus sends, rebuilt by encode()
+        self.active = None
+        self.encoder = None
+
+        # Stats, updated by the scheduler
+        self.sent = 0
+        self.skipped = 0  # Cycles missed by more than a period and not sent
+
+    def compile(self):
+        # Multiplexed signals only go in for the multiplexer's current value
+        mux = self.multiplexer.raw(self.multiplexer.value) if self.multiplexer else None
+        self.active = [signal for signal in self.signals.values()
+                       if signal.mux_ids is None or mux in signal.mux_ids]
+        self.encoder = compile_encoder(self.length, [(signal.shift, signal.bits, signal.little_endian)
+                                                     for signal in self.active])
+
+    def encode(self):
+        if self.encoder is None:
+            self.compile()
+        data = self.encoder([signal.raw(signal.value) for signal in self.active])
+        if self.bus:
+            self.frame = self.bus.frame(self.frame_id, self.extended, self.fd, data)
+        return data
+
+    def set(self, name, value):
+        signal = self.signals.get(name)
+        if signal is None:
+            raise KeyError(f"{self.name} has no signal {name}")
+        signal.value = value
+        if signal.is_multiplexer:
+            self.encoder = None
+        self.encode()
+
+
+def load_dbc(path):
+    # [SimMessage] for the messages in a DBC file
+    import cantools
+
+    database = cantools.database.load_file(path)
+    return [SimMessage(message) for message in database.messages]
+
+
+class SocketCanBus:
+    def __init__(self, channel):
+        if not hasattr(socket, 'AF_CAN'):
+            raise OSError("SocketCAN needs Linux; use interface:channel for a python-can adapter")
+        self.channel = channel
+        self.sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        try:
+            self.sock.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FD_FRAMES, 1)
+        except OSError:
+            pass  # Classic CAN only
+        self.sock.bind((channel,))
+
+    def frame(self, frame_id, extended, fd, data):
+        can_id = frame_id | CAN_EFF_FLAG if extended else frame_id
+        if fd:
+            return CANFD_FRAME.pack(can_id, len(data), CANFD_BRS, data)
+        return CAN_FRAME.pack(can_id, len(data), data)
+
+    def send(self, frame):
+        self.sock.send(frame)
+
+    def recv(self, timeout):
+        # (CAN id with its SocketCAN flag bits, CAN_FD/CAN_BRS flags, data), or None
+        # after timeout seconds without a frame
+        self.sock.settimeout(timeout)
+        try:
+            frame = self.sock.recv(CANFD_FRAME.size)
+        except socket.timeout:
+            return None
+        if len(frame) == CANFD_FRAME.size:
+            can_id, length, fd_flags, data = CANFD_FRAME.unpack(frame)
+            return can_id, CAN_FD | (CAN_BRS if fd_flags & CANFD_BRS else 0), data[:length]
+        can_id, length, data = CAN_FRAME.unpack(frame)
+        return can_id, 0, data[:length]
+
+    def close(self):
+        self.sock.close()
+
+
+class PythonCanBus:
+    def __init__(self, interface, channel):
+        import can
+
+        self.channel = f"{interface}:{channel}"
+        self.message = can.Message
+        self.bus = can.Bus(interface=interface, channel=channel, bitrate=settings.CAN_BITRATE)
+
+    def frame(self, frame_id, extended, fd, data):
+        return self.message(arbitration_id=frame_id, is_extended_id=extended, is_fd=fd, bitrate_switch=fd,
+                            data=data)
+
+    def send(self, frame):
+        self.bus.send(frame)
+
+    def recv(self, timeout):
+        message = self.bus.recv(timeout)
+        if message is None:
+            return None
+        can_id = message.arbitration_id | CAN_EFF_FLAG if message.is_extended_id else message.arbitration_id
+        flags = (CAN_FD if message.is_fd else 0) | (CAN_BRS if message.bitrate_switch else 0)
+        return can_id, flags, bytes(message.data)
+
+    def close(self):
+        self.bus.shutdown()
+
+
+def open_can_bus(channel):
+    interface, separator, name = channel.partition(':')
+    if separator:
+        return PythonCanBus(interface, name)
+    return SocketCanBus(channel)
+
+
+class CanSimulator:
+    # Sends the enabled periodic messages on bus from its own thread
+    def __init__(self, messages, bus):
+        self.messages = [message for message in messages if message.period_ns]
+        self.by_name = {message.name: message for message in messages}
+        self.bus = bus
+        self.spin_ns = settings.CAN_SPIN_US * 1000
+        self.running = False
+        self.thread = None
+        for message in messages:
+            message.bus = bus
+            message.encode()
+
+        # Stats: totals, and the lateness of each frame since the last stats() call
+        self.sent = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+        self.lateness = []
+        self.window_start = time.monotonic()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+
+    def message(self, name):
+        message = self.by_name.get(name)
+        if message is None:
+            raise KeyError(f"no message {name}")
+        return message
+
+    def set(self, message_name, signal_name, value):
+        self.message(message_name).set(signal_name, value)
+
+    def enable(self, message_name, enabled=True):
+        self.message(message_name).enabled = enabled
+
+    def run(self):
+        messages = self.messages
+        if not messages:
+            return
+        # Phases spread over each message's cycle so equal cycles don't all go at once
+        start = time.monotonic_ns() + 10_000_000
+        count = len(messages)
+        heap = [(start + message.period_ns * i // count, i) for i, message in enumerate(messages)]
+        heapq.heapify(heap)
+        spin_ns = self.spin_ns
+        clock = time.monotonic_ns
+        send = self.bus.send
+
+        while self.running:
+            due, i = heap[0]
+            wait = due - clock()
+            if wait > spin_ns:
+                time.sleep(min(wait - spin_ns, 50_000_000) / 1e9)  # Slices, so stop() is noticed
+                continue
+            now = clock()
+            while now < due:
+                now = clock()
+            message = messages[i]
+            if message.enabled:
+                try:
+                    send(message.frame)
+                    message.sent += 1
+                    self.sent += 1
+                    self.lateness.append(now - due)  # Swapped out by stats()
+                except OSError as e:  # e.g. ENOBUFS when the bus can't keep up
+                    self.errors += 1
+                    self.last_error = e
+            period = message.period_ns
+            due += period
+            if due <= now:
+                missed = (now - due) // period + 1
+                due += missed * period
+                message.skipped += missed
+                self.skipped += missed
+            heapq.heapreplace(heap, (due, i))
+
+    def stats(self):
+        # Scheduling stats since the last call; lateness is send time - deadline
+        lateness, self.lateness = self.lateness, []
+        now = time.monotonic()
+        elapsed, self.window_start = now - self.window_start, now
+        lateness.sort()
+        count = len(lateness)
+        return {
+            'rate': count / elapsed if elapsed > 0 else 0.0,
+            'mean_us': sum(lateness) / count / 1000 if count else 0.0,
+            'p99_us': lateness[min(count - 1, count * 99 // 100)] / 1000 if count else 0.0,
+            'max_us': lateness[-1] / 1000 if count else 0.0,
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'messages': {message.name: (message.sent, message.skipped) for message in self.messages},
+        }
+
+
+def stats_text(stats):
+    return (f"CAN: {stats['rate']:.0f} frames/s  late mean {stats['mean_us']:.0f} us"
+            f"  p99 {stats['p99_us']:.0f} us  max {stats['max_us']:.0f} us"
+            f"  skipped: {stats['skipped']}  errors: {stats['errors']}")
+
+
+def run_simulator(dbc_path, channel, conn):
+    # Body of the simulator process. Commands come in on conn:
+    #   ('enable', message, bool), ('set', message, signal, value), ('stop',)
+    # and ('messages', [...]) once, then ('stats', {...}) every CAN_STATS_MS go out,
+    # ('rejected', text) for a command that failed, or ('error', text) if it can't start.
+    try:
+        messages = load_dbc(dbc_path)
+        bus = open_can_bus(channel)
+    except ImportError as e:
+        conn.send(('error', f"{e.name} is not installed (pip install {e.name})"))
+        return
+    except Exception as e:
+        conn.send(('error', str(e)))
+        return
+    simulator = CanSimulator(messages, bus)
+    conn.send(('messages', [(message.name, message.frame_id, message.period_ns // 1_000_000, message.enabled,
+                             [(signal.name, signal.value) for signal in message.signals.values()])
+                            for message in messages]))
+    simulator.start()
+    interval = settings.CAN_STATS_MS / 1000.0
+    next_stats = time.monotonic() + interval
+    try:
+        while True:
+            if conn.poll(max(0.0, next_stats - time.monotonic())):
+                command = conn.recv()
+                if command[0] == 'stop':
+                    break
+                try:
+                    if command[0] == 'enable':
+                        simulator.enable(command[1], command[2])
+                    elif command[0] == 'set':
+                        simulator.set(command[1], command[2], command[3])
+                except KeyError as e:
+                    conn.send(('rejected', e.args[0]))
+                except (ValueError, TypeError) as e:
+                    conn.send(('rejected', str(e)))
+            if time.monotonic() >= next_stats:
+                next_stats += interval
+                conn.send(('stats', simulator.stats()))
+    except (EOFError, OSError):
+        pass  # The GUI went away
+    finally:
+        simulator.stop()
+        bus.close()
+
+
+class CanSimProcess:
+    # The GUI's handle on a simulator process. Replies are read by poll(), on the Tk
+    # thread; the rest just sends commands.
+    def __init__(self, dbc_path, channel):
+        # spawn, not fork: this is started from the GUI process
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=run_simulator, args=(dbc_path, channel, child_conn))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.messages = None
+        self.stats = None
+        self.error = None
+        self.rejected = None  # Why the last command failed, for the window to show
+
+    def poll(self):
+        # Takes what the process sent; True if anything arrived
+        changed = False
+        try:
+            while self.conn.poll():
+                kind, value = self.conn.recv()
+                if kind == 'messages':
+                    self.messages = value
+                elif kind == 'stats':
+                    self.stats = value
+                elif kind == 'rejected':
+                    self.rejected = value
+                else:
+                    self.error = value
+                changed = True
+        except (EOFError, OSError):
+            if self.error is None and not self.process.is_alive():
+                self.error = "simulator process ended"
+                changed = True
+        return changed
+
+    def send(self, *command):
+        try:
+            self.conn.send(command)
+        except (OSError, ValueError):
+            pass
+
+    def stop(self):
+        self.send('stop')
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+    def status_text(self):
+        if self.error:
+            return f"CAN: {self.error}"
+        return stats_text(self.stats) if self.stats else "CAN: starting"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send the periodic messages of a DBC file on a CAN bus")
+    parser.add_argument("dbc", help="DBC file")
+    parser.add_argument("--channel", default=settings.CAN_CHANNEL,
+                        help=f"SocketCAN interface or python-can interface:channel (default {settings.CAN_CHANNEL})")
+    parser.add_argument("--only", help="comma separated message names to send (default: all with a cycle time)")
+    parser.add_argument("--set", action="append", default=[], metavar="MESSAGE.SIGNAL=VALUE",
+                        help="signal value to send instead of its start value")
+    parser.add_argument("--duration", type=float, default=0, help="seconds to run (default: until Ctrl+C)")
+    args = parser.parse_args()
+
+    try:
+        messages = load_dbc(args.dbc)
+        bus = open_can_bus(args.channel)
+    except ImportError as e:
+        print(f"{e.name} is not installed (pip install {e.name})")
+        return
+    simulator = CanSimulator(messages, bus)
+    if args.only:
+        names = set(args.only.split(','))
+        for message in messages:
+            message.enabled = message.name in names
+    for assignment in args.set:
+        target, _, value = assignment.partition('=')
+        message_name, _, signal_name = target.partition('.')
+        simulator.set(message_name, signal_name, float(value))
+    print(f"Sending {sum(message.enabled for message in simulator.messages)} messages on {bus.channel}")
+
+    simulator.start()
+    end = time.monotonic() + args.duration if args.duration else None
+    try:
+        while end is None or time.monotonic() < end:
+            time.sleep(1 if end is None else max(0.0, min(1.0, end - time.monotonic())))
+            print(stats_text(simulator.stats()))
+    except KeyboardInterrupt:
+        pass
+    simulator.stop()
+    bus.close()
+    print(f"{simulator.sent} frames sent, {simulator.skipped} cycles skipped, {simulator.errors} errors")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# CAN windows.
+#
+# CanSimWindow (Control > CAN Simulator) lists the messages of the loaded DBC file
+# with their cycle times and send counts, and shows the scheduler's lateness stats.
+# Messages can be switched on and off and signal values changed while it runs. The
+# simulator itself runs in its own process; see can_sim.py.
+#
+# TimelineWindow (Windows > CAN Timeline) shows serial logs and CAN captures merged
+# by time (see can_capture.py), a page at a time as it is scrolled to the bottom.
+import itertools
+import tkinter as tk
+from tkinter import scrolledtext, ttk
+
+import settings
+from can_capture import CanDecoder, event_text, merge_timeline, parse_time, source_name
+from can_sim import CanSimProcess, stats_text
+from colorizer import colorize, configure_tags, insert_args
+
+
+class CanSimWindow:
+    def __init__(self, root, dbc_path, channel, on_close=None):
+        self.root = root
+        self.on_close = on_close
+        self.simulator = CanSimProcess(dbc_path, channel)
+        self.signals = {}  # message -> [signal names]
+        self.enabled = {}  # message -> bool
+        self.interval_ms = max(50, settings.CAN_STATS_MS)
+        self.after_id = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"CAN Simulator - {channel}")
+        self.window.geometry("640x480")
+        self.stats_var = tk.StringVar(value="Starting...")
+        tk.Label(self.window, textvariable=self.stats_var, anchor="w", font=("Consolas", 9)).pack(side=tk.BOTTOM, fill=tk.X)
+
+        # Signal editor: pick a message and signal, type a physical value
+        edit_bar = tk.Frame(self.window)
+        edit_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        tk.Label(edit_bar, text="Signal:").pack(side=tk.LEFT, padx=2)
+        self.signal_var = tk.StringVar()
+        self.signal_box = ttk.Combobox(edit_bar, textvariable=self.signal_var, width=40, state="readonly")
+        self.signal_box.pack(side=tk.LEFT, padx=2)
+        tk.Label(edit_bar, text="Value:").pack(side=tk.LEFT, padx=2)
+        self.value_var = tk.StringVar()
+        value_entry = tk.Entry(edit_bar, textvariable=self.value_var, width=12)
+        value_entry.pack(side=tk.LEFT, padx=2)
+        value_entry.bind("<Return>", lambda e: self.set_signal())
+        tk.Button(edit_bar, text="Set", command=self.set_signal).pack(side=tk.LEFT, padx=2)
+
+        columns = ("id", "cycle", "sent", "skipped", "on")
+        self.tree = ttk.Treeview(self.window, columns=columns, show="tree headings")
+        self.tree.heading("#0", text="Message")
+        for column, title, width in zip(columns, ("ID", "Cycle (ms)", "Sent", "Skipped", "On"),
+                                        (90, 80, 80, 70, 40)):
+            self.tree.heading(column, text=title)
+            self.tree.column(column, width=width, anchor="e")
+        self.tree.pack(expand=True, fill=tk.BOTH)
+        self.tree.bind("<Double-1>", lambda e: self.toggle())
+        self.tree.bind("<<TreeviewSelect>>", lambda e: self.pick_message())
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.after_id = self.window.after(self.interval_ms, self.poll)
+
+    def poll(self):
+        self.after_id = None
+        had_messages = self.simulator.messages is not None
+        if self.simulator.poll():
+            if not had_messages and self.simulator.messages is not None:
+                self.fill()
+            self.update_stats()
+        self.after_id = self.window.after(self.interval_ms, self.poll)
+
+    def fill(self):
+        choices = []
+        for name, frame_id, cycle_ms, enabled, signals in self.simulator.messages:
+            self.enabled[name] = enabled
+            self.signals[name] = [signal for signal, _ in signals]
+            self.tree.insert("", tk.END, iid=name, text=name,
+                             values=(f"{frame_id:#x}", cycle_ms or "event", 0, 0, "yes" if enabled else ""))
+            choices.extend(f"{name}.{signal}" for signal, _ in signals)
+        self.signal_box.configure(values=choices)
+
+    def update_stats(self):
+        simulator = self.simulator
+        if simulator.error:
+            self.stats_var.set(f"Error: {simulator.error}")
+            return
+        stats = simulator.stats
+        if simulator.rejected:
+            self.stats_var.set(simulator.rejected)
+            simulator.rejected = None
+        elif stats:
+            self.stats_var.set(stats_text(stats))
+        if not stats:
+            return
+        for name, (sent, skipped) in stats['messages'].items():
+            if self.tree.exists(name):
+                self.tree.set(name, "sent", sent)
+                self.tree.set(name, "skipped", skipped)
+
+    def toggle(self):
+        # Double click switches the selected periodic messages on or off
+        for name in self.tree.selection():
+            if self.tree.set(name, "cycle") == "event":
+                continue
+            self.enabled[name] = not self.enabled[name]
+            self.simulator.send('enable', name, self.enabled[name])
+            self.tree.set(name, "on", "yes" if self.enabled[name] else "")
+
+    def pick_message(self):
+        # Selecting a message offers its first signal in the editor
+        selection = self.tree.selection()
+        if selection and self.signals.get(selection[0]):
+            self.signal_var.set(f"{selection[0]}.{self.signals[selection[0]][0]}")
+
+    def set_signal(self):
+        message, _, signal = self.signal_var.get().partition(".")
+        try:
+            value = float(self.value_var.get())
+        except ValueError:
+            self.stats_var.set(f"Not a number: {self.value_var.get()}")
+            return
+        if message and signal:
+            self.simulator.send('set', message, signal, value)
+
+    def status_text(self):
+        return self.simulator.status_text()
+
+    def close(self):
+        if self.after_id is not None:
+            self.window.after_cancel(self.after_id)
+        self.simulator.stop()
+        self.window.destroy()
+        if self.on_close:
+            self.on_close()
+
+
+class TimelineWindow:
+    def __init__(self, root, paths, dbc_path=None):
+        self.root = root
+        self.paths = paths
+        self.names = [source_name(path) for path in paths]
+        self.decoder = CanDecoder(dbc_path) if dbc_path else None
+        self.notice = ""
+        self.events = None
+        self.exhausted = False
+        self.shown = 0
+        self.after_id = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title("CAN Timeline - " + ", ".join(self.names))
+        self.window.geometry("1000x600")
+        self.status_var = tk.StringVar()
+        tk.Label(self.window, textvariable=self.status_var, anchor="w", font=("Consolas", 9)).pack(side=tk.BOTTOM, fill=tk.X)
+
+        bar = tk.Frame(self.window)
+        bar.pack(side=tk.TOP, fill=tk.X)
+        tk.Label(bar, text="From (YYYY-mm-dd HH:MM:SS.mmm):").pack(side=tk.LEFT, padx=2)
+        self.from_var = tk.StringVar()
+        from_entry = tk.Entry(bar, textvariable=self.from_var, width=25)
+        from_entry.pack(side=tk.LEFT, padx=2)
+        from_entry.bind("<Return>", lambda e: self.go())
+        tk.Button(bar, text="Go", command=self.go).pack(side=tk.LEFT, padx=2)
+        tk.Button(bar, text="More", command=self.load_page).pack(side=tk.LEFT, padx=2)
+
+        self.text = scrolledtext.ScrolledText(self.window, wrap=tk.NONE, bg="black", fg="white", font=("Consolas", 10))
+        self.text.pack(expand=True, fill=tk.BOTH)
+        configure_tags(self.text)
+        self.text.tag_configure("canbus", foreground="#ffa040")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.start(None)
+        self.after_id = self.window.after(200, self.poll)
+
+    def start(self, start_ns):
+        if self.events is not None:
+            self.events.close()
+        self.events = merge_timeline(self.paths, start_ns)
+        self.exhausted = False
+        self.text.delete('1.0', tk.END)
+        self.shown = 0
+        self.load_page()
+
+    def go(self):
+        text = self.from_var.get().strip()
+        try:
+            start_ns = parse_time(text) if text else None
+        except ValueError:
+            self.status_var.set(f"Not a time: {text}")
+            return
+        self.start(start_ns)
+
+    def poll(self):
+        # The next page is read once the view is scrolled to the bottom
+        self.after_id = None
+        if not self.exhausted and self.text.yview()[1] >= 0.999:
+            self.load_page()
+        self.after_id = self.window.after(200, self.poll)
+
+    def load_page(self):
+        if self.exhausted:
+            return
+        page_lines = settings.TIMELINE_PAGE_LINES
+        try:
+            page = list(itertools.islice(self.events, page_lines))
+        except (OSError, ValueError) as e:
+            self.status_var.set(f"Error reading: {e}")
+            self.exhausted = True
+            return
+        if len(page) < page_lines:
+            self.exhausted = True
+        names = self.names
+
+        def colorize_event(event):
+            line = event_text(event, names, self.decoder)
+            return [(line, ("canbus",))] if event[3] is not None else colorize(line)
+
+        if page:
+            try:
+                args = insert_args(page, colorize_event)
+            except (ImportError, ValueError) as e:
+                # No cantools or a bad DBC: show the frames undecoded
+                self.decoder = None
+                self.notice = f"  |  Not decoding CAN frames: {e}"
+                args = insert_args(page, colorize_event)
+            self.text.insert(tk.END, *args)
+            self.shown += len(page)
+        excess = self.shown - settings.TIMELINE_MAX_LINES
+        if excess > 0:
+            self.text.delete('1.0', f'{excess + 1}.0')
+            self.shown -= excess
+        self.status_var.set(f"{self.shown} lines shown" + ("  (end)" if self.exhausted else "") + self.notice)
+
+    def close(self):
+        if self.after_id is not None:
+            self.window.after_cancel(self.after_id)
+        if self.events is not None:
+            self.events.close()
+        self.window.destroy()
@@ -0,0 +1,198 @@
+# Captures several serial ports at once from one process. A single asyncio event loop
+# on a background thread watches every port's file descriptor and reads whatever has
+# arrived, so 8 devices at full baud rate cost one thread instead of eight. Each port
+# gets its own CaptureSession with its own log file (serial_log_<port>_<time>.log),
+# line splitting and counters.
+import asyncio
+import os
+import threading
+import time
+
+from log_writer import format_entry, new_log_path, open_log_writer
+from reader import ANSI_ESCAPE, decode_line, new_splitter, open_serial_port
+
+
+class CaptureSession:
+    def __init__(self, device, port, log_file):
+        self.device = device
+        self.name = os.path.basename(device)
+        self.port = port
+        self.log_file = log_file
+        self.splitter = new_splitter()
+        self.active = True
+        self.task = None
+
+        # Stats
+        self.started = time.monotonic()
+        self.lines = 0
+        self.bytes = 0
+        self.errors = 0
+        self.last_data = None
+
+    def feed(self, data, arrival, on_line, records=None):
+        # Called on the engine's loop thread with whatever bytes have arrived
+        self.bytes += len(data)
+        self.last_data = arrival
+        for raw, stamp in self.splitter.feed(data, arrival):
+            line = decode_line(raw, strip_ansi=False)
+            entry = format_entry(line, stamp)
+            if '\x1b' in line:
+                line = ANSI_ESCAPE.sub('', line)
+                clean_entry = format_entry(line, stamp)
+            else:
+                clean_entry = entry
+            offset = self.log_file.write(clean_entry, stamp, line)
+            self.lines += 1
+            if on_line:
+                on_line(self, entry, offset)
+            if records is not None:
+                records.publish(self.name, line, stamp)
+
+    def status_text(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        text = (f"{self.name}: {self.lines} lines  {self.bytes / elapsed / 1024:.1f} KB/s"
+                f"  Errors: {self.errors}")
+        if not self.active:
+            text += "  (stopped)"
+        return text + "  |  " + self.log_file.status_text()
+
+
+class CaptureEngine:
+    # on_line(session, entry, offset) and on_closed(session, error) are called on the
+    # engine thread; error is None when the port was removed on request. Lines are
+    # also published to records (a line_parser.RecordBus) if given.
+    def __init__(self, on_line=None, on_closed=None, log_dir=".", chunk_size=4096, records=None):
+        self.on_line = on_line
+        self.on_closed = on_closed
+        self.records = records
+        self.log_dir = log_dir
+        self.chunk_size = chunk_size
+        self.sessions = {}  # device -> CaptureSession
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.closers = []  # Threads closing the logs of detached sessions
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+    def stop(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            self.remove_port(session.device)
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            if self.thread is not threading.current_thread():
+                self.thread.join(timeout=5)
+        for closer in self.closers:
+            closer.join(timeout=10)
+
+    def add_port(self, device, baudrate=115200, on_rotate=None):
+        # Thread safe. Opens the port in the caller's thread so open errors are raised
+        # to it, then hands it to the loop. Returns the new session.
+        with self.lock:
+            if device in self.sessions:
+                raise ValueError(f"{device} is already being captured")
+        port = open_serial_port(device, baudrate)
+        try:
+            name = os.path.basename(device)
+            log_file = open_log_writer(new_log_path(self.log_dir, name), on_rotate, port_name=name)
+        except OSError:
+            port.close()
+            raise
+        session = CaptureSession(device, port, log_file)
+        with self.lock:
+            self.sessions[device] = session
+        self.loop.call_soon_threadsafe(self.attach, session)
+        return session
+
+    def remove_port(self, device):
+        with self.lock:
+            session = self.sessions.get(device)
+        if session:
+            self.loop.call_soon_threadsafe(self.detach, session, None)
+
+    def find(self, device):
+        with self.lock:
+            return self.sessions.get(device)
+
+    def attach(self, session):
+        if os.name == 'posix':
+            # pyserial opens the tty non-blocking; the loop's selector says when to read
+            self.loop.add_reader(session.port.fileno(), self.read_ready, session)
+        else:
+            # No selectable handles for COM ports: blocking reads in the loop's executor
+            session.port.timeout = 0.2
+            session.task = self.loop.create_task(self.read_blocking(session))
+
+    def read_ready(self, session):
+        try:
+            data = os.read(session.port.fileno(), self.chunk_size)
+            arrival = time.monotonic_ns()
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.detach(session, e)
+            return
+        if not data:
+            # Readable with nothing to read: the device is gone
+            self.detach(session, OSError(f"{session.device} disconnected"))
+            return
+        self.handle_data(session, data, arrival)
+
+    async def read_blocking(self, session):
+        port = session.port
+        while session.active:
+            try:
+                data = await self.loop.run_in_executor(
+                    None, port.read, max(1, min(port.in_waiting, self.chunk_size)))
+            except Exception as e:
+                if session.active:
+                    self.detach(session, e)
+                return
+            if data:
+                self.handle_data(session, data, time.monotonic_ns())
+
+    def handle_data(self, session, data, arrival):
+        try:
+            session.feed(data, arrival, self.on_line, self.records)
+        except Exception as e:
+            # A bad line or callback must not stop the other ports
+            session.errors += 1
+            print(f"Error handling data from {session.device}: {e}")
+
+    def detach(self, session, error):
+        if not session.active:
+            return
+        session.active = False
+        if error is not None:
+            session.errors += 1
+            print(f"Error reading from {session.device}: {error}")
+        if session.task is None:
+            try:
+                self.loop.remove_reader(session.port.fileno())
+            except (OSError, ValueError):
+                pass
+        try:
+            session.port.close()
+        except Exception as e:
+            print(f"Error closing {session.device}: {e}")
+        # Closing joins the writer thread and fsyncs; the other ports must not wait for the disk
+        closer = threading.Thread(target=session.log_file.close)
+        closer.daemon = True
+        closer.start()
+        self.closers = [thread for thread in self.closers if thread.is_alive()] + [closer]
+        with self.lock:
+            if self.sessions.get(session.device) is session:
+                del self.sessions[session.device]
+        if self.on_closed:
+            self.on_closed(session, error)
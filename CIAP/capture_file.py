@@ -0,0 +1,175 @@
+# Reads binary capture files (.cap) written by log_writer.CaptureWriter and converts
+# them to the text log format:
+#
+#   python3 capture_file.py serial_log_20241007_151727.cap [-o out.log] [--from "2024-10-07 15:54:00"]
+#
+# The sidecar .idx holds (time, offset) every CAPTURE_INDEX_RECORDS records, so
+# seeking to a time is a binary search plus a short forward scan instead of a read of
+# the whole file.
+import argparse
+import bisect
+import gzip
+import os
+import struct
+import time
+
+from log_writer import (CAN_EXTENDED, CAN_FD, CAN_RECORD, CAPTURE_HEADER, CAPTURE_INDEX, CAPTURE_MAGIC,
+                        CAPTURE_RECORD, RECORD_CAN, RECORD_CLOCK, RECORD_DECODED, RECORD_PORT)
+from timestamps import clock
+
+
+class CaptureFile:
+    def __init__(self, path):
+        self.path = path
+        base = path
+        if path.endswith('.gz'):
+            self.file = gzip.open(path, 'rb')  # Seeking works, but decompresses up to the target
+            base = path[:-3]
+        else:
+            self.file = open(path, 'rb')
+        header = self.file.read(CAPTURE_HEADER.size)
+        magic, self.clock_offset = (CAPTURE_HEADER.unpack(header) if len(header) == CAPTURE_HEADER.size
+                                    else (None, 0))
+        if magic != CAPTURE_MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} is not a capture file")
+        self.ports = {}  # port id -> name
+        self.index = load_index(base + '.idx')
+        self.index_times = [stamp + offset for stamp, offset, _ in self.index]
+        self.index_offsets = [position for _, _, position in self.index]
+
+    def close(self):
+        self.file.close()
+
+    def records(self, start=None, clock_offset=None):
+        # Yields (offset, wall_ns, port, flags, payload) for each line record from the
+        # record at start. Stops at the end of the data written so far.
+        position = start or CAPTURE_HEADER.size
+        offset = self.clock_offset if clock_offset is None else clock_offset
+        self.file.seek(position)
+        read = self.file.read
+        head_size = CAPTURE_RECORD.size
+        unpack = CAPTURE_RECORD.unpack
+        while True:
+            head = read(head_size)
+            if len(head) < head_size:
+                return
+            length, stamp, port, flags = unpack(head)
+            payload = read(length)
+            if len(payload) < length:
+                return  # Record still being written
+            if flags & RECORD_CLOCK:
+                offset = struct.unpack('<q', payload)[0]
+            elif flags & RECORD_PORT:
+                self.ports[port] = payload.decode('utf-8', 'replace')
+            else:
+                yield position, stamp + offset, port, flags, payload
+            position += head_size + length
+
+    def seek_time(self, wall_ns):
+        # (offset, clock offset) of the last indexed record at or before wall_ns
+        i = bisect.bisect_right(self.index_times, wall_ns) - 1
+        if i < 0:
+            return None, None
+        _, offset, position = self.index[i]
+        return position, offset
+
+    def records_from(self, wall_ns):
+        start, offset = self.seek_time(wall_ns)
+        for record in self.records(start, offset):
+            if record[1] >= wall_ns:
+                yield record
+
+    def records_before(self, end, count):
+        # Up to count records ending just before the record at offset end; scans back
+        # from the nearest index entry, further each time until enough are found
+        i = bisect.bisect_left(self.index_offsets, end)
+        step = 1
+        while True:
+            j = i - step
+            if j < 0 or not self.index:
+                start, offset = None, None
+            else:
+                _, offset, start = self.index[j]
+            found = []
+            for record in self.records(start, offset):
+                if record[0] >= end:
+                    break
+                found.append(record)
+            if len(found) >= count or start is None:
+                return found[-count:]
+            step *= 2
+
+
+def load_index(path):
+    try:
+        with open(path, 'rb') as index_file:
+            data = index_file.read()
+    except OSError:
+        return []  # No index (e.g. deleted): seeks fall back to scanning from the start
+    usable = len(data) - len(data) % CAPTURE_INDEX.size
+    return list(CAPTURE_INDEX.iter_unpack(data[:usable]))
+
+
+def can_frame(payload):
+    # (CAN id, flags, data) of a RECORD_CAN payload
+    can_id, flags = CAN_RECORD.unpack_from(payload)
+    return can_id, flags, payload[CAN_RECORD.size:]
+
+
+def can_frame_text(payload):
+    # "CAN 18FECA15 [8] 01 02 03 04 05 06 07 08"; 11-bit ids get three digits
+    can_id, flags, data = can_frame(payload)
+    ident = f"{can_id & 0x1FFFFFFF:08X}" if can_id & CAN_EXTENDED else f"{can_id & 0x7FF:03X}"
+    kind = "CANFD" if flags & CAN_FD else "CAN"
+    return f"{kind} {ident} [{len(data)}] {data.hex(' ').upper()}"
+
+
+def record_text(wall_ns, flags, payload):
+    # The line as it appears in a text log
+    if flags & RECORD_CAN:
+        return f"{clock.format_wall(wall_ns)} - {can_frame_text(payload)}"
+    text = payload.decode('utf-8', 'replace')
+    if not flags & RECORD_DECODED:
+        text = text.rstrip('\r\n')
+    return f"{clock.format_wall(wall_ns)} - {text}"
+
+
+def export_text(source_path, target_path, start_ns=None, port=None):
+    capture = CaptureFile(source_path)
+    count = 0
+    try:
+        records = capture.records() if start_ns is None else capture.records_from(start_ns)
+        with open(target_path, 'w', encoding='utf-8', newline='') as target:
+            for _, wall_ns, record_port, flags, payload in records:
+                if port is not None and capture.ports.get(record_port, str(record_port)) != port:
+                    continue
+                target.write(record_text(wall_ns, flags, payload) + os.linesep)
+                count += 1
+    finally:
+        capture.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a CIAP binary capture to a text log")
+    parser.add_argument("capture", help=".cap file (or .cap.gz)")
+    parser.add_argument("-o", "--output", help="text log to write (default: the capture name with .log)")
+    parser.add_argument("--from", dest="start", help='start time, "YYYY-mm-dd HH:MM:SS"')
+    parser.add_argument("--port", help="only records from this port name")
+    args = parser.parse_args()
+
+    output = args.output
+    if not output:
+        base = args.capture[:-3] if args.capture.endswith('.gz') else args.capture
+        output = os.path.splitext(base)[0] + '.log'
+    start_ns = None
+    if args.start:
+        start_ns = int(time.mktime(time.strptime(args.start, '%Y-%m-%d %H:%M:%S'))) * 1_000_000_000
+
+    count = export_text(args.capture, output, start_ns, args.port)
+    print(f"Wrote {count} lines to {output}")
+
+
+if __name__ == "__main__":
+    main()
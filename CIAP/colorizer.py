@@ -0,0 +1,217 @@
+import re
+import tkinter.font as tkfont
+
+# Module tags printed by the firmware and the console text tag each one is shown with
+MODULE_TAGS = {
+    'AIS': 'ais',
+    'CVP': 'cvp',
+    'CAN': 'can',
+    'NET': 'net',
+    'PLA': 'pla',
+    'FOT': 'fot',
+}
+
+# Tk tag -> foreground colour
+TAG_COLOURS = {
+    'ais': '#0039a6',
+    'cvp': 'blue',
+    'can': 'magenta',
+    'net': 'green',
+    'pla': 'yellow',
+    'fot': 'magenta',
+}
+
+# One pass finds SGR sequences, any other escape sequence (dropped) and the module tag
+TOKEN = re.compile(r'\x1b\[([0-9;]*)m|\x1b[@-_][0-?]*[ -/]*[@-~]|\[(AIS|CVP|CAN|NET|PLA|FOT)\]')
+
+# xterm palette for the 16 basic colours; 16-255 are computed in palette_colour()
+BASIC_COLOURS = [
+    '#000000', '#cd0000', '#00cd00', '#cdcd00', '#0000ee', '#cd00cd', '#00cdcd', '#e5e5e5',
+    '#7f7f7f', '#ff0000', '#00ff00', '#ffff00', '#5c5cff', '#ff00ff', '#00ffff', '#ffffff',
+]
+CUBE_LEVELS = [0, 95, 135, 175, 215, 255]
+
+
+def configure_tags(widget):
+    for tag, colour in TAG_COLOURS.items():
+        widget.tag_configure(tag, foreground=colour)
+
+
+def palette_colour(index):
+    if index < 16:
+        return BASIC_COLOURS[index]
+    if index < 232:
+        index -= 16
+        red, green, blue = CUBE_LEVELS[index // 36], CUBE_LEVELS[index // 6 % 6], CUBE_LEVELS[index % 6]
+        return f'#{red:02x}{green:02x}{blue:02x}'
+    grey = 8 + (index - 232) * 10
+    return f'#{grey:02x}{grey:02x}{grey:02x}'
+
+
+def module_runs(line):
+    # Runs for a line without escape sequences: the first token, if any, is the module tag
+    match = TOKEN.search(line)
+    return [(line, (MODULE_TAGS[match.group(2)],) if match and match.group(2) else ())]
+
+
+class AnsiRenderer:
+    # Turns lines containing ANSI SGR sequences into (text, tags) runs for a Tk Text
+    # widget. Colour, bold and underline state carries over from one line to the next,
+    # the way a terminal keeps it, so keep one renderer per session.
+    def __init__(self, widget=None):
+        self.widget = widget
+        self.configured = set()
+        self.bold_font = None
+        self.reset()
+
+    def reset(self):
+        self.fg = None
+        self.bg = None
+        self.bold = False
+        self.underline = False
+        self.tags = ()
+
+    def render(self, line):
+        if '\x1b' not in line and not self.tags:
+            return module_runs(line)
+
+        runs = []
+        pos = 0
+        module_tag = None
+        for match in TOKEN.finditer(line):
+            module = match.group(2)
+            if module is not None:
+                if module_tag is None:
+                    module_tag = MODULE_TAGS[module]
+                continue
+
+            start = match.start()
+            if start > pos:
+                runs.append((line[pos:start], self.tags))
+            pos = match.end()
+            if match.group(1) is not None:
+                self.apply(match.group(1))
+
+        if pos < len(line):
+            runs.append((line[pos:], self.tags))
+        if module_tag is not None:
+            # Module colour underneath; SGR tags are created later so Tk gives them priority
+            runs = [(text, (module_tag,) + tags) for text, tags in runs]
+        return runs or [('', self.tags)]
+
+    def apply(self, params):
+        codes = [int(code) if code else 0 for code in params.split(';')]
+        i = 0
+        while i < len(codes):
+            code = codes[i]
+            if code == 0:
+                self.fg = self.bg = None
+                self.bold = self.underline = False
+            elif code == 1:
+                self.bold = True
+            elif code == 22:
+                self.bold = False
+            elif code == 4:
+                self.underline = True
+            elif code == 24:
+                self.underline = False
+            elif 30 <= code <= 37:
+                self.fg = palette_colour(code - 30)
+            elif 90 <= code <= 97:
+                self.fg = palette_colour(code - 90 + 8)
+            elif code == 39:
+                self.fg = None
+            elif 40 <= code <= 47:
+                self.bg = palette_colour(code - 40)
+            elif 100 <= code <= 107:
+                self.bg = palette_colour(code - 100 + 8)
+            elif code == 49:
+                self.bg = None
+            elif code in (38, 48) and i + 1 < len(codes):
+                # 38;5;n / 48;5;n (256 colours) and 38;2;r;g;b / 48;2;r;g;b (true colour)
+                colour = None
+                if codes[i + 1] == 5 and i + 2 < len(codes):
+                    colour = palette_colour(min(codes[i + 2], 255))
+                    i += 2
+                elif codes[i + 1] == 2 and i + 4 < len(codes):
+                    red, green, blue = (min(value, 255) for value in codes[i + 2:i + 5])
+                    colour = f'#{red:02x}{green:02x}{blue:02x}'
+                    i += 4
+                if code == 38:
+                    self.fg = colour
+                else:
+                    self.bg = colour
+            i += 1
+        self.tags = self.state_tags()
+
+    def state_tags(self):
+        tags = []
+        if self.fg:
+            tags.append('fg' + self.fg)
+        if self.bg:
+            tags.append('bg' + self.bg)
+        if self.bold:
+            tags.append('bold')
+        if self.underline:
+            tags.append('underline')
+        for tag in tags:
+            if tag not in self.configured:
+                self.configure(tag)
+        return tuple(tags)
+
+    def configure(self, tag):
+        # Tags are created on first use; the renderer runs on the Tk thread
+        self.configured.add(tag)
+        if self.widget is None:
+            return
+        if tag.startswith('fg'):
+            self.widget.tag_configure(tag, foreground=tag[2:])
+        elif tag.startswith('bg'):
+            self.widget.tag_configure(tag, background=tag[2:])
+        elif tag == 'bold':
+            self.bold_font = tkfont.Font(font=self.widget.cget('font'))
+            self.bold_font.configure(weight='bold')
+            self.widget.tag_configure(tag, font=self.bold_font)
+        elif tag == 'underline':
+            self.widget.tag_configure(tag, underline=1)
+
+
+def colorize(line):
+    # Stateless variant for text that carries no terminal state, e.g. lines read back
+    # from a log file
+    if '\x1b' not in line:
+        return module_runs(line)
+    return AnsiRenderer().render(line)
+
+
+def insert_args(lines, colorize_line=colorize):
+    # Flattens many lines into the (text, tags, text, tags, ...) arguments of a single
+    # Text.insert call, merging neighbouring runs that share tags
+    args = []
+    text = []
+    current = ()
+    for line in lines:
+        for part, tags in colorize_line(line):
+            if tags != current:
+                if text:
+                    args.append(''.join(text))
+                    args.append(current)
+                    text = []
+                current = tags
+            text.append(part)
+        text.append('\n')  # Newline keeps the tags of the line's last run
+    if text:
+        args.append(''.join(text))
+        args.append(current)
+    return args
+
+
+def export_html(source_path, target_path):
+    # ansi2html is only needed here, so it is not imported at startup
+    import ansi2html
+
+    with open(source_path, 'r', encoding='utf-8', errors='replace') as source:
+        content = source.read()
+    converter = ansi2html.Ansi2HTMLConverter(dark_bg=True, title="AEPL Logger")
+    with open(target_path, 'w', encoding='utf-8') as target:
+        target.write(converter.convert(content, full=True))
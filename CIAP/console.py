@@ -0,0 +1,245 @@
+import collections
+import tkinter as tk
+
+import settings
+from capture_file import CaptureFile, record_text
+from colorizer import AnsiRenderer, insert_args
+
+
+def inserted_chars(args):
+    # Characters a Text.insert(index, *args) adds: the text arguments, after the ANSI
+    # escapes were rendered into tags, as the widget's own count sees them
+    return sum(map(len, args[::2]))
+
+
+class ConsoleFeed:
+    # Worker threads call put(); the Tk main loop drains the queue on a timer and
+    # inserts everything that arrived since the last frame with one insert and one scroll.
+    def __init__(self, root, widget, status_var=None):
+        self.root = root
+        self.widget = widget
+        self.status_var = status_var
+        self.renderer = AnsiRenderer(widget)  # Terminal colour state for this session
+        self.queue = collections.deque()
+        self.max_queue = settings.GUI_QUEUE_LINES
+        self.max_batch = settings.GUI_MAX_BATCH_LINES
+        self.interval_ms = max(1, int(1000 / max(1, settings.GUI_MAX_FPS)))
+
+        # Scrollback: only the newest lines live in the widget, the log file has the rest.
+        # line_offsets mirrors the widget lines with each line's byte offset in the log
+        # file (None for lines that were never written to it).
+        self.max_lines = settings.CONSOLE_SCROLLBACK_LINES
+        self.max_bytes = settings.CONSOLE_SCROLLBACK_BYTES
+        self.page_lines = settings.CONSOLE_PAGE_LINES
+        self.line_offsets = collections.deque()
+        self.console_bytes = 0  # Characters in the widget, counted as trim() counts them
+        self.trimmed = 0
+        self.history_path = None
+        self.paging = False
+        if hasattr(widget, 'vbar'):
+            widget.configure(yscrollcommand=self.on_scroll)
+
+        # Counters shown in the status bar
+        self.dropped = 0
+        self.coalesced = 0
+        self.frames = 0
+        self.after_id = None
+        self.status_sources = []  # Callables adding their own text to the status bar
+
+    def start(self):
+        if self.after_id is None:
+            self.after_id = self.root.after(self.interval_ms, self.drain)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def put(self, line, offset=None):
+        # Safe from any thread: deque appends/pops are atomic. When the GUI falls
+        # behind, the oldest console lines are dropped (the log file still gets them).
+        # offset is where the line starts in the log file, if it was written there.
+        if len(self.queue) >= self.max_queue:
+            # Drop the oldest line, never a history switch: markers ahead of it are put back
+            markers = []
+            try:
+                while True:
+                    item = self.queue.popleft()
+                    if item[0] is not None:
+                        self.dropped += 1
+                        break
+                    markers.append(item)
+            except IndexError:
+                pass
+            self.queue.extendleft(reversed(markers))
+        self.queue.append((line, offset))
+
+    def set_history(self, path):
+        # Log file that trimmed lines can be paged back in from. Queued like a line so
+        # it takes effect in order with the lines written before and after it.
+        self.queue.append((None, path))
+
+    def switch_history(self, path):
+        # Lines already shown belong to the previous file; they can't be paged from the new one
+        if path != self.history_path:
+            for index in range(len(self.line_offsets)):
+                self.line_offsets[index] = None
+        self.history_path = path
+
+    def clear(self):
+        self.widget.delete('1.0', tk.END)
+        self.line_offsets.clear()
+        self.console_bytes = 0
+
+    def depth(self):
+        return len(self.queue)
+
+    def drain(self):
+        self.after_id = None
+        lines = []
+        pop = self.queue.popleft
+        try:
+            for _ in range(min(len(self.queue), self.max_batch)):
+                lines.append(pop())
+        except IndexError:
+            pass
+
+        batch = []
+        for item in lines:
+            if item[0] is None:
+                if batch:
+                    self.insert_batch(batch)
+                    batch = []
+                self.switch_history(item[1])
+            else:
+                batch.append(item)
+        if batch:
+            self.insert_batch(batch)
+
+        inserted = len([item for item in lines if item[0] is not None])
+        if inserted:
+            self.frames += 1
+            self.coalesced += inserted - 1
+
+        if self.status_var is not None:
+            self.status_var.set(self.status_text())
+        self.after_id = self.root.after(self.interval_ms, self.drain)
+
+    def insert_batch(self, lines):
+        # Only follow the output if the user hasn't scrolled up to read something
+        at_bottom = self.widget.yview()[1] >= 0.999
+        args = insert_args([line for line, _ in lines], self.renderer.render)
+        self.widget.insert(tk.END, *args)
+        self.line_offsets.extend([offset for _, offset in lines])
+        self.console_bytes += inserted_chars(args)
+
+        # Trim while following the output; if the user is reading back, allow twice the
+        # limit before trimming under them
+        slack = 1 if at_bottom else 2
+        self.trim(slack)
+        if at_bottom:
+            self.widget.yview(tk.END)
+
+    def line_count(self):
+        return int(self.widget.index('end-1c').split('.')[0]) - 1
+
+    def trim(self, slack=1):
+        # Delete old lines in one bulk operation, with 10% hysteresis so we don't
+        # trim on every frame
+        count = self.line_count()
+        excess = 0
+        if self.max_lines and count > self.max_lines * slack + self.max_lines // 10:
+            excess = count - self.max_lines
+        if self.max_bytes and self.console_bytes > self.max_bytes * slack + self.max_bytes // 10:
+            average = max(1, self.console_bytes // max(1, count))
+            excess = max(excess, (self.console_bytes - self.max_bytes) // average + 1)
+        if excess <= 0:
+            return
+
+        end = f'{excess + 1}.0'
+        removed = self.widget.count('1.0', end, 'chars')
+        self.widget.delete('1.0', end)
+        self.console_bytes -= removed[0] if removed else 0
+        for _ in range(min(excess, len(self.line_offsets))):
+            self.line_offsets.popleft()
+        self.trimmed += excess
+
+    def on_scroll(self, first, last):
+        # yscrollcommand hook: reaching the top of a trimmed console pages history back in
+        self.widget.vbar.set(first, last)
+        if float(first) <= 0.0 and float(last) < 1.0 and not self.paging and self.history_offset():
+            self.paging = True
+            self.root.after_idle(self.page_back)
+
+    def history_offset(self):
+        # Byte offset in the log file where the oldest line in the widget starts
+        if not self.history_path:
+            return None
+        for offset in self.line_offsets:
+            if offset is not None:
+                return offset
+        return None
+
+    def page_back(self):
+        try:
+            end = self.history_offset()
+            if not end:
+                return
+            if self.history_path.endswith('.cap'):
+                offsets, texts = self.capture_before(end)
+            else:
+                offsets, texts = self.text_before(end)
+        except (OSError, ValueError) as e:
+            print(f"Error paging back log history: {e}")
+            return
+        finally:
+            self.paging = False
+        if not texts:
+            return
+
+        args = insert_args(texts)
+        self.widget.insert('1.0', *args)
+        self.line_offsets.extendleft(reversed(offsets))
+        self.console_bytes += inserted_chars(args)
+        # Keep the line the user was looking at in place
+        self.widget.yview(f'{len(texts) + 1}.0')
+
+    def text_before(self, end):
+        # (offsets, lines) of up to page_lines text log lines before offset end
+        with open(self.history_path, 'rb') as history:
+            start = max(0, end - self.page_lines * 200)
+            history.seek(start)
+            chunk = history.read(end - start)
+
+        raw_lines = chunk.split(b'\n')
+        raw_lines.pop()  # Empty tail: the chunk ends at the start of a line
+        if start > 0 and raw_lines:
+            raw_lines.pop(0)  # Partial first line
+        raw_lines = raw_lines[-self.page_lines:]
+
+        offsets = []
+        offset = end
+        for raw in reversed(raw_lines):
+            offset -= len(raw) + 1
+            offsets.append(offset)
+        offsets.reverse()
+        return offsets, [raw.decode('utf-8', 'replace').rstrip('\r') for raw in raw_lines]
+
+    def capture_before(self, end):
+        # Same for a binary capture, found through its index
+        capture = CaptureFile(self.history_path)
+        try:
+            records = capture.records_before(end, self.page_lines)
+        finally:
+            capture.close()
+        return ([record[0] for record in records],
+                [record_text(wall_ns, flags, payload) for _, wall_ns, _, flags, payload in records])
+
+    def status_text(self):
+        text = (f"Queue: {len(self.queue)}  Dropped: {self.dropped}  Coalesced: {self.coalesced}"
+                f"  Scrollback: {len(self.line_offsets)} lines, {self.trimmed} trimmed")
+        for source in self.status_sources:
+            extra = source()
+            if extra:
+                text += "  |  " + extra
+        return text
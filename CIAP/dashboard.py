@@ -0,0 +1,184 @@
+# Telemetry dashboard: trend plots of values from the parsed [PLA] status lines
+# (heap use, signal, CPU temperature, battery, speed), fed by the RecordBus.
+#
+# Each series is a fixed number of buckets. While there is room, every sample gets
+# its own bucket; once the buckets are full, neighbouring pairs are merged (keeping
+# min, max and last) and each bucket covers twice as many samples from then on. So a
+# multi-day session always fits in the same memory and the plot shows all of it, at
+# a resolution that drops as it grows. Records can arrive at any rate; the canvas is
+# redrawn at most DASHBOARD_FPS times a second, and only when something changed.
+import threading
+import time
+import tkinter as tk
+from array import array
+
+import settings
+from timestamps import clock
+
+# (title, record type, value from the record, unit)
+SERIES = [
+    ("Heap used", "heap", lambda record: record.used * 100.0 / record.total if record.total else 0.0, "%"),
+    ("Signal (CSQ)", "network", lambda record: record.csq, ""),
+    ("CPU temperature", "system", lambda record: record.cpu_temp, "°C"),
+    ("External battery", "analog", lambda record: record.ext_batt, "V"),
+    ("Speed", "gps", lambda record: record.speed, "km/h"),
+]
+
+PANEL_COLOURS = ("#00c000", "#00a0ff", "#ff8000", "#e0e000", "#ff40ff")
+
+
+class DecimatedSeries:
+    # Fixed-size min/max/last buckets over time; see the comment at the top
+    def __init__(self, capacity):
+        self.capacity = capacity - capacity % 2
+        self.times = array('q')   # monotonic_ns of each bucket's last sample
+        self.lows = array('d')
+        self.highs = array('d')
+        self.lasts = array('d')
+        self.span = 1             # Samples per full bucket
+        self.filled = 0           # Samples in the newest bucket
+        self.samples = 0
+
+    def add(self, stamp, value):
+        self.samples += 1
+        if self.times and self.filled < self.span:
+            self.times[-1] = stamp
+            self.lows[-1] = min(self.lows[-1], value)
+            self.highs[-1] = max(self.highs[-1], value)
+            self.lasts[-1] = value
+            self.filled += 1
+            return
+        if len(self.times) >= self.capacity:
+            self.decimate()
+        self.times.append(stamp)
+        self.lows.append(value)
+        self.highs.append(value)
+        self.lasts.append(value)
+        self.filled = 1
+
+    def decimate(self):
+        # Merge neighbouring pairs of buckets: half as many, each twice as long. Only
+        # called when the newest bucket is full, so the merged one is full too.
+        self.times = array('q', self.times[1::2])
+        self.lows = array('d', map(min, self.lows[0::2], self.lows[1::2]))
+        self.highs = array('d', map(max, self.highs[0::2], self.highs[1::2]))
+        self.lasts = array('d', self.lasts[1::2])
+        self.span *= 2
+        self.filled = self.span
+
+    def snapshot(self):
+        return list(self.times), list(self.lows), list(self.highs)
+
+
+class Dashboard:
+    # Toplevel with one plot per SERIES entry for records from one session
+    def __init__(self, root, records, source="Main", title="Dashboard"):
+        self.root = root
+        self.records = records
+        self.source = source
+        self.series = {kind: [] for _, kind, _, _ in SERIES}
+        self.panels = []
+        for i, (name, kind, value, unit) in enumerate(SERIES):
+            series = DecimatedSeries(settings.DASHBOARD_POINTS)
+            self.series[kind].append((series, value))
+            self.panels.append((name, unit, PANEL_COLOURS[i % len(PANEL_COLOURS)], series))
+        self.lock = threading.Lock()
+        self.changed = True
+        self.interval_ms = max(1, int(1000 / max(1, settings.DASHBOARD_FPS)))
+        self.after_id = None
+        self.items = []
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"{title} - {source}")
+        self.window.geometry("800x600")
+        self.canvas = tk.Canvas(self.window, bg="black", highlightthickness=0)
+        self.canvas.pack(expand=True, fill=tk.BOTH)
+        self.canvas.bind("<Configure>", lambda e: self.layout())
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.records.subscribe(self.handle_record)
+        self.after_id = self.window.after(self.interval_ms, self.redraw)
+
+    def handle_record(self, source, record, stamp):
+        # Called on the reader threads
+        if source != self.source:
+            return
+        targets = self.series.get(record.kind)
+        if not targets:
+            return
+        stamp = stamp or time.monotonic_ns()
+        with self.lock:
+            for series, value in targets:
+                series.add(stamp, float(value(record)))
+            self.changed = True
+
+    def layout(self):
+        # Canvas items are made once per size and only moved by redraw()
+        self.canvas.delete("all")
+        self.items = []
+        width = max(1, self.canvas.winfo_width())
+        height = max(1, self.canvas.winfo_height())
+        panel_height = height / len(self.panels)
+        for i, (name, unit, colour, _) in enumerate(self.panels):
+            top = i * panel_height
+            box = (50, top + 18, width - 10, top + panel_height - 14)
+            self.canvas.create_rectangle(*box, outline="#404040")
+            items = {
+                'box': box,
+                'title': self.canvas.create_text(4, top + 2, anchor="nw", fill="white", font=("Consolas", 9), text=name),
+                'high': self.canvas.create_text(46, box[1], anchor="ne", fill="grey", font=("Consolas", 8)),
+                'low': self.canvas.create_text(46, box[3], anchor="se", fill="grey", font=("Consolas", 8)),
+                'start': self.canvas.create_text(box[0], box[3] + 1, anchor="nw", fill="grey", font=("Consolas", 8)),
+                'end': self.canvas.create_text(box[2], box[3] + 1, anchor="ne", fill="grey", font=("Consolas", 8)),
+                'band': self.canvas.create_polygon(0, 0, 0, 0, fill=colour, outline="", stipple="gray25"),
+                'line': self.canvas.create_line(0, 0, 0, 0, fill=colour),
+            }
+            self.items.append(items)
+        self.changed = True
+
+    def redraw(self):
+        self.after_id = None
+        if self.changed and self.items:
+            with self.lock:
+                self.changed = False
+                snapshots = [(series.snapshot(), series.lasts[-1] if series.lasts else None, series.span)
+                             for _, _, _, series in self.panels]
+            for (name, unit, _, _), items, ((times, lows, highs), last, span) in zip(self.panels, self.items, snapshots):
+                self.draw_panel(name, unit, items, times, lows, highs, last, span)
+        self.after_id = self.window.after(self.interval_ms, self.redraw)
+
+    def draw_panel(self, name, unit, items, times, lows, highs, last, span):
+        canvas = self.canvas
+        if not times:
+            return
+        left, top, right, bottom = items['box']
+        low, high = min(lows), max(highs)
+        if high - low < 1e-9:
+            low, high = low - 1, high + 1
+        first_time, last_time = times[0], times[-1]
+        x_scale = (right - left) / max(1, last_time - first_time)
+        y_scale = (bottom - top) / (high - low)
+        xs = [left + (stamp - first_time) * x_scale for stamp in times]
+        upper = [bottom - (value - low) * y_scale for value in highs]
+        lower = [bottom - (value - low) * y_scale for value in lows]
+
+        # The line follows the bucket maxima, the band fills down to the minima
+        if len(xs) == 1:
+            xs.append(xs[0] + 1)
+            upper.append(upper[0])
+            lower.append(lower[0])
+        canvas.coords(items['line'], *[value for point in zip(xs, upper) for value in point])
+        canvas.coords(items['band'], *[value for point in zip(xs, upper) for value in point],
+                      *[value for point in zip(reversed(xs), reversed(lower)) for value in point])
+        canvas.itemconfigure(items['title'], text=f"{name}: {last:.2f} {unit}" +
+                             (f"   ({span} samples/point)" if span > 1 else ""))
+        canvas.itemconfigure(items['high'], text=f"{high:.4g}")
+        canvas.itemconfigure(items['low'], text=f"{low:.4g}")
+        canvas.itemconfigure(items['start'], text=clock.format(first_time)[11:19])
+        canvas.itemconfigure(items['end'], text=clock.format(last_time)[11:19])
+
+    def close(self):
+        self.records.unsubscribe(self.handle_record)
+        if self.after_id is not None:
+            self.window.after_cancel(self.after_id)
+        self.window.destroy()
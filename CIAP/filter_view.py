@@ -0,0 +1,196 @@
+# Filter panes: live views of the main session that only show some firmware modules,
+# levels, or lines matching a regex.
+#
+# Every console line is also appended to a LineStore, a ring of the last
+# FILTER_HISTORY_LINES lines, with its ANSI codes stripped (the same str the log file
+# gets, so nothing is copied) so they can't hide the level or module from the
+# classifier or a regex. It also keeps a list of line numbers per (module, level).
+# A pane picks up new lines by number on a timer. Changing its filter merges the lists it
+# selects and renders the newest FILTER_PANE_LINES of them; only a regex looks at the
+# line text, and only for lines the lists selected.
+import collections
+import heapq
+import re
+import threading
+import tkinter as tk
+from tkinter import scrolledtext
+
+import settings
+from colorizer import MODULE_TAGS, configure_tags, insert_args
+
+MODULES = tuple(MODULE_TAGS) + ("Other",)
+LEVELS = ("DEBUG", "INFO", "WARN", "ERROR", "Other")
+# "DEBUG: [CAN] ..." (the level is optional); lines without a module tag fall back to LEVEL
+LINE_CLASS = re.compile(r'(?:\b(DEBUG|INFO|WARN|ERROR)\w*:\s*)?\[(AIS|CVP|CAN|NET|PLA|FOT)\]')
+LEVEL = re.compile(r'\b(DEBUG|INFO|WARN|ERROR)\w*:')
+
+
+def classify(line):
+    # (module, level) of a line
+    match = LINE_CLASS.search(line)
+    if match:
+        return match.group(2), match.group(1) or "Other"
+    match = LEVEL.search(line)
+    return "Other", match.group(1) if match else "Other"
+
+
+class LineStore:
+    # append() is called from the reader thread with lines free of ANSI codes,
+    # everything else from the Tk thread.
+    # Line n lives in slot n % capacity until it is overwritten; readers check a line
+    # is still there after taking it instead of holding the lock while they work.
+    def __init__(self, capacity=None):
+        self.capacity = capacity or settings.FILTER_HISTORY_LINES
+        self.lines = [None] * self.capacity
+        self.keys = [None] * self.capacity  # (module, level) of each slot
+        self.count = 0  # Lines appended so far
+        self.index = {}  # (module, level) -> deque of line numbers, oldest first
+        self.lock = threading.Lock()
+
+    def append(self, line):
+        key = classify(line)
+        with self.lock:
+            number = self.count
+            slot = number % self.capacity
+            old_key = self.keys[slot]
+            if old_key is not None:
+                self.index[old_key].popleft()  # The line being overwritten is its key's oldest
+            self.lines[slot] = line
+            self.keys[slot] = key
+            numbers = self.index.get(key)
+            if numbers is None:
+                numbers = self.index[key] = collections.deque()
+            numbers.append(number)
+            self.count = number + 1
+
+    def oldest(self):
+        return max(0, self.count - self.capacity)
+
+    def since(self, number):
+        # (next number, [(key, line)]) for the lines appended from number on
+        count = self.count
+        first = max(number, count - self.capacity)
+        lines = self.lines
+        keys = self.keys
+        found = []
+        for n in range(first, count):
+            slot = n % self.capacity
+            found.append((keys[slot], lines[slot]))
+        if self.oldest() > first:
+            # Overwritten while we read: drop what may belong to newer lines
+            found = found[self.oldest() - first:]
+        return count, found
+
+    def select(self, keys, limit, pattern=None):
+        # The newest limit lines whose key is in keys (and that match pattern), oldest
+        # first, and the number to continue from
+        with self.lock:
+            runs = [list(self.index[key]) for key in keys if key in self.index]
+            count = self.count
+        lines = self.lines
+        found = []
+        for number in heapq.merge(*[reversed(run) for run in runs], reverse=True):
+            line = lines[number % self.capacity]
+            if number < self.oldest():
+                break  # Overwritten since the snapshot, and so is everything older
+            if pattern is None or pattern.search(line):
+                found.append(line)
+                if len(found) >= limit:
+                    break
+        found.reverse()
+        return count, found
+
+
+class FilterPane:
+    # Toplevel following a LineStore through a filter
+    def __init__(self, root, store, title="Filter"):
+        self.root = root
+        self.store = store
+        self.keys = set()
+        self.pattern = None
+        self.next_number = store.count
+        self.shown = 0
+        self.max_lines = settings.FILTER_PANE_LINES
+        self.interval_ms = max(1, int(1000 / max(1, settings.GUI_MAX_FPS)))
+        self.after_id = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title(title)
+        self.window.geometry("900x500")
+        self.status_var = tk.StringVar()
+        tk.Label(self.window, textvariable=self.status_var, anchor="w", font=("Consolas", 9)).pack(side=tk.BOTTOM, fill=tk.X)
+
+        # Filter bar: modules, levels and an optional regex
+        self.module_vars = {}
+        self.level_vars = {}
+        module_bar = tk.Frame(self.window)
+        module_bar.pack(side=tk.TOP, fill=tk.X)
+        tk.Label(module_bar, text="Modules:").pack(side=tk.LEFT, padx=2)
+        for module in MODULES:
+            var = self.module_vars[module] = tk.BooleanVar(value=True)
+            tk.Checkbutton(module_bar, text=module, variable=var, command=self.apply).pack(side=tk.LEFT)
+        tk.Label(module_bar, text="Levels:").pack(side=tk.LEFT, padx=(10, 2))
+        for level in LEVELS:
+            var = self.level_vars[level] = tk.BooleanVar(value=True)
+            tk.Checkbutton(module_bar, text=level, variable=var, command=self.apply).pack(side=tk.LEFT)
+
+        regex_bar = tk.Frame(self.window)
+        regex_bar.pack(side=tk.TOP, fill=tk.X)
+        tk.Label(regex_bar, text="Regex:").pack(side=tk.LEFT, padx=2)
+        self.regex_var = tk.StringVar()
+        regex_entry = tk.Entry(regex_bar, textvariable=self.regex_var)
+        regex_entry.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        regex_entry.bind("<Return>", lambda e: self.apply())
+        self.case_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(regex_bar, text="Match case", variable=self.case_var, command=self.apply).pack(side=tk.LEFT)
+        tk.Button(regex_bar, text="Apply", command=self.apply).pack(side=tk.LEFT, padx=2)
+
+        self.text = scrolledtext.ScrolledText(self.window, wrap=tk.NONE, bg="black", fg="white", font=("Consolas", 10))
+        self.text.pack(expand=True, fill=tk.BOTH)
+        configure_tags(self.text)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.apply()
+        self.after_id = self.window.after(self.interval_ms, self.poll)
+
+    def apply(self):
+        # Re-render the pane from the store's index for the current filter
+        text = self.regex_var.get()
+        try:
+            self.pattern = re.compile(text, 0 if self.case_var.get() else re.IGNORECASE) if text else None
+        except re.error as e:
+            self.status_var.set(f"Bad regex: {e}")
+            return
+        self.keys = {(module, level) for module, module_var in self.module_vars.items() if module_var.get()
+                     for level, level_var in self.level_vars.items() if level_var.get()}
+        self.next_number, lines = self.store.select(self.keys, self.max_lines, self.pattern)
+        self.text.delete('1.0', tk.END)
+        self.shown = 0
+        self.insert(lines, follow=True)
+
+    def poll(self):
+        self.after_id = None
+        self.next_number, new = self.store.since(self.next_number)
+        keys = self.keys
+        pattern = self.pattern
+        lines = [line for key, line in new if key in keys and (pattern is None or pattern.search(line))]
+        if lines:
+            self.insert(lines, follow=self.text.yview()[1] >= 0.999)
+        self.after_id = self.window.after(self.interval_ms, self.poll)
+
+    def insert(self, lines, follow):
+        if lines:
+            self.text.insert(tk.END, *insert_args(lines))
+            self.shown += len(lines)
+        excess = self.shown - self.max_lines
+        if excess > self.max_lines // 10:
+            self.text.delete('1.0', f'{excess + 1}.0')
+            self.shown -= excess
+        if follow:
+            self.text.yview(tk.END)
+        self.status_var.set(f"{self.shown} lines shown  |  {self.store.count - self.store.oldest()} lines in history")
+
+    def close(self):
+        if self.after_id is not None:
+            self.window.after_cancel(self.after_id)
+        self.window.destroy()
@@ -0,0 +1,168 @@
+# Turns the firmware's periodic status lines into typed records, e.g.
+#
+#   INFO:  [PLA] DIAG    HEAP (5551640/12582912)  ->  heap(used=5551640, total=12582912)
+#
+# Every line type is one row of LINE_TYPES: the module tag, the first word after it,
+# a pattern for the rest of the line and the field names. The patterns are compiled
+# once at import and filed under (module, word), so a line costs one search for its
+# tag, a dict lookup and a single anchored match; lines of unknown types stop after
+# the lookup. Records are namedtuples, one class per type, with the type name in
+# record.kind.
+import re
+from collections import namedtuple
+
+# Placeholders for the line patterns: (regex, converter, type of the converted value)
+FIELD_PATTERNS = {
+    'f': (r'([-+]?[\d.]+)', float, float),  # float() rejects anything odd like "1.2.3"
+    'i': (r'([-+]?\d+)', int, int),
+    'x': (r'(0[xX][0-9a-fA-F]+)', lambda text: int(text, 16), int),
+    'w': (r'([^,\s]+)', str, str),
+    'd': (r'([\d/:]+)', str, str),
+    's': (r'(.*?)', str, str),
+}
+
+# (type, module, first word, rest of the line, fields). The rest is matched from just
+# after the first word.
+LINE_TYPES = [
+    ("accel", "PLA", "ACCEL",
+     r'\s+DDT \(X Y\): {f} {f} AXIS \(X Y Z\): {f} {f} {f} GRAD: {f} ROLL: {f} TILT: {f}',
+     "ddt_x ddt_y x y z grad roll tilt"),
+    ("gps", "PLA", "GPS",
+     r'\s+RX {i},DT {d},TM {d},LAT {f},LAT DIR {w},LONG {f},LONG DIR {w},FIX QUA {i},SAT {i},'
+     r'ALT {f},PDOP {f},HDOP {f},VDOP {f},SPEED_KMPH {f},HEADING DEG {f}',
+     "rx date time lat lat_dir lon lon_dir fix sats alt pdop hdop vdop speed heading"),
+    ("heap", "PLA", "DIAG", r'\s+HEAP \({i}/{i}\)',
+     "used total"),
+    ("system", "PLA", "SYSTEM",
+     r'\s+RTC {d}, {d}, UTC EPOCH {i}, UPTIME SEC {i}, CPU {f} DEG CEL, CLK {i}',
+     "date time epoch uptime cpu_temp clock"),
+    ("analog", "PLA", "ANALOG",
+     r'\s+INT BATT {f}V {f} PERCENT, TMPR {i}, EXT BATT {f}V, AN {f}V, {f}V',
+     "int_batt int_batt_percent tamper ext_batt an1 an2"),
+    ("digital", "PLA", "DIGITAL", r'\s+IGN {i}, DI {w}, DO {w}, EMR {i}, WC {i}',
+     "ign di do emr wc"),
+    ("network", "PLA", "NET",
+     r'\s+CSQ {i}, CREG: {i}, CGREG: {i}, TCP SKT: {w}, MQTT: {i}, OPR NM:\s*{s}\s*$',
+     "csq creg cgreg tcp_socket mqtt operator"),
+    ("pvt", "CVP", "PVT", r' SAMPLE:{i}, OCC_TM:{i}, NANO:{i}',
+     "sample occurred nano"),
+    ("fuel", "CVP", "NONAFT", r', FUEL 1: {f}, FUEL 2: {f}, P_CAP:{i}, S_CAP:{i}',
+     "fuel1 fuel2 primary_capacity secondary_capacity"),
+    ("tank", "CVP", "TANK", r' {i}: Fuel:{f} L, HT:{f} mm, Adc:{f} V, Type:{i}, Capacity:{i}',
+     "tank fuel height adc type capacity"),
+    ("no_can", "CVP", "NO", r' CAN DT, PARAM: {i}',
+     "param"),
+    ("vehicle_mode", "AIS", "VEHICLE", r' MODE : {w}, SPEED : {f} HTTP_SKT:{i}',
+     "mode speed http_socket"),
+    ("dtc", "CAN", "TTL",
+     r':{i}, INCR CURR OCC:{i}, FaultVal:{i}, DTC_Code:{x}, IGN_status:{i}, DTC Status:{i}',
+     "ttl occurrences fault code ign status"),
+    ("mqtt_state", "NET", "MQTT", r' PREV:{i},CURR:{i}, CONN_STAT:{i}',
+     "previous current connected"),
+    # Modem traffic, one record per exchange when reader.BlockSplitter joined the dump;
+    # data has the payload's CR, LF and backslashes escaped
+    ("gsm_rx", "NET", "GSM_Rx", r'\({i}\): \|{s}\|\s*$', "length data"),
+    ("gsm_tx", "NET", "GSM_TX", r'\({i}\): \|{s}\|\s*$', "length data"),
+    ("aurc_rx", "NET", "AURC_RX", r'\({i}\): \|{s}\|\s*$', "length data"),
+]
+
+# "[PLA] ACCEL": the module tag and the first word after it
+LINE_TAG = re.compile(r'\[([A-Z]{3})\]\s+(\w+)')
+
+RECORD_TYPES = {}  # type -> record class
+PARSERS = {}  # (module, first word) -> [(compiled pattern, converters, record class)]
+
+
+def compile_line_type(kind, module, word, pattern, fields):
+    converters = []
+    types = []
+
+    def placeholder(match):
+        regex, convert, value_type = FIELD_PATTERNS[match.group(1)]
+        converters.append(convert)
+        types.append(value_type)
+        return regex
+
+    regex = re.sub(r'\{(\w)\}', placeholder, pattern)
+    names = fields.split()
+    if len(names) != len(converters):
+        raise ValueError(f"{kind}: {len(converters)} values but {len(names)} field names")
+    record_class = namedtuple(kind, names)
+    record_class.kind = kind
+    record_class.module = module
+    record_class.types = tuple(types)  # Python type of each field, for exports
+    RECORD_TYPES[kind] = record_class
+    PARSERS.setdefault((module, word), []).append((re.compile(regex), tuple(converters), record_class))
+
+
+def build_record(record_class, converters, groups):
+    # Raises ValueError for a value that doesn't convert
+    return record_class._make([convert(value) for convert, value in zip(converters, groups)])
+
+
+for line_type in LINE_TYPES:
+    compile_line_type(*line_type)
+
+
+def parse_line(line):
+    # Record for a known line type, or None. line may still carry the log's timestamp
+    # and level prefix; only the first [MOD] tag in it is looked at.
+    if '[' not in line:
+        return None
+    tag = LINE_TAG.search(line)
+    if tag is None:
+        return None
+    parsers = PARSERS.get(tag.groups())
+    if parsers is None:
+        return None
+    end = tag.end()
+    for pattern, converters, record_class in parsers:
+        match = pattern.match(line, end)
+        if match is not None:
+            try:
+                return build_record(record_class, converters, match.groups())
+            except ValueError:
+                return None
+    return None
+
+
+class RecordBus:
+    # Hands the lines read by the reader threads, and the records parsed from them, to
+    # whoever subscribed: line listeners get listener(source, line, stamp) for every
+    # line, record listeners listener(source, record, stamp) for lines of a known
+    # type. source is the tab name ("Main" or the capture port). Lines are only parsed
+    # while a record listener is subscribed, and a failing listener doesn't stop the
+    # others or the reader.
+    def __init__(self):
+        self.listeners = ()
+        self.line_listeners = ()
+
+    def subscribe(self, listener):
+        self.listeners = self.listeners + (listener,)
+
+    def unsubscribe(self, listener):
+        self.listeners = tuple(other for other in self.listeners if other != listener)
+
+    def subscribe_lines(self, listener):
+        self.line_listeners = self.line_listeners + (listener,)
+
+    def unsubscribe_lines(self, listener):
+        self.line_listeners = tuple(other for other in self.line_listeners if other != listener)
+
+    def publish(self, source, line, stamp):
+        for listener in self.line_listeners:
+            try:
+                listener(source, line, stamp)
+            except Exception as e:
+                print(f"Error handling line: {e}")
+        listeners = self.listeners
+        if not listeners:
+            return None
+        record = parse_line(line)
+        if record is not None:
+            for listener in listeners:
+                try:
+                    listener(source, record, stamp)
+                except Exception as e:
+                    print(f"Error handling {record.kind} record: {e}")
+        return record
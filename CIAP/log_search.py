@@ -0,0 +1,326 @@
+# Search over text logs.
+#
+# Word searches use a token index: for every word (a run of letters, digits and _
+# that isn't just a number) the index lists the 64 KB blocks of the log it occurs in.
+# LogWriter builds it on its writer thread while the log is written and saves it next
+# to the log as <log>.tokens (a term table of block numbers, see TokenIndex.save) when
+# the log is closed, so a word search only scans the
+# few blocks that can match. Regex searches, and logs without an index, are scanned
+# in parallel chunks by a process pool, one chunk per core.
+import concurrent.futures
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import sys
+import threading
+from array import array
+
+import settings
+
+BLOCK_SIZE = 64 * 1024
+# Maps word characters to lowercase and everything else to a space, so splitting the
+# translated bytes gives the words (much quicker than a regex findall)
+WORD_TABLE = bytes(byte + 32 if 65 <= byte <= 90 else byte if (48 <= byte <= 57 or 97 <= byte <= 122 or byte == 95) else 32
+                   for byte in range(256))
+MAX_TOKEN = 64  # Longer words aren't indexed; neither are numbers
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024  # Smaller files are scanned in-process
+SCAN_CHUNK = 4 * 1024 * 1024
+
+# <log>.tokens: magic and term count, then per term its length, block count, the term
+# and the block numbers (uint32, little endian). Plain data only: indexes that come
+# with someone else's logs are read, never executed.
+TOKENS_MAGIC = b'CIAPTOK1'
+TOKENS_HEADER = struct.Struct('<8sI')
+TOKENS_TERM = struct.Struct('<BI')
+
+search_pool = None
+search_lock = threading.Lock()
+live_indexes = {}  # Log path -> TokenIndex of logs still being written
+
+
+class TokenIndex:
+    def __init__(self):
+        self.blocks = {}  # token -> array of block numbers, ascending
+        self.lock = threading.Lock()
+
+    def add(self, data, offset):
+        # data is whole lines starting at byte offset in the log. Lines are counted
+        # in the block they start in.
+        data = bytes(data)
+        pos = 0
+        while pos < len(data):
+            block = (offset + pos) // BLOCK_SIZE
+            boundary = (block + 1) * BLOCK_SIZE - offset
+            cut = data.find(b'\n', max(pos, boundary - 1))
+            cut = len(data) if cut < 0 else cut + 1
+            tokens = set(data[pos:cut].translate(WORD_TABLE).split())
+            with self.lock:
+                for token in tokens:
+                    if len(token) > MAX_TOKEN or token.isdigit():
+                        continue
+                    blocks = self.blocks.get(token)
+                    if blocks is None:
+                        self.blocks[token] = array('I', (block,))
+                    elif blocks[-1] != block:
+                        blocks.append(block)
+            pos = cut
+
+    def candidates(self, tokens):
+        # Blocks containing every token, or None if a token can't be looked up
+        result = None
+        with self.lock:
+            for token in tokens:
+                blocks = self.blocks.get(token)
+                if blocks is None:
+                    return []
+                result = set(blocks) if result is None else result.intersection(blocks)
+        return sorted(result) if result is not None else None
+
+    def save(self, path):
+        with self.lock:
+            terms = [(token, array('I', blocks)) for token, blocks in self.blocks.items()]
+        with open(path + '.tmp', 'wb') as index_file:
+            index_file.write(TOKENS_HEADER.pack(TOKENS_MAGIC, len(terms)))
+            for token, blocks in terms:
+                if sys.byteorder == 'big':
+                    blocks.byteswap()
+                index_file.write(TOKENS_TERM.pack(len(token), len(blocks)) + token + blocks.tobytes())
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        # Raises ValueError for anything that isn't a complete index file
+        index = cls()
+        with open(path, 'rb') as index_file:
+            data = index_file.read()
+        if len(data) < TOKENS_HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, count = TOKENS_HEADER.unpack_from(data)
+        if magic != TOKENS_MAGIC:
+            raise ValueError(f"{path} is not a search index")
+        pos = TOKENS_HEADER.size
+        for _ in range(count):
+            if pos + TOKENS_TERM.size > len(data):
+                raise ValueError(f"{path} is truncated")
+            length, block_count = TOKENS_TERM.unpack_from(data, pos)
+            pos += TOKENS_TERM.size
+            end = pos + length + block_count * 4
+            if end > len(data):
+                raise ValueError(f"{path} is truncated")
+            blocks = array('I')
+            blocks.frombytes(data[pos + length:end])
+            if sys.byteorder == 'big':
+                blocks.byteswap()
+            index.blocks[data[pos:pos + length]] = blocks
+            pos = end
+        return index
+
+
+def find_index(log_path):
+    index = live_indexes.get(os.path.abspath(log_path))
+    if index is not None:
+        return index
+    index_path = log_path + '.tokens'
+    try:
+        if os.path.getmtime(index_path) >= os.path.getmtime(log_path):
+            return TokenIndex.load(index_path)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def compile_query(query, regex=False, ignore_case=True):
+    # Word queries match whole words, the same way the index splits them. Only ends of
+    # the query that are word characters need a boundary: "[NET]" or "+QISTATE:" start
+    # or end in punctuation, and \b there would demand a word character next to it.
+    if regex:
+        pattern = query
+    else:
+        pattern = re.escape(query)
+        if re.match(r'\w', query[:1], re.ASCII):
+            pattern = r'(?<!\w)' + pattern
+        if re.match(r'\w', query[-1:], re.ASCII):
+            pattern += r'(?!\w)'
+    return pattern.encode('utf-8'), re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+
+
+def scan(path, ranges, pattern, flags, max_hits, literal=None):
+    # Runs in a worker process (or in-process for small files). Returns (offset, line)
+    # for each line matching in the byte ranges, one hit per line. A lowercase literal
+    # that every match contains lets bytes.find skip ahead, which is far quicker than
+    # a case-insensitive regex over the whole range.
+    expression = re.compile(pattern, flags)
+    hits = []
+    with open(path, 'rb') as log:
+        size = os.fstat(log.fileno()).st_size
+        if not size:
+            return hits
+        data = mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start, end in ranges:
+                end = min(end, size)
+                if literal:
+                    scan_literal(data, start, end, expression, literal, hits, max_hits)
+                else:
+                    scan_regex(data, start, end, expression, hits, max_hits)
+                if len(hits) >= max_hits:
+                    break
+        finally:
+            data.close()
+    return hits[:max_hits]
+
+
+def scan_regex(data, start, end, expression, hits, max_hits):
+    pos = start
+    while pos < end and len(hits) < max_hits:
+        match = expression.search(data, pos, end)
+        if match is None:
+            break
+        line_start = data.rfind(b'\n', start, match.start()) + 1 or start
+        line_end = data.find(b'\n', match.end(), end)
+        if line_end < 0:
+            line_end = end
+        hits.append((line_start, data[line_start:line_end].rstrip(b'\r').decode('utf-8', 'replace')))
+        pos = line_end + 1
+
+
+def scan_literal(data, start, end, expression, literal, hits, max_hits):
+    # Lowercases SCAN_CHUNK bytes at a time (cut at a line end) and finds the literal
+    while start < end and len(hits) < max_hits:
+        stop = min(start + SCAN_CHUNK, end)
+        if stop < end:
+            newline = data.find(b'\n', stop, end)
+            stop = end if newline < 0 else newline + 1
+        chunk = data[start:stop]
+        lowered = chunk.lower()
+        pos = lowered.find(literal)
+        while pos >= 0 and len(hits) < max_hits:
+            line_start = chunk.rfind(b'\n', 0, pos) + 1
+            line_end = chunk.find(b'\n', pos)
+            if line_end < 0:
+                line_end = len(chunk)
+            line = chunk[line_start:line_end]
+            if expression.search(line):
+                hits.append((start + line_start, line.rstrip(b'\r').decode('utf-8', 'replace')))
+            pos = lowered.find(literal, line_end + 1)
+        start = stop
+
+
+def line_ranges(path, size, pieces):
+    # Splits a file into byte ranges that start and end on line boundaries
+    ranges = []
+    with open(path, 'rb') as log:
+        start = 0
+        for i in range(1, pieces + 1):
+            end = size if i == pieces else size * i // pieces
+            if end < size:
+                log.seek(end)
+                end += len(log.readline())
+            if end > start:
+                ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def block_ranges(path, size, blocks):
+    # Byte ranges covering the lines that start in the blocks; runs of neighbouring
+    # blocks become one range
+    runs = []
+    for block in blocks:
+        if runs and runs[-1][1] == block:
+            runs[-1][1] = block + 1
+        else:
+            runs.append([block, block + 1])
+
+    ranges = []
+    with open(path, 'rb') as log:
+        for first, last in runs:
+            start = first * BLOCK_SIZE
+            if start >= size:
+                break
+            if start:
+                log.seek(start - 1)
+                start += len(log.readline()) - 1
+            end = min(last * BLOCK_SIZE, size)
+            log.seek(end - 1)
+            end = min(end - 1 + len(log.readline()), size)
+            if ranges and ranges[-1][1] >= start:
+                ranges[-1] = (ranges[-1][0], max(end, ranges[-1][1]))
+            elif end > start:
+                ranges.append((start, end))
+    return ranges
+
+
+def get_pool():
+    global search_pool
+    with search_lock:
+        if search_pool is None:
+            workers = settings.SEARCH_WORKERS or os.cpu_count() or 1
+            # spawn, not fork: the GUI process has Tk and several threads running
+            search_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return search_pool
+
+
+def search_file(path, query, regex=False, ignore_case=True, max_hits=None):
+    # Returns a sorted list of (offset, line) for lines matching query
+    max_hits = max_hits or settings.SEARCH_MAX_HITS
+    pattern, flags = compile_query(query, regex, ignore_case)
+    size = os.path.getsize(path)
+    if not size:
+        return []
+
+    workers = settings.SEARCH_WORKERS or os.cpu_count() or 1
+    literal = None
+    ranges = None
+    if not regex:
+        literal = query.encode('utf-8').lower()
+        tokens = [token for token in literal.translate(WORD_TABLE).split()
+                  if len(token) <= MAX_TOKEN and not token.isdigit()]
+        index = find_index(path) if tokens else None
+        if index is not None:
+            blocks = index.candidates(tokens)
+            if blocks is not None:
+                ranges = block_ranges(path, size, blocks)
+                if not ranges:
+                    return []
+    if ranges is None:
+        ranges = line_ranges(path, size, workers if size >= PARALLEL_MIN_BYTES else 1)
+
+    total = sum(end - start for start, end in ranges)
+    if workers == 1 or total < PARALLEL_MIN_BYTES:
+        return scan(path, ranges, pattern, flags, max_hits, literal)
+
+    # Hand each worker a contiguous share of the ranges; results come back in file order
+    groups = [[]]
+    share = total / workers
+    used = 0
+    for start, end in ranges:
+        if used >= share and len(groups) < workers:
+            groups.append([])
+            used = 0
+        groups[-1].append((start, end))
+        used += end - start
+    futures = [get_pool().submit(scan, path, group, pattern, flags, max_hits, literal) for group in groups]
+    hits = []
+    for future in futures:
+        hits.extend(future.result())
+    return hits[:max_hits]
+
+
+def search_files(paths, query, regex=False, ignore_case=True, max_hits=None):
+    # (path, offset, line) across several logs, in the order given
+    max_hits = max_hits or settings.SEARCH_MAX_HITS
+    results = []
+    for path in paths:
+        try:
+            hits = search_file(path, query, regex, ignore_case, max_hits - len(results))
+        except OSError as e:
+            print(f"Error searching {path}: {e}")
+            continue
+        results.extend((path, offset, line) for offset, line in hits)
+        if len(results) >= max_hits:
+            break
+    return results
@@ -0,0 +1,426 @@
+# Log viewer for files of any size. The file is memory-mapped and never read as a
+# whole: a background thread counts newlines per 64 KB block (bytes.count, C speed),
+# and only the lines in the visible viewport are pulled out of the map and inserted
+# into the Text widget. Opening is immediate and jumping anywhere costs one block scan.
+import bisect
+import glob
+import mmap
+import os
+import threading
+import tkinter as tk
+import tkinter.font as tkfont
+from array import array
+from tkinter import simpledialog
+
+from colorizer import configure_tags, insert_args
+from log_search import search_file, search_files
+
+BLOCK_SIZE = 64 * 1024
+
+
+class LineIndex:
+    # block_lines[k] is the number of newlines before block k, so the block holding the
+    # start of any line is a bisect away and at most one block is scanned to find it
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = None
+        self.size = 0
+        self.indexed = 0          # Bytes counted so far
+        self.newlines = 0
+        self.block_lines = array('Q')
+        self.lock = threading.Lock()
+        self.running = True
+        self.done = False         # First pass over the file finished
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        # Index the file, then keep following it while it grows (a log being written)
+        while self.running:
+            try:
+                self.refresh()
+            except (OSError, ValueError) as e:
+                print(f"Error indexing {self.path}: {e}")
+                break
+            self.done = True
+            self.stopped.wait(1.0)
+        self.done = True
+
+    def refresh(self):
+        # Maps whatever the file has grown to and counts the new blocks
+        size = os.fstat(self.file.fileno()).st_size
+        if size <= self.size:
+            return
+        new_map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        with self.lock:
+            # The old map is left to be freed once the GUI thread is done with it
+            self.map = new_map
+            self.size = size
+            # The last block may have been partial; count it again
+            if self.block_lines and self.indexed % BLOCK_SIZE:
+                self.indexed -= self.indexed % BLOCK_SIZE
+                self.newlines = self.block_lines.pop()
+
+        position = self.indexed
+        while position < size and self.running:
+            end = min(position + BLOCK_SIZE, size)
+            count = new_map[position:end].count(b'\n')
+            with self.lock:
+                self.block_lines.append(self.newlines)
+                self.newlines += count
+                self.indexed = end
+            position = end
+
+    def line_count(self):
+        # A last line without a newline still counts
+        with self.lock:
+            if self.indexed and self.map[self.indexed - 1:self.indexed] != b'\n':
+                return self.newlines + 1
+            return self.newlines
+
+    def line_offset(self, number):
+        # Byte offset of line number (0-based), or None if it isn't indexed yet
+        if number == 0:
+            return 0 if self.size else None
+        with self.lock:
+            if number > self.newlines:
+                return None
+            # Block whose newlines include the number'th one
+            block = bisect.bisect_left(self.block_lines, number) - 1
+            position = block * BLOCK_SIZE
+            skip = number - self.block_lines[block]
+            data = self.map
+        for _ in range(skip):
+            position = data.find(b'\n', position) + 1
+        return position
+
+    def line_number(self, offset):
+        # Line holding byte offset, or None if that part isn't indexed yet
+        with self.lock:
+            block = offset // BLOCK_SIZE
+            if offset > self.indexed or block >= len(self.block_lines):
+                return None
+            return self.block_lines[block] + self.map[block * BLOCK_SIZE:offset].count(b'\n')
+
+    def lines(self, first, count):
+        start = self.line_offset(first)
+        if start is None:
+            return []
+        with self.lock:
+            data = self.map
+            size = self.indexed
+        result = []
+        position = start
+        while len(result) < count and position < size:
+            end = data.find(b'\n', position, size)
+            if end < 0:
+                end = size
+            result.append(data[position:end].decode('utf-8', 'replace').rstrip('\r'))
+            position = end + 1
+        return result
+
+    def close(self):
+        self.running = False
+        self.stopped.set()
+        self.thread.join(timeout=5)
+        with self.lock:
+            self.map = None
+        self.file.close()
+
+
+class LogViewer:
+    # Toplevel showing a LineIndex through a Text widget that only ever holds one
+    # screenful. The scrollbar is driven by line numbers, not by the widget.
+    def __init__(self, root, path, title="View Log", query=None, offset=None):
+        self.root = root
+        self.path = path
+        self.index = LineIndex(path)
+        self.top = 0
+        self.visible = 40
+        self.total = 0
+        self.after_id = None
+        self.hits = []            # (offset, line) of the last search
+        self.hit = -1             # Current hit
+        self.hit_line = None      # Its line number, highlighted when on screen
+        self.search_result = None
+        self.search_text = ""
+        self.pending_offset = offset  # Offset to show once indexing has reached it
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"{title} - {os.path.basename(path)}")
+        self.window.geometry("900x600")
+        self.status_var = tk.StringVar()
+        tk.Label(self.window, textvariable=self.status_var, anchor="w", font=("Consolas", 9)).pack(side=tk.BOTTOM, fill=tk.X)
+
+        # Search bar: words use the log's search index, regexes are scanned in parallel
+        search_bar = tk.Frame(self.window)
+        search_bar.pack(side=tk.TOP, fill=tk.X)
+        tk.Label(search_bar, text="Find:").pack(side=tk.LEFT, padx=2)
+        self.query_var = tk.StringVar(value=query or "")
+        self.query_entry = tk.Entry(search_bar, textvariable=self.query_var)
+        self.query_entry.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.regex_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(search_bar, text="Regex", variable=self.regex_var).pack(side=tk.LEFT)
+        self.case_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(search_bar, text="Match case", variable=self.case_var).pack(side=tk.LEFT)
+        tk.Button(search_bar, text="Find", command=self.search).pack(side=tk.LEFT, padx=2)
+        tk.Button(search_bar, text="<", command=lambda: self.next_hit(-1)).pack(side=tk.LEFT)
+        tk.Button(search_bar, text=">", command=lambda: self.next_hit(1)).pack(side=tk.LEFT, padx=2)
+        self.query_entry.bind("<Return>", lambda e: self.search())
+
+        self.vbar = tk.Scrollbar(self.window, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.vbar.pack(side=tk.RIGHT, fill=tk.Y)
+        xbar = tk.Scrollbar(self.window, orient=tk.HORIZONTAL)
+        xbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.font = tkfont.Font(family="Consolas", size=10)
+        self.text = tk.Text(self.window, bg="white", fg="black", font=self.font, wrap=tk.NONE,
+                            xscrollcommand=xbar.set)
+        self.text.pack(expand=True, fill=tk.BOTH)
+        xbar.configure(command=self.text.xview)
+        configure_tags(self.text)
+        self.text.tag_configure('hit', background="#ffff80")
+        self.text.tag_lower('hit')
+
+        self.text.bind("<Configure>", lambda e: self.resize())
+        self.text.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        self.text.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.text.bind("<Button-5>", lambda e: self.scroll(3))
+        for key, lines in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "-page"), ("<Next>", "page")):
+            self.text.bind(key, lambda e, lines=lines: self.scroll(lines))
+        self.text.bind("<Control-Home>", lambda e: self.goto(0))
+        self.text.bind("<Control-End>", lambda e: self.goto(self.total))
+        self.text.bind("<Control-g>", lambda e: self.ask_line())
+        self.window.bind("<Control-f>", lambda e: self.focus_search())
+        self.window.bind("<F3>", lambda e: self.next_hit(1))
+        self.window.bind("<Shift-F3>", lambda e: self.next_hit(-1))
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.update()
+        if query:
+            self.search()
+        else:
+            self.query_entry.focus_set()
+
+    def resize(self):
+        self.visible = max(1, self.text.winfo_height() // max(1, self.font.metrics('linespace')))
+        self.render()
+
+    def scroll(self, lines):
+        if lines == "page":
+            lines = self.visible - 1
+        elif lines == "-page":
+            lines = 1 - self.visible
+        self.goto(self.top + lines)
+        return "break"
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == tk.MOVETO:
+            self.goto(int(float(amount) * self.total))
+        elif unit == tk.PAGES:
+            self.scroll("page" if int(amount) > 0 else "-page")
+        else:
+            self.scroll(int(amount))
+
+    def ask_line(self):
+        number = simpledialog.askinteger("Go to Line", f"Line (1-{self.total}):", parent=self.window,
+                                         minvalue=1, maxvalue=max(1, self.total))
+        if number:
+            self.goto(number - 1)
+
+    def goto(self, line):
+        self.top = max(0, min(line, self.total - self.visible))
+        self.render()
+
+    def render(self):
+        lines = self.index.lines(self.top, self.visible)
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        if lines:
+            self.text.insert('1.0', *insert_args(lines))
+            if self.hit_line is not None and self.top <= self.hit_line < self.top + len(lines):
+                row = self.hit_line - self.top + 1
+                self.text.tag_add('hit', f'{row}.0', f'{row + 1}.0')
+        self.text.configure(state=tk.DISABLED)
+        if self.total:
+            self.vbar.set(self.top / self.total, min(1.0, (self.top + self.visible) / self.total))
+        else:
+            self.vbar.set(0.0, 1.0)
+
+    def update(self):
+        # Picks up lines as the background index (and a growing log) reveals them
+        total = self.index.line_count()
+        if total != self.total:
+            # Scrolled to the end of a growing log: stay at the end
+            follow = self.total > self.visible and self.top + self.visible >= self.total
+            self.total = total
+            if follow:
+                self.top = max(0, total - self.visible)
+            self.render()
+        if self.pending_offset is not None and self.show_offset(self.pending_offset):
+            self.pending_offset = None
+        self.update_status()
+        self.after_id = self.window.after(500, self.update)
+
+    def update_status(self):
+        state = "" if self.index.done else "  (indexing...)"
+        self.status_var.set(f"Lines {self.top + 1}-{min(self.top + self.visible, self.total)} of {self.total}"
+                            f"  {self.index.size / 1048576:.1f} MB{state}  {self.search_text}")
+
+    def focus_search(self):
+        self.query_entry.focus_set()
+        self.query_entry.select_range(0, tk.END)
+        return "break"  # Not the main window's Ctrl+F
+
+    def search(self):
+        # Runs on a worker thread; poll_search picks the result up on the Tk thread
+        query = self.query_var.get()
+        if not query or self.search_result is not None:
+            return
+        self.search_result = []
+        self.search_text = "Searching..."
+        self.update_status()
+        regex = self.regex_var.get()
+        ignore_case = not self.case_var.get()
+
+        def run():
+            try:
+                result = search_file(self.path, query, regex, ignore_case)
+            except Exception as e:  # re.error for a bad pattern, OSError
+                result = e
+            self.search_result = (result,)
+
+        threading.Thread(target=run, daemon=True).start()
+        self.window.after(50, self.poll_search)
+
+    def poll_search(self):
+        if not self.search_result:
+            self.window.after(50, self.poll_search)
+            return
+        result = self.search_result[0]
+        self.search_result = None
+        if isinstance(result, Exception):
+            self.hits = []
+            self.search_text = f"Search failed: {result}"
+            self.update_status()
+            return
+        self.hits = result
+        # Start from the line the viewer was opened at, if any
+        self.hit = bisect.bisect_left([offset for offset, _ in result], self.pending_offset or 0) - 1
+        self.next_hit(1)
+        if not self.hits:
+            self.search_text = "No matches"
+            self.update_status()
+
+    def next_hit(self, step):
+        if not self.hits:
+            return
+        if self.hit < 0 and step < 0:
+            self.hit = len(self.hits) - 1
+        else:
+            self.hit = (self.hit + step) % len(self.hits)
+        self.search_text = f"Match {self.hit + 1} of {len(self.hits)}"
+        if not self.show_offset(self.hits[self.hit][0]):
+            self.pending_offset = self.hits[self.hit][0]
+        self.update_status()
+
+    def show_offset(self, offset):
+        line = self.index.line_number(offset)
+        if line is None:
+            return False
+        self.total = self.index.line_count()
+        self.hit_line = line
+        self.top = max(0, min(line - self.visible // 3, self.total - self.visible))
+        self.render()
+        return True
+
+    def close(self):
+        if self.after_id is not None:
+            self.window.after_cancel(self.after_id)
+        self.index.close()
+        self.window.destroy()
+
+
+class SearchWindow:
+    # Searches every log in a folder and lists the matching lines; double-clicking a
+    # line opens its log in a LogViewer at that line
+    def __init__(self, root, directory, query=None):
+        self.root = root
+        self.directory = directory
+        self.results = []
+        self.search_result = None
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"Search Logs - {directory}")
+        self.window.geometry("900x500")
+        search_bar = tk.Frame(self.window)
+        search_bar.pack(side=tk.TOP, fill=tk.X)
+        tk.Label(search_bar, text="Find:").pack(side=tk.LEFT, padx=2)
+        self.query_var = tk.StringVar(value=query or "")
+        query_entry = tk.Entry(search_bar, textvariable=self.query_var)
+        query_entry.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.regex_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(search_bar, text="Regex", variable=self.regex_var).pack(side=tk.LEFT)
+        self.case_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(search_bar, text="Match case", variable=self.case_var).pack(side=tk.LEFT)
+        tk.Button(search_bar, text="Find", command=self.search).pack(side=tk.LEFT, padx=2)
+        query_entry.bind("<Return>", lambda e: self.search())
+
+        self.status_var = tk.StringVar()
+        tk.Label(self.window, textvariable=self.status_var, anchor="w", font=("Consolas", 9)).pack(side=tk.BOTTOM, fill=tk.X)
+        vbar = tk.Scrollbar(self.window, orient=tk.VERTICAL)
+        vbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox = tk.Listbox(self.window, font=("Consolas", 10), yscrollcommand=vbar.set)
+        self.listbox.pack(expand=True, fill=tk.BOTH)
+        vbar.configure(command=self.listbox.yview)
+        self.listbox.bind("<Double-Button-1>", lambda e: self.open_hit())
+        self.listbox.bind("<Return>", lambda e: self.open_hit())
+        query_entry.focus_set()
+        if query:
+            self.search()
+
+    def search(self):
+        query = self.query_var.get()
+        if not query or self.search_result is not None:
+            return
+        paths = sorted(glob.glob(os.path.join(glob.escape(self.directory), "*.log"))
+                       + glob.glob(os.path.join(glob.escape(self.directory), "*.txt")))
+        self.search_result = []
+        self.status_var.set(f"Searching {len(paths)} logs...")
+        regex = self.regex_var.get()
+        ignore_case = not self.case_var.get()
+
+        def run():
+            try:
+                result = search_files(paths, query, regex, ignore_case)
+            except Exception as e:
+                result = e
+            self.search_result = (result,)
+
+        threading.Thread(target=run, daemon=True).start()
+        self.window.after(50, self.poll_search)
+
+    def poll_search(self):
+        if not self.search_result:
+            self.window.after(50, self.poll_search)
+            return
+        result = self.search_result[0]
+        self.search_result = None
+        self.listbox.delete(0, tk.END)
+        if isinstance(result, Exception):
+            self.results = []
+            self.status_var.set(f"Search failed: {result}")
+            return
+        self.results = result
+        self.listbox.insert(tk.END, *(f"{os.path.basename(path)}: {line}" for path, _, line in result))
+        files = len({path for path, _, _ in result})
+        self.status_var.set(f"{len(result)} matching lines in {files} logs")
+
+    def open_hit(self):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        path, offset, _ = self.results[selection[0]]
+        LogViewer(self.root, path, "View Log", self.query_var.get(), offset)
@@ -0,0 +1,559 @@
+import concurrent.futures
+import glob
+import gzip
+import multiprocessing
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+
+import settings
+from log_search import TokenIndex, live_indexes
+from timestamps import clock
+
+LOG_SEGMENT = re.compile(r'serial_log_.*\.(log|cap)(\.gz|\.zst)?$')
+QUOTA_IDLE_S = 60  # Segments written to this recently may be another process's open log
+
+compress_pool = None
+compress_lock = threading.Lock()
+compress_pending = set()  # Segments (absolute paths) queued for compression; never deleted by the quota
+open_segments = set()  # Absolute paths of the segments LogWriters are writing; never deleted either
+
+# Binary capture files (.cap): a header, then length-prefixed records
+CAPTURE_MAGIC = b'CIAPCAP1'
+CAPTURE_HEADER = struct.Struct('<8sq')    # magic, wall - monotonic clock offset (ns)
+CAPTURE_RECORD = struct.Struct('<IqHB')   # payload length, monotonic ns, port id, flags
+CAPTURE_INDEX = struct.Struct('<qqQ')     # monotonic ns, clock offset, file offset
+RECORD_DECODED = 0x01   # Payload is a decoded text line (UTF-8); otherwise raw bytes
+RECORD_CLOCK = 0x02     # Payload is a new clock offset (<q) for the records that follow
+RECORD_PORT = 0x04      # Payload is the name of the port id
+RECORD_CAN = 0x08       # Payload is a CAN frame: CAN_RECORD, then the data bytes
+CAN_RECORD = struct.Struct('<IB')  # CAN id (with CAN_EXTENDED for 29-bit ids), CAN_FD/CAN_BRS flags
+CAN_EXTENDED = 0x80000000
+CAN_FD = 0x01
+CAN_BRS = 0x02
+
+
+class LogWriter:
+    # Dedicated writer thread for the log file. write() only appends to an in-memory
+    # buffer, so a slow SD card never blocks serial ingest. The buffer is written out
+    # every LOG_FLUSH_MS or once LOG_FLUSH_KB have accumulated, and fsync'd every
+    # LOG_FSYNC_MS so at most that much log is lost when the Pi loses power.
+    #
+    # Segments are rotated after LOG_ROTATE_MB or LOG_ROTATE_MINUTES; closed segments are
+    # compressed by a process pool and the oldest are deleted once LOG_QUOTA_MB is used.
+    header_size = 0  # Length of segment_header()
+
+    def __init__(self, path, on_rotate=None):
+        self.path = path
+        self.on_rotate = on_rotate
+        # Rotated segments are named after the first one
+        self.session, self.ext = os.path.splitext(path)
+        self.file = open(path, 'ab', buffering=0)
+        self.file_path = path
+        with compress_lock:
+            open_segments.add(os.path.abspath(path))
+        enforce_quota(path)  # A reboot or replug starts a new session; the old ones still count
+        self.offset = os.path.getsize(path)
+        if self.offset == 0:
+            self.offset = self.file.write(self.segment_header())
+        # Word search index, built as the log is written. Not for binary captures or
+        # files we append to, which would only be partly indexed; those are scanned.
+        self.tokens = None
+        if settings.SEARCH_INDEX and not self.header_size and self.offset == 0:
+            self.tokens = TokenIndex()
+            live_indexes[os.path.abspath(path)] = self.tokens
+        self.rotate_bytes = settings.LOG_ROTATE_MB * 1024 * 1024
+        self.rotate_interval = settings.LOG_ROTATE_MINUTES * 60
+        self.segment_start = time.monotonic()
+        self.closed_segments = []  # (path, data) still to be written before the segment is closed
+        self.segments = 1
+        self.linesep = os.linesep.encode()
+        self.flush_interval = settings.LOG_FLUSH_MS / 1000.0
+        self.flush_bytes = settings.LOG_FLUSH_KB * 1024
+        self.fsync_interval = settings.LOG_FSYNC_MS / 1000.0
+
+        self.buffer = bytearray()
+        self.oldest_pending = None
+        self.condition = threading.Condition()
+        self.running = True
+        self.flush_requested = False
+        self.flushed = threading.Event()
+
+        # Metrics
+        self.bytes_written = 0
+        self.lag = 0.0            # Age of the oldest entry when it reached the file
+        self.rate = 0.0           # Bytes per second written over the last second or so
+        self.last_fsync = time.monotonic()
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, entry, stamp=None, line=None):
+        # Thread safe. Returns the byte offset the entry will occupy in the file.
+        # stamp and line (the entry without its timestamp) are for binary capture files.
+        data = entry.encode('utf-8', 'replace') + self.linesep
+        with self.condition:
+            return self.append(data)
+
+    def append(self, data):
+        # Called with the condition held
+        if not self.running:
+            return None
+        if self.rotation_due(len(data)):
+            self.rotate()
+        offset = self.offset
+        self.offset += len(data)
+        if not self.buffer:
+            self.oldest_pending = time.monotonic()
+        self.buffer += data
+        if len(self.buffer) >= self.flush_bytes:
+            self.condition.notify()
+        return offset
+
+    def segment_header(self):
+        # Bytes every segment starts with
+        return b''
+
+    def rotation_due(self, size):
+        if self.offset <= self.header_size:
+            return False
+        if self.rotate_bytes and self.offset + size > self.rotate_bytes:
+            return True
+        return bool(self.rotate_interval) and time.monotonic() - self.segment_start >= self.rotate_interval
+
+    def rotate(self):
+        # Called with the condition held: hand the current buffer over with its segment
+        # and start a fresh one, so offsets always refer to self.path
+        self.closed_segments.append((self.path, self.buffer))
+        self.buffer = bytearray(self.segment_header())
+        self.path = next_segment_path(self.session, self.ext)
+        with compress_lock:
+            open_segments.add(os.path.abspath(self.path))
+        self.offset = len(self.buffer)
+        if self.buffer:
+            self.oldest_pending = time.monotonic()
+        self.segment_start = time.monotonic()
+        self.segments += 1
+        self.condition.notify()
+        if self.on_rotate:
+            self.on_rotate(self.path)
+
+    def flush(self, timeout=5.0):
+        # Write and fsync everything queued so far, waiting for the writer thread
+        with self.condition:
+            if not self.running:
+                return
+            self.flushed.clear()
+            self.flush_requested = True
+            self.condition.notify()
+        self.flushed.wait(timeout)
+
+    def close(self):
+        with self.condition:
+            if not self.running:
+                return
+            self.running = False
+            self.condition.notify()
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout=10)
+
+    def run(self):
+        rate_start = time.monotonic()
+        rate_bytes = 0
+
+        while True:
+            with self.condition:
+                if (self.running and not self.flush_requested and not self.closed_segments
+                        and len(self.buffer) < self.flush_bytes):
+                    self.condition.wait(self.flush_interval)
+                closed = self.closed_segments
+                self.closed_segments = []
+                path = self.path
+                data = self.buffer
+                oldest = self.oldest_pending
+                self.buffer = bytearray()
+                self.oldest_pending = None
+                running = self.running
+                force_sync = self.flush_requested or not running
+                self.flush_requested = False
+
+            for closed_path, closed_data in closed:
+                self.finish_segment(closed_path, closed_data)
+
+            now = time.monotonic()
+            try:
+                if self.file is None or self.file_path != path:
+                    self.file = open(path, 'ab', buffering=0)
+                    self.file_path = path
+                    self.last_fsync = now
+                if data:
+                    start = self.file.tell()
+                    view = memoryview(data)
+                    while view:
+                        view = view[self.file.write(view):]
+                    self.bytes_written += len(data)
+                    self.index_tokens(data, start)
+                    rate_bytes += len(data)
+                    self.lag = time.monotonic() - oldest
+                if force_sync or now - self.last_fsync >= self.fsync_interval:
+                    os.fsync(self.file.fileno())
+                    self.last_fsync = now
+            except OSError as e:
+                # Keep the thread alive; the data in this batch is lost but logging goes on
+                if self.error is None or str(e) != str(self.error):
+                    print(f"Error writing log file: {e}")
+                self.error = e
+
+            if now - rate_start >= 1.0:
+                self.rate = rate_bytes / (now - rate_start)
+                rate_start = now
+                rate_bytes = 0
+
+            if force_sync:
+                self.flushed.set()
+            if not running:
+                break
+
+        try:
+            if self.file:
+                self.file.close()
+        except OSError as e:
+            print(f"Error closing log file: {e}")
+        with compress_lock:
+            open_segments.discard(os.path.abspath(self.path))
+        self.save_tokens(self.path)
+
+    def index_tokens(self, data, start):
+        if self.tokens is None:
+            return
+        try:
+            self.tokens.add(data, start)
+        except Exception as e:
+            # Searching falls back to scanning; logging must go on regardless
+            print(f"Error indexing log for search: {e}")
+            live_indexes.pop(os.path.abspath(self.path), None)
+            self.tokens = None
+
+    def save_tokens(self, path):
+        # Keep the search index next to the finished log
+        tokens = self.tokens
+        if tokens is None:
+            return
+        live_indexes.pop(os.path.abspath(path), None)
+        try:
+            tokens.save(path + '.tokens')
+        except OSError as e:
+            print(f"Error saving search index for {path}: {e}")
+
+    def finish_segment(self, path, data):
+        # Write the tail of a rotated segment, close it and queue it for compression
+        try:
+            if self.file is None or self.file_path != path:
+                if self.file:
+                    self.file.close()
+                self.file = open(path, 'ab', buffering=0)
+                self.file_path = path
+            start = self.file.tell()
+            view = memoryview(data)
+            while view:
+                view = view[self.file.write(view):]
+            self.bytes_written += len(data)
+            self.index_tokens(data, start)
+            os.fsync(self.file.fileno())
+            self.file.close()
+        except OSError as e:
+            print(f"Error closing log segment {path}: {e}")
+        self.file = None
+        self.file_path = None
+        with compress_lock:
+            open_segments.discard(os.path.abspath(path))
+        if self.tokens is not None:
+            self.save_tokens(path)
+            self.tokens = TokenIndex()
+            live_indexes[os.path.abspath(self.path)] = self.tokens
+        submit_compression(path, self.path)
+
+    def pending(self):
+        return len(self.buffer)
+
+    def current_lag(self):
+        # Includes data still waiting in the buffer, so a stalled card shows up immediately
+        oldest = self.oldest_pending
+        if oldest is None:
+            return self.lag
+        return max(self.lag, time.monotonic() - oldest)
+
+    def status_text(self):
+        return (f"Log: {self.rate / 1024:.1f} KB/s  Pending: {self.pending() // 1024} KB"
+                f"  Lag: {self.current_lag() * 1000:.0f} ms  Segment: {self.segments}")
+
+
+class CaptureWriter(LogWriter):
+    # Binary capture file: each line is a record holding its arrival time
+    # (time.monotonic_ns()), port id, flags and payload, so tools can seek by time
+    # without parsing text. Every CAPTURE_INDEX_RECORDS records the record's time and
+    # offset are added to a sidecar <file>.idx. capture_file.py reads both and converts
+    # captures back to the text format.
+    header_size = CAPTURE_HEADER.size
+
+    def __init__(self, path, on_rotate=None, port=0, port_name=None):
+        self.port = port
+        self.clock_offset = None
+        self.records = 0
+        self.index_every = max(1, settings.CAPTURE_INDEX_RECORDS)
+        self.index_file = None
+        super().__init__(path, on_rotate)
+        self.open_index()
+        if port_name:
+            self.write_record(None, port_name.encode('utf-8', 'replace'), RECORD_PORT)
+
+    def segment_header(self):
+        self.clock_offset = clock.base[0]
+        return CAPTURE_HEADER.pack(CAPTURE_MAGIC, self.clock_offset)
+
+    def open_index(self):
+        if self.index_file:
+            self.index_file.close()
+        self.index_file = open(self.path + '.idx', 'ab')
+        self.records = 0
+
+    def rotate(self):
+        super().rotate()
+        self.open_index()
+
+    def write(self, entry, stamp=None, line=None):
+        text = entry if line is None else line
+        return self.write_record(stamp, text.encode('utf-8', 'replace'), RECORD_DECODED)
+
+    def write_record(self, stamp, payload, flags, port=None):
+        if stamp is None:
+            stamp = time.monotonic_ns()
+        offset = clock.wall_ns(stamp) - stamp
+        with self.condition:
+            if not self.running:
+                return None
+            if offset != self.clock_offset:
+                self.clock_offset = offset
+                self.append(CAPTURE_RECORD.pack(8, stamp, 0, RECORD_CLOCK) + struct.pack('<q', offset))
+            record = CAPTURE_RECORD.pack(len(payload), stamp, self.port if port is None else port, flags)
+            position = self.append_record(record, payload)
+            if self.records % self.index_every == 0:
+                try:
+                    self.index_file.write(CAPTURE_INDEX.pack(stamp, self.clock_offset, position))
+                except (OSError, ValueError) as e:
+                    print(f"Error writing capture index: {e}")
+            self.records += 1
+        return position
+
+    def append_record(self, head, payload):
+        return self.append(head + payload)
+
+    def flush(self, timeout=5.0):
+        super().flush(timeout)
+        with self.condition:
+            self.index_file.flush()
+
+    def close(self):
+        super().close()
+        with self.condition:
+            self.index_file.close()
+
+
+class TtyRecordWriter(CaptureWriter):
+    # Raw TTY recording: every chunk read from the port, byte for byte, as one record
+    # (flags 0) stamped with its arrival time. Same format as a capture, so
+    # capture_file.py reads it, but never rotated, so a recording stays one file that
+    # tty_replay.py can play into a pty.
+    def __init__(self, path, port_name=None):
+        # One recording per file: an existing one is replaced, not appended to
+        for old in (path, path + '.idx'):
+            if os.path.exists(old):
+                os.remove(old)
+        super().__init__(path, port_name=port_name)
+        self.rotate_bytes = 0
+        self.rotate_interval = 0
+        self.chunks = 0
+
+    def write_chunk(self, data, stamp):
+        # Called on the reader thread with the bytes exactly as read
+        self.chunks += 1
+        return self.write_record(stamp, data, 0)
+
+    def append_record(self, head, payload):
+        # Head and chunk are appended one after the other instead of being joined
+        # first (safe here because the file is never rotated between them). That saves
+        # the temporary head + chunk; both are still copied once into the buffer.
+        position = self.append(head)
+        self.append(payload)
+        return position
+
+    def status_text(self):
+        return f"TTY record: {self.chunks} chunks  {self.offset // 1024} KB"
+
+
+class CanLogWriter(CaptureWriter):
+    # CAN capture: each received frame is one RECORD_CAN record (20 bytes plus the
+    # data), stamped with the time.monotonic_ns() it was read, the serial readers'
+    # clock, so frames and serial lines can be merged by time; see can_capture.py
+    def __init__(self, path, on_rotate=None, channel=None):
+        super().__init__(path, on_rotate, port_name=channel)
+        self.frames = 0
+
+    def write_frame(self, stamp, can_id, flags, data):
+        self.frames += 1
+        return self.write_record(stamp, CAN_RECORD.pack(can_id, flags) + data, RECORD_CAN)
+
+
+def new_can_log_path(directory="."):
+    return os.path.join(directory, f"can_log_{time.strftime('%Y%m%d_%H%M%S')}.cap")
+
+
+def new_tty_record_path(directory="."):
+    return os.path.join(directory, f"tty_{time.strftime('%Y%m%d_%H%M%S')}.cap")
+
+
+def open_log_writer(path, on_rotate=None, port_name=None):
+    # Binary capture files are picked by extension, so a text log stays a text log
+    if path.endswith('.cap'):
+        return CaptureWriter(path, on_rotate, port_name=port_name)
+    return LogWriter(path, on_rotate)
+
+
+def format_entry(line, stamp=None):
+    # One log line as written to the file and shown in the console. stamp is the
+    # time.monotonic_ns() the line arrived at; None stamps it now.
+    return f"{clock.format(stamp)} - {line}"
+
+
+def new_log_path(directory=".", name=None):
+    # name tells sessions apart when several ports are captured at once
+    prefix = f"serial_log_{name}" if name else "serial_log"
+    ext = ".cap" if settings.LOG_FORMAT.lower() == "binary" else ".log"
+    return os.path.join(directory, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}{ext}")
+
+
+def next_segment_path(session, ext):
+    # Session serial_log_20241007_151727 -> serial_log_20241007_151727_<now>.log
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    candidate = f"{session}_{stamp}{ext}"
+    count = 1
+    while glob.glob(glob.escape(candidate) + '*'):  # Also skips compressed segments
+        candidate = f"{session}_{stamp}_{count}{ext}"
+        count += 1
+    return candidate
+
+
+def log_segments(directory):
+    # Every log segment in directory, of any session or port: serial_log_*.log and
+    # .cap files, compressed or not (not their .idx/.tokens sidecars)
+    for path in glob.glob(os.path.join(glob.escape(directory), 'serial_log_*')):
+        if LOG_SEGMENT.match(os.path.basename(path)):
+            yield path
+
+
+def compress_segment(path, method):
+    # Runs in a worker process. Returns the path of the file that is kept.
+    if method == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            print("zstandard is not installed, compressing with gzip instead")
+            method = "gzip"
+        else:
+            target = path + ".zst"
+            with open(path, 'rb') as source, open(target + ".tmp", 'wb') as dest:
+                zstandard.ZstdCompressor(level=10).copy_stream(source, dest)
+    if method == "gzip":
+        target = path + ".gz"
+        with open(path, 'rb') as source, gzip.open(target + ".tmp", 'wb', compresslevel=6) as dest:
+            shutil.copyfileobj(source, dest, 1024 * 1024)
+    if method not in ("gzip", "zstd"):
+        return path
+
+    os.replace(target + ".tmp", target)
+    os.remove(path)
+    return target
+
+
+def submit_compression(path, current_path):
+    global compress_pool
+    method = settings.LOG_COMPRESS.lower()
+    if method in ("", "none"):
+        enforce_quota(current_path)
+        return
+
+    future = None
+    with compress_lock:
+        for _ in range(2):
+            try:
+                if compress_pool is None:
+                    # spawn, not fork: the GUI process has Tk and several threads running
+                    compress_pool = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+                future = compress_pool.submit(compress_segment, path, method)
+                compress_pending.add(os.path.abspath(path))
+                break
+            except RuntimeError as e:
+                # Broken pool (a worker died) gets replaced once; at interpreter exit
+                # the segment is simply left uncompressed
+                compress_pool = None
+                error = e
+    if future is None:
+        print(f"Error compressing log segment {path}: {error}")
+        enforce_quota(current_path)
+        return
+
+    def done(result):
+        with compress_lock:
+            compress_pending.discard(os.path.abspath(path))
+        error = result.exception()
+        if error:
+            print(f"Error compressing log segment {path}: {error}")
+        enforce_quota(current_path)
+
+    future.add_done_callback(done)
+
+
+def enforce_quota(current_path):
+    # Delete the oldest closed segments in the log directory, of every session and
+    # port, until all of them together fit in LOG_QUOTA_MB. Segments still being
+    # written (here, or recently by another process such as the headless logger) or
+    # waiting to be compressed are counted but never deleted.
+    quota = settings.LOG_QUOTA_MB * 1024 * 1024
+    if not quota:
+        return
+    segments = []
+    used = 0
+    now = time.time()
+    current = os.path.abspath(current_path)
+    for path in log_segments(os.path.dirname(current)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        used += stat.st_size
+        absolute = os.path.abspath(path)
+        with compress_lock:
+            busy = absolute in compress_pending or absolute in open_segments
+        if busy or absolute == current or now - stat.st_mtime < QUOTA_IDLE_S:
+            continue
+        segments.append((stat.st_mtime, stat.st_size, path))
+
+    for _, size, path in sorted(segments):
+        if used <= quota:
+            break
+        try:
+            os.remove(path)
+            used -= size
+            print(f"Removed old log segment {path} (quota {settings.LOG_QUOTA_MB} MB)")
+            base = re.sub(r'\.(gz|zst)$', '', path)
+            for sidecar in (base + '.tokens', base + '.idx'):
+                if os.path.exists(sidecar):
+                    os.remove(sidecar)
+        except OSError as e:
+            print(f"Error removing old log segment {path}: {e}")
@@ -0,0 +1,241 @@
+# Headless serial logger for running on the Raspberry Pi without a display.
+#
+#   python3 logger.py --port /dev/ttyUSB0 --log-dir /home/pi/ciap-logs
+#
+# Uses the same port detection, SerialReader and log writers as the GUI. Log lines are
+# also served on a local TCP port so the GUI can attach as a viewer
+# (Control > Attach to Logger). See ciap-logger.service for starting it on boot.
+import argparse
+import collections
+import os
+import signal
+import socket
+import threading
+
+import settings
+from log_writer import format_entry, new_log_path, open_log_writer
+from reader import SerialReader, open_serial_port
+from port_monitor import PortMonitor
+
+
+class ViewerServer:
+    # Streams log lines to attached viewers. Each viewer has its own bounded queue and
+    # sender thread, so a slow or stuck viewer only loses its own lines.
+    def __init__(self, host, port, max_lines=10000):
+        self.max_lines = max_lines
+        self.clients = []
+        self.lock = threading.Lock()
+        self.server = socket.create_server((host, port))
+        self.thread = threading.Thread(target=self.accept_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn, address = self.server.accept()
+            except OSError:
+                break  # Server socket closed
+            client = ViewerClient(conn, self.max_lines, self.remove)
+            with self.lock:
+                self.clients.append(client)
+            print(f"Viewer attached from {address[0]}:{address[1]}")
+
+    def remove(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def broadcast(self, entry):
+        if not self.clients:
+            return
+        data = (entry + '\n').encode('utf-8', 'replace')
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.put(data)
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.close()
+
+
+class ViewerClient:
+    def __init__(self, conn, max_lines, on_close):
+        self.conn = conn
+        self.queue = collections.deque(maxlen=max_lines)
+        self.ready = threading.Event()
+        self.on_close = on_close
+        self.running = True
+        self.thread = threading.Thread(target=self.send_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, data):
+        self.queue.append(data)
+        self.ready.set()
+
+    def send_loop(self):
+        try:
+            while self.running:
+                self.ready.wait()
+                self.ready.clear()
+                chunk = []
+                while self.queue:
+                    chunk.append(self.queue.popleft())
+                if chunk:
+                    self.conn.sendall(b''.join(chunk))
+        except OSError:
+            pass
+        self.close()
+
+    def close(self):
+        self.running = False
+        self.ready.set()
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        self.on_close(self)
+
+
+class HeadlessLogger:
+    def __init__(self, device=None, baudrate=115200, log_dir=".", view_port=0, view_host="127.0.0.1"):
+        self.device = device
+        self.baudrate = baudrate
+        self.log_dir = log_dir
+        self.running = True
+        self.stopped = threading.Event()
+        self.log_file = None
+        self.viewers = ViewerServer(view_host, view_port) if view_port else None
+        self.current_device = None
+        self.monitor = PortMonitor(self.port_added, self.port_removed)
+
+    def port_added(self, device, role, info):
+        if role == "device" and self.device is None and self.current_device is None:
+            self.stopped.set()  # Wake run() to pick the new port up
+
+    def port_removed(self, device, role):
+        if device == self.current_device:
+            self.stopped.set()  # Don't wait for the reader to notice
+
+    def run(self):
+        self.monitor.start()
+        while self.running:
+            device = self.device or self.monitor.find("device")
+            if not device:
+                self.stopped.wait(settings.LOGGER_RETRY_S)
+                if self.running:
+                    self.stopped.clear()
+                continue
+
+            try:
+                serial_port = open_serial_port(device, self.baudrate)
+            except Exception as e:
+                print(f"Error opening {device}: {e}")
+                self.stopped.wait(settings.LOGGER_RETRY_S)
+                if self.running:
+                    self.stopped.clear()
+                continue
+
+            print(f"Logging {device} at {self.baudrate} baud")
+            self.current_device = device
+            self.log_file = open_log_writer(new_log_path(self.log_dir))
+            reader = SerialReader(serial_port, self.handle_line, lambda error: self.stopped.set())
+            self.stopped.clear()  # Port events from before we opened this port are stale
+            reader.start()
+
+            # Until the port fails or goes away, or we are asked to stop
+            while self.running and reader.running and not self.stopped.is_set():
+                self.stopped.wait(1.0)
+            if self.running:
+                self.stopped.clear()
+
+            reader.stop()
+            try:
+                serial_port.close()
+            except Exception as e:
+                print(f"Error closing {device}: {e}")
+            self.log_file.close()
+            self.log_file = None
+            self.current_device = None
+            print(f"Stopped logging {device}")
+
+        self.monitor.stop()
+        if self.viewers:
+            self.viewers.close()
+
+    def handle_line(self, line, stamp=None):
+        entry = format_entry(line, stamp)
+        log_file = self.log_file
+        if log_file:
+            log_file.write(entry, stamp, line)
+        if self.viewers:
+            self.viewers.broadcast(entry)
+
+    def stop(self, *args):
+        self.running = False
+        self.stopped.set()
+
+    def handle_signal(self, signum, frame):
+        # The handler runs on the main thread, possibly while it is inside stopped.wait()
+        # holding the event's lock, so set the event from another thread
+        self.running = False
+        threading.Thread(target=self.stopped.set, daemon=True).start()
+
+
+def attach(host, port, on_line, on_close=None):
+    # Viewer side: stream lines from a running headless logger on a background thread.
+    # Returns the socket; closing it detaches.
+    conn = socket.create_connection((host, port), timeout=5)
+    conn.settimeout(None)
+
+    def receive():
+        pending = b''
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                lines = (pending + data).split(b'\n')
+                pending = lines.pop()
+                for raw in lines:
+                    on_line(raw.decode('utf-8', 'replace'))
+        except OSError:
+            pass
+        if on_close:
+            on_close()
+
+    thread = threading.Thread(target=receive)
+    thread.daemon = True
+    thread.start()
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AEPL headless serial logger")
+    parser.add_argument("--port", help="serial device, e.g. /dev/ttyUSB0 (default: newest detected port)")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--log-dir", default=".", help="directory for serial_log_*.log files")
+    parser.add_argument("--config", default="ciap.ini", help="settings file (see settings.py)")
+    parser.add_argument("--view-port", type=int, default=None,
+                        help="local TCP port for GUI viewers, 0 to disable (default: LOGGER_VIEW_PORT)")
+    parser.add_argument("--view-host", default="127.0.0.1",
+                        help="address viewers may attach on; 0.0.0.0 to allow a PC on the bench network")
+    args = parser.parse_args()
+
+    settings.load(args.config)
+    os.makedirs(args.log_dir, exist_ok=True)
+    view_port = settings.LOGGER_VIEW_PORT if args.view_port is None else args.view_port
+
+    logger = HeadlessLogger(args.port, args.baud, args.log_dir, view_port, args.view_host)
+    signal.signal(signal.SIGTERM, logger.handle_signal)  # systemd stop / IGN off shutdown
+    signal.signal(signal.SIGINT, logger.handle_signal)
+    logger.run()
+
+
+if __name__ == "__main__":
+    main()
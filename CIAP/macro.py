@@ -0,0 +1,612 @@
+# Runs Tera Term macros (.ttl) against the device, e.g. "CIAP - Macro Commands/CRST - 4G.ttl":
+#
+#   send '*SET#CRST#1#'
+#   pause 30
+#   send '*SET#CRST#1#'
+#
+# The supported subset of TTL:
+#   send / sendln <values...>       strings, #13-style char codes, integers (sent as a char)
+#   pause <s>, mpause <ms>
+#   wait / waitln <strings...>      result = index of the string seen first, 0 on timeout
+#   waitregex <regex>               result = 1 or 0; matchstr and groupmatchstr1-9 are set
+#   flushrecv, dispstr <values...>, int2str, str2int, end / exit
+#   var = <expression>              integers and strings; + - * / % and or xor not
+#                                   = == <> != < > <= >= && || ! and parentheses
+#   if <expr> then / elseif / else / endif, and single-line "if <expr> <command>"
+#   for <var> <first> <last> / next, while <expr> / endwhile,
+#   do [while|until <expr>] / loop [while|until <expr>], break, continue
+#   :label, goto <label>
+# timeout (seconds) and mtimeout (ms) bound each wait; 0 waits forever. Comments start
+# with ";" (or "#" at the start of a line, as the old macro runner allowed).
+#
+# Macros never touch the port for reading: a MacroRunner subscribes to the lines the
+# session's reader publishes on the RecordBus and waits match against those, line by
+# line. Each macro runs as an asyncio task on its own loop thread, so pauses and
+# waits cost nothing while the reader keeps logging.
+import asyncio
+import collections
+import re
+import threading
+import time
+
+import settings
+
+NEWLINE = b'\r\n'  # What sendln adds
+
+TOKEN = re.compile(r"""
+    \s*(?:
+      (?P<string>'[^']*'|"[^"]*"|\#\$?[0-9A-Fa-f]+)
+    | (?P<number>\$[0-9A-Fa-f]+|\d+)
+    | (?P<name>[A-Za-z_]\w*)
+    | (?P<op><>|!=|==|<=|>=|&&|\|\||[-+*/%=<>()!,:])
+    )""", re.VERBOSE)
+
+# Binary operators and their precedence, loosest first
+PRECEDENCE = {
+    '||': 1, '&&': 2, 'or': 3, 'xor': 3, 'and': 4,
+    '=': 5, '==': 5, '<>': 5, '!=': 5, '<': 6, '>': 6, '<=': 6, '>=': 6,
+    '+': 7, '-': 7, '*': 8, '/': 8, '%': 8,
+}
+
+
+class MacroError(Exception):
+    def __init__(self, line_number, message):
+        super().__init__(f"line {line_number}: {message}")
+        self.line_number = line_number
+
+
+def tokenize(text, line_number):
+    # [(kind, value)]; adjacent string pieces ('abc'#13#10) become one string
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    glued = False
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise MacroError(line_number, f"can't parse {text[pos:].strip()!r}")
+        touching = match.start(match.lastindex) == pos
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            if value.startswith('#'):
+                value = chr(int(value[2:], 16) if value[1] == '$' else int(value[1:]))
+            else:
+                value = value[1:-1]
+            if glued and touching and tokens and tokens[-1][0] == 'string':
+                tokens[-1] = ('string', tokens[-1][1] + value)
+                continue
+            glued = True
+        else:
+            glued = False
+            if kind == 'number':
+                kind, value = 'number', int(value[1:], 16) if value.startswith('$') else int(value)
+            elif kind == 'name':
+                value = value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+
+class ExpressionParser:
+    # Precedence climbing over a token list into nested tuples:
+    # ('value', x), ('var', name), ('unary', op, operand), ('binary', op, left, right)
+    def __init__(self, tokens, line_number):
+        self.tokens = tokens
+        self.pos = 0
+        self.line_number = line_number
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def binary_op(self):
+        kind, value = self.peek()
+        if kind == 'op' and value in PRECEDENCE:
+            return value
+        if kind == 'name' and value in ('and', 'or', 'xor'):
+            return value
+        return None
+
+    def parse(self, min_precedence=1):
+        left = self.unary()
+        while True:
+            op = self.binary_op()
+            if op is None or PRECEDENCE[op] < min_precedence:
+                return left
+            self.take()
+            right = self.parse(PRECEDENCE[op] + 1)
+            left = ('binary', op, left, right)
+
+    def unary(self):
+        kind, value = self.take()
+        if kind in ('number', 'string'):
+            return ('value', value)
+        if kind == 'name' and value == 'not':
+            return ('unary', 'not', self.unary())
+        if kind == 'name':
+            return ('var', value)
+        if kind == 'op' and value in ('-', '!', '+'):
+            return ('unary', value, self.unary())
+        if kind == 'op' and value == '(':
+            inner = self.parse()
+            if self.take() != ('op', ')'):
+                raise MacroError(self.line_number, "missing )")
+            return inner
+        raise MacroError(self.line_number, f"expected a value, found {value!r}" if value else "expression expected")
+
+    def arguments(self):
+        # Space (or comma) separated expressions up to the end of the line
+        values = []
+        while self.pos < len(self.tokens):
+            if self.peek() == ('op', ','):
+                self.take()
+                continue
+            values.append(self.parse())
+        return values
+
+
+def to_int(value, line_number):
+    if isinstance(value, int):
+        return value
+    raise MacroError(line_number, f"{value!r} is not an integer")
+
+
+def apply_binary(op, left, right, line_number):
+    if op in ('=', '=='):
+        return int(left == right)
+    if op in ('<>', '!='):
+        return int(left != right)
+    if op == '+' and isinstance(left, str) and isinstance(right, str):
+        return left + right
+    if op in ('<', '>', '<=', '>=') and isinstance(left, str) and isinstance(right, str):
+        pass  # Strings compare as strings
+    else:
+        left = to_int(left, line_number)
+        right = to_int(right, line_number)
+    if op == '+':
+        return left + right
+    if op == '-':
+        return left - right
+    if op == '*':
+        return left * right
+    if op in ('/', '%'):
+        if right == 0:
+            raise MacroError(line_number, "division by zero")
+        quotient = abs(left) // abs(right) * (1 if (left < 0) == (right < 0) else -1)  # C-style
+        return quotient if op == '/' else left - quotient * right
+    if op == '<':
+        return int(left < right)
+    if op == '>':
+        return int(left > right)
+    if op == '<=':
+        return int(left <= right)
+    if op == '>=':
+        return int(left >= right)
+    if op == '&&':
+        return int(bool(left) and bool(right))
+    if op == '||':
+        return int(bool(left) or bool(right))
+    if op == 'and':
+        return left & right
+    if op == 'or':
+        return left | right
+    if op == 'xor':
+        return left ^ right
+    raise MacroError(line_number, f"unknown operator {op}")
+
+
+class Macro:
+    # A compiled macro: a flat list of (line number, command, arguments) with the
+    # block structure turned into jumps
+    def __init__(self, text, name="macro"):
+        self.name = name
+        self.statements = []
+        self.labels = {}
+        self.compile(text)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as macro_file:
+            return cls(macro_file.read(), path)
+
+    def emit(self, line_number, command, *args):
+        self.statements.append([line_number, command, *args])
+        return len(self.statements) - 1
+
+    def compile(self, text):
+        blocks = []  # Open blocks: [kind, line number, statement index, jump fix-ups...]
+        for line_number, line in enumerate(text.splitlines(), 1):
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            tokens = tokenize(self.drop_comment(stripped), line_number)
+            if tokens:
+                self.compile_statement(tokens, line_number, blocks)
+        if blocks:
+            kind, line_number = blocks[-1][0], blocks[-1][1]
+            raise MacroError(line_number, f"{kind} without its end")
+        for statement in self.statements:
+            if statement[1] == 'goto':
+                target = self.labels.get(statement[2])
+                if target is None:
+                    raise MacroError(statement[0], f"no label :{statement[2]}")
+                statement[2] = target
+
+    def drop_comment(self, line):
+        # ";" starts a comment unless it is inside a string
+        quote = None
+        for i, char in enumerate(line):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in "'\"":
+                quote = char
+            elif char == ';':
+                return line[:i]
+        return line
+
+    def compile_statement(self, tokens, line_number, blocks):
+        kind, word = tokens[0]
+        if kind == 'op' and word == ':' and len(tokens) == 2 and tokens[1][0] == 'name':
+            self.labels[tokens[1][1]] = len(self.statements)
+            return
+        if kind != 'name':
+            raise MacroError(line_number, f"unexpected {word!r}")
+        rest = tokens[1:]
+
+        if rest and rest[0] == ('op', '='):
+            self.emit(line_number, 'set', word, self.expression(rest[1:], line_number))
+            return
+
+        if word == 'if':
+            parser = ExpressionParser(rest, line_number)
+            condition = parser.parse()
+            remainder = rest[parser.pos:]
+            if remainder == [('name', 'then')]:
+                test = self.emit(line_number, 'jump_unless', condition, None)
+                blocks.append(['if', line_number, test, []])
+            elif remainder:
+                # Single-line if: skip the command when the condition is false
+                test = self.emit(line_number, 'jump_unless', condition, None)
+                self.compile_statement(remainder, line_number, blocks)
+                self.statements[test][3] = len(self.statements)
+            else:
+                raise MacroError(line_number, "if needs 'then' or a command")
+        elif word in ('elseif', 'else'):
+            block = self.open_block(blocks, ('if',), word, line_number)
+            block[3].append(self.emit(line_number, 'jump', None))  # End of the previous branch
+            self.statements[block[2]][3] = len(self.statements)
+            if word == 'elseif':
+                parser = ExpressionParser(rest, line_number)
+                condition = parser.parse()
+                if rest[parser.pos:] != [('name', 'then')]:
+                    raise MacroError(line_number, "elseif needs 'then'")
+                block[2] = self.emit(line_number, 'jump_unless', condition, None)
+            else:
+                block[2] = None
+        elif word == 'endif':
+            block = self.close_block(blocks, ('if',), word, line_number)
+            end = len(self.statements)
+            if block[2] is not None:
+                self.statements[block[2]][3] = end
+            for jump in block[3]:
+                self.statements[jump][2] = end
+
+        elif word == 'for':
+            if len(rest) < 3 or rest[0][0] != 'name':
+                raise MacroError(line_number, "for <variable> <first> <last>")
+            parser = ExpressionParser(rest[1:], line_number)
+            first, last = parser.parse(), parser.parse()
+            start = self.emit(line_number, 'for', rest[0][1], first, last)
+            blocks.append(['for', line_number, start, []])
+        elif word == 'next':
+            block = self.close_block(blocks, ('for',), word, line_number)
+            step = self.emit(line_number, 'next', block[2])
+            self.finish_loop(block, step, len(self.statements))
+
+        elif word == 'while':
+            start = self.emit(line_number, 'jump_unless', self.expression(rest, line_number), None)
+            blocks.append(['while', line_number, start, []])
+        elif word == 'endwhile':
+            block = self.close_block(blocks, ('while',), word, line_number)
+            self.emit(line_number, 'jump', block[2])
+            self.statements[block[2]][3] = len(self.statements)
+            self.finish_loop(block, block[2], len(self.statements))
+
+        elif word == 'do':
+            start = len(self.statements)
+            condition = self.loop_condition(rest, line_number)
+            if condition is not None:
+                self.emit(line_number, 'jump_unless', condition, None)
+            blocks.append(['do', line_number, start, [], condition is not None])
+        elif word == 'loop':
+            block = self.close_block(blocks, ('do',), word, line_number)
+            condition = self.loop_condition(rest, line_number)
+            check = len(self.statements)
+            if condition is None:
+                self.emit(line_number, 'jump', block[2])
+            else:
+                self.emit(line_number, 'jump_if', condition, block[2])
+            end = len(self.statements)
+            if block[4]:
+                self.statements[block[2]][3] = end
+            self.finish_loop(block, check, end)
+
+        elif word in ('break', 'continue'):
+            loop = next((block for block in reversed(blocks) if block[0] in ('for', 'while', 'do')), None)
+            if loop is None:
+                raise MacroError(line_number, f"{word} outside a loop")
+            loop[3].append(self.emit(line_number, word, None))
+
+        elif word == 'goto':
+            if len(rest) != 1 or rest[0][0] != 'name':
+                raise MacroError(line_number, "goto <label>")
+            self.emit(line_number, 'goto', rest[0][1])
+        elif word in ('send', 'sendln', 'dispstr', 'wait', 'waitln', 'waitregex'):
+            args = ExpressionParser(rest, line_number).arguments()
+            if word.startswith('wait') and not args:
+                raise MacroError(line_number, f"{word} needs something to wait for")
+            self.emit(line_number, word, args)
+        elif word in ('pause', 'mpause'):
+            self.emit(line_number, word, self.expression(rest, line_number))
+        elif word in ('int2str', 'str2int'):
+            if len(rest) < 2 or rest[0][0] != 'name':
+                raise MacroError(line_number, f"{word} <variable> <value>")
+            self.emit(line_number, word, rest[0][1], self.expression(rest[1:], line_number))
+        elif word in ('flushrecv', 'end', 'exit'):
+            self.emit(line_number, 'end' if word == 'exit' else word)
+        else:
+            raise MacroError(line_number, f"unsupported command {word!r}")
+
+    def expression(self, tokens, line_number):
+        parser = ExpressionParser(tokens, line_number)
+        expression = parser.parse()
+        if parser.pos != len(tokens):
+            raise MacroError(line_number, f"unexpected {tokens[parser.pos][1]!r}")
+        return expression
+
+    def loop_condition(self, tokens, line_number):
+        # "while <expr>" or "until <expr>" after do/loop, as a while-condition
+        if not tokens:
+            return None
+        if tokens[0] not in (('name', 'while'), ('name', 'until')):
+            raise MacroError(line_number, "expected while or until")
+        condition = self.expression(tokens[1:], line_number)
+        return condition if tokens[0][1] == 'while' else ('unary', '!', condition)
+
+    def open_block(self, blocks, kinds, word, line_number):
+        if not blocks or blocks[-1][0] not in kinds:
+            raise MacroError(line_number, f"{word} without {kinds[0]}")
+        return blocks[-1]
+
+    def close_block(self, blocks, kinds, word, line_number):
+        block = self.open_block(blocks, kinds, word, line_number)
+        blocks.pop()
+        return block
+
+    def finish_loop(self, block, continue_at, end):
+        for index in block[3]:
+            statement = self.statements[index]
+            statement[2] = end if statement[1] == 'break' else continue_at
+
+
+class MacroRunner:
+    # Runs one Macro on its own asyncio loop thread. send(data) writes bytes to the
+    # device (called in the loop's executor, so a slow port can't stall the loop);
+    # on_message(text) reports progress; on_done(error) is called once at the end,
+    # with None when the macro finished or was stopped. Subscribe feed_line to the
+    # session's lines before start().
+    def __init__(self, macro, send, on_message=None, on_done=None, source="Main"):
+        self.macro = macro
+        self.send_data = send
+        self.on_message = on_message
+        self.on_done = on_done
+        self.source = source
+        self.lines = collections.deque(maxlen=settings.MACRO_BUFFER_LINES)
+        self.variables = {'result': 0, 'timeout': 0, 'mtimeout': 0, 'inputstr': '', 'matchstr': ''}
+        self.loop = None
+        self.task = None
+        self.thread = None
+        self.waiter = None  # Future a wait is sleeping on
+        self.current_line = 0
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.task = self.loop.create_task(self.execute())
+        error = None
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            self.message("Macro stopped")
+        except Exception as e:
+            error = e
+            self.message(f"Macro failed at line {self.current_line}: {e}")
+        finally:
+            self.running = False
+            self.loop.close()
+        if self.on_done:
+            self.on_done(error)
+
+    def stop(self):
+        loop = self.loop
+        if loop is not None and self.running:
+            try:
+                loop.call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                pass  # Loop already closed
+
+    def feed_line(self, source, line, stamp):
+        # RecordBus line listener, on the reader thread: only appends and, if a wait
+        # is sleeping, wakes it. Lines keep arriving whatever the macro is doing.
+        if source != self.source or not self.running:
+            return
+        self.lines.append(line)
+        waiter = self.waiter
+        if waiter is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.wake, waiter)
+            except RuntimeError:
+                pass
+
+    def wake(self, waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def message(self, text):
+        if self.on_message:
+            self.on_message(text)
+
+    def status_text(self):
+        return f"Macro: line {self.current_line}" if self.running else ""
+
+    async def execute(self):
+        statements = self.macro.statements
+        pc = 0
+        previous = 0
+        loops = {}  # for-statement index -> (step, last value)
+        self.message(f"Running macro {self.macro.name}")
+        while pc < len(statements):
+            line_number, command, *args = statements[pc]
+            self.current_line = line_number
+            if pc < previous:
+                await asyncio.sleep(0)  # Jumped back: let a busy loop be stopped
+            previous = pc
+            pc += 1
+            if command == 'set':
+                self.variables[args[0]] = self.evaluate(args[1], line_number)
+            elif command in ('jump', 'goto', 'break', 'continue'):
+                pc = args[0]
+            elif command == 'jump_unless':
+                if not self.evaluate(args[0], line_number):
+                    pc = args[1]
+            elif command == 'jump_if':
+                if self.evaluate(args[0], line_number):
+                    pc = args[1]
+            elif command == 'for':
+                variable, first, last = args[0], self.evaluate(args[1], line_number), self.evaluate(args[2], line_number)
+                loops[pc - 1] = (1 if to_int(first, line_number) <= to_int(last, line_number) else -1, last)
+                self.variables[variable] = first
+            elif command == 'next':
+                start = args[0]
+                variable = statements[start][2]
+                step, last = loops[start]
+                value = to_int(self.variables[variable], line_number) + step
+                self.variables[variable] = value
+                if (value - last) * step <= 0:
+                    pc = start + 1
+            elif command in ('send', 'sendln'):
+                data = ''.join(chr(value) if isinstance(value, int) else value
+                               for value in self.evaluate_all(args[0], line_number))
+                payload = data.encode('latin-1', 'replace')
+                if command == 'sendln':
+                    payload += NEWLINE
+                await self.loop.run_in_executor(None, self.send_data, payload)
+                self.message(f"{command} {data!r}")
+            elif command == 'dispstr':
+                self.message(''.join(str(value) for value in self.evaluate_all(args[0], line_number)))
+            elif command == 'pause':
+                await asyncio.sleep(to_int(self.evaluate(args[0], line_number), line_number))
+            elif command == 'mpause':
+                await asyncio.sleep(to_int(self.evaluate(args[0], line_number), line_number) / 1000)
+            elif command in ('wait', 'waitln'):
+                targets = [str(value) for value in self.evaluate_all(args[0], line_number)]
+                line, index = await self.wait_for(lambda line: next(
+                    (i for i, target in enumerate(targets, 1) if target in line), 0))
+                self.variables['result'] = index
+                if command == 'waitln' and line is not None:
+                    self.variables['inputstr'] = line
+            elif command == 'waitregex':
+                pattern = str(self.evaluate_all(args[0], line_number)[0])
+                try:
+                    expression = re.compile(pattern)
+                except re.error as e:
+                    raise MacroError(line_number, f"bad regex {pattern!r}: {e}")
+                line, match = await self.wait_for(expression.search)
+                self.variables['result'] = 1 if match else 0
+                if match:
+                    self.variables['matchstr'] = match.group(0)
+                    self.variables['inputstr'] = line
+                    for i in range(1, 10):
+                        group = match.group(i) if i <= expression.groups else None
+                        self.variables[f'groupmatchstr{i}'] = group or ''
+            elif command == 'flushrecv':
+                self.lines.clear()
+            elif command == 'int2str':
+                self.variables[args[0]] = str(to_int(self.evaluate(args[1], line_number), line_number))
+            elif command == 'str2int':
+                text = str(self.evaluate(args[1], line_number)).strip()
+                try:
+                    self.variables[args[0]] = int(text[1:], 16) if text.startswith('$') else int(text)
+                    self.variables['result'] = 1
+                except ValueError:
+                    self.variables['result'] = 0
+            elif command == 'end':
+                break
+        self.message("Macro finished")
+
+    async def wait_for(self, test):
+        # Takes buffered lines until test(line) is true or the timeout expires.
+        # Returns (line, test result), or (None, 0) on timeout.
+        timeout_ms = (to_int(self.variables.get('timeout', 0), self.current_line) * 1000 +
+                      to_int(self.variables.get('mtimeout', 0), self.current_line))
+        deadline = time.monotonic() + timeout_ms / 1000 if timeout_ms > 0 else None
+        while True:
+            while self.lines:
+                line = self.lines.popleft()
+                result = test(line)
+                if result:
+                    return line, result
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None, 0
+            self.waiter = self.loop.create_future()
+            try:
+                if self.lines:
+                    continue  # Arrived before the waiter was set
+                await asyncio.wait_for(self.waiter, remaining)
+            except asyncio.TimeoutError:
+                return None, 0
+            finally:
+                self.waiter = None
+
+    def evaluate_all(self, expressions, line_number):
+        return [self.evaluate(expression, line_number) for expression in expressions]
+
+    def evaluate(self, expression, line_number):
+        kind = expression[0]
+        if kind == 'value':
+            return expression[1]
+        if kind == 'var':
+            try:
+                return self.variables[expression[1]]
+            except KeyError:
+                raise MacroError(line_number, f"variable {expression[1]} has no value")
+        if kind == 'unary':
+            operand = self.evaluate(expression[2], line_number)
+            if expression[1] == '!':
+                return int(not operand)
+            operand = to_int(operand, line_number)
+            if expression[1] == 'not':
+                return ~operand
+            return -operand if expression[1] == '-' else operand
+        left = self.evaluate(expression[2], line_number)
+        op = expression[1]
+        # && and || don't evaluate the right side when the left decides
+        if op == '&&' and not left:
+            return 0
+        if op == '||' and left:
+            return 1
+        return apply_binary(op, left, self.evaluate(expression[3], line_number), line_number)
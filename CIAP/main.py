@@ -1,12 +1,28 @@
 import tkinter as tk
-from tkinter import scrolledtext, filedialog, messagebox, simpledialog
-from tkinter import Text, END
-import serial
-import serial.tools.list_ports
-import threading
+from tkinter import scrolledtext, filedialog, messagebox, simpledialog, ttk
+from tkinter import END
+import os
+import socket
 import time
-import re
-import ansi2html
+import multiprocessing
+from reader import SerialReader, ANSI_ESCAPE, open_serial_port
+from net_reader import NetReader
+from port_monitor import PortMonitor, detect_port
+from capture import CaptureEngine
+from console import ConsoleFeed
+from log_viewer import LogViewer, SearchWindow
+from log_writer import TtyRecordWriter, format_entry, new_log_path, new_tty_record_path, open_log_writer
+from line_parser import RecordBus
+from filter_view import FilterPane, LineStore
+from dashboard import Dashboard
+from macro import Macro, MacroError, MacroRunner
+from replay import LogReplay
+from tty_replay import TtyReplay
+from can_capture import CanCapture
+from can_view import CanSimWindow, TimelineWindow
+import logger
+from colorizer import configure_tags, insert_args, export_html
+import settings
 
 class SerialUtility:
     def __init__(self, root):
@@ -22,6 +38,19 @@ class SerialUtility:
         self.serial_port = None
         self.log_file = None
         self.logging_active = False
+        self.reader = None
+        self.viewer_conn = None
+        self.capture_engine = None
+        self.capture_tabs = {}  # device -> (tab frame, ConsoleFeed)
+        self.capture_wanted = set()  # Devices to capture again when they are plugged back in
+        self.records = RecordBus()  # Typed records parsed from incoming lines, see line_parser
+        self.line_store = LineStore()  # Recent console lines for the filter panes
+        self.macro_runner = None
+        self.log_replay = None
+        self.tty_recorder = None
+        self.tty_player = None
+        self.can_window = None
+        self.can_capture = None
 
         # Create menu bar
         self.create_menu()
@@ -29,10 +58,9 @@ class SerialUtility:
         # Create GUI components
         self.create_widgets()
 
-        # Continuously check for available serial ports
-        self.check_ports_thread = threading.Thread(target=self.check_ports)
-        self.check_ports_thread.daemon = True
-        self.check_ports_thread.start()
+        # Watch for serial ports being plugged in and removed
+        self.port_monitor = PortMonitor(self.port_added, self.port_removed)
+        self.port_monitor.start()
 
     def create_menu(self):
         menu_bar = tk.Menu(self.root)
@@ -46,6 +74,7 @@ class SerialUtility:
         file_menu.add_command(label="Comment to Log", command=self.comment_to_log, accelerator="Ctrl+M")
         file_menu.add_command(label="View Log", command=self.view_log, accelerator="Ctrl+V")
         file_menu.add_command(label="Show Log Dialog", command=self.show_log_dialog, accelerator="Ctrl+Shift+L")
+        file_menu.add_command(label="Search Logs...", command=self.search_logs)
         file_menu.add_command(label="Send File", command=self.send_file, accelerator="Ctrl+S")
         file_menu.add_command(label="Transfer", command=self.transfer, accelerator="Ctrl+T")
         file_menu.add_command(label="SSH SCP", command=self.ssh_scp, accelerator="Ctrl+Shift+S")
@@ -54,6 +83,7 @@ class SerialUtility:
         file_menu.add_command(label="TTY Record", command=self.tty_record, accelerator="Ctrl+Shift+R")
         file_menu.add_command(label="TTY Replay", command=self.tty_replay, accelerator="Ctrl+Shift+E")
         file_menu.add_command(label="Print", command=self.print_log, accelerator="Alt+P")
+        file_menu.add_command(label="Export HTML", command=self.export_log_html)
         file_menu.add_separator()
         file_menu.add_command(label="Disconnect", command=self.disconnect, accelerator="Alt+1")
         file_menu.add_command(label="Exit", command=self.root.quit, accelerator="Alt+Q")
@@ -64,6 +94,7 @@ class SerialUtility:
         edit_menu.add_command(label="Copy", command=self.copy, accelerator="Alt+C")
         edit_menu.add_command(label="Paste", command=self.paste, accelerator="Alt+V")
         edit_menu.add_command(label="Clear Screen", command=self.clear_screen, accelerator="Alt+R")
+        edit_menu.add_command(label="Find...", command=self.find_in_log, accelerator="Ctrl+F")
         edit_menu.add_command(label="Clear Buffer", command=self.clear_buffer)
         edit_menu.add_command(label="Cancel Selection", command=self.cancel_selection)
         edit_menu.add_command(label="Select Screen", command=self.select_screen)
@@ -77,11 +108,26 @@ class SerialUtility:
         control_menu = tk.Menu(menu_bar, tearoff=0)
         control_menu.add_command(label="Start", command=self.start_logging, accelerator="Ctrl+Shift+S")
         control_menu.add_command(label="Stop", command=self.stop_logging, accelerator="Ctrl+Shift+Q")
+        control_menu.add_separator()
+        control_menu.add_command(label="Attach to Logger", command=self.attach_logger)
+        control_menu.add_command(label="Detach from Logger", command=self.detach_logger)
+        control_menu.add_separator()
+        control_menu.add_command(label="Capture Port...", command=self.capture_port)
+        control_menu.add_command(label="Stop Capture", command=self.stop_capture)
+        control_menu.add_separator()
+        control_menu.add_command(label="Run Macro...", command=self.run_macro)
+        control_menu.add_command(label="Stop Macro", command=self.stop_macro)
+        control_menu.add_separator()
+        control_menu.add_command(label="CAN Simulator...", command=self.can_simulator)
+        control_menu.add_command(label="CAN Capture...", command=self.can_capture_toggle)
         menu_bar.add_cascade(label="Control", menu=control_menu)
 
         windows_menu = tk.Menu(menu_bar, tearoff=0)
         windows_menu.add_command(label="Minimize", command=self.root.iconify, accelerator="Ctrl+M")
         windows_menu.add_command(label="Maximize", command=self.maximize_window, accelerator="Ctrl+Shift+M")
+        windows_menu.add_command(label="Filter View...", command=self.filter_view)
+        windows_menu.add_command(label="Dashboard", command=self.show_dashboard)
+        windows_menu.add_command(label="CAN Timeline...", command=self.can_timeline)
         menu_bar.add_cascade(label="Windows", menu=windows_menu)
 
         help_menu = tk.Menu(menu_bar, tearoff=0)
@@ -98,6 +144,7 @@ class SerialUtility:
         self.root.bind_all("<Control-m>", lambda e: self.comment_to_log())
         self.root.bind_all("<Control-v>", lambda e: self.view_log())
         self.root.bind_all("<Control-Shift-L>", lambda e: self.show_log_dialog())
+        self.root.bind_all("<Control-f>", lambda e: self.find_in_log())
         self.root.bind_all("<Control-s>", lambda e: self.send_file())
         self.root.bind_all("<Control-t>", lambda e: self.transfer())
         self.root.bind_all("<Control-Shift-S>", lambda e: self.ssh_scp())
@@ -121,34 +168,105 @@ class SerialUtility:
     def create_widgets(self):
         # Log console (80% of the screen) with black background to mimic a terminal
         # self.log_console = scrolledtext.ScrolledText(self.root, wrap=tk.WORD, bg="black", fg="white", font=("Consolas", 10))
-        self.log_console = scrolledtext.ScrolledText(self.root, wrap=tk.NONE, bg="black", fg="white", font=("Consolas", 10))
-        self.log_console.pack(expand=True, fill=tk.BOTH, padx=0, pady=0)  # Removed padding
-
-
-    def check_ports(self):
-        previous_ports = []
+        # One tab per session: the main console first, then one per captured port
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(expand=True, fill=tk.BOTH)
+        self.log_console = scrolledtext.ScrolledText(self.notebook, wrap=tk.NONE, bg="black", fg="white", font=("Consolas", 10))
+        self.notebook.add(self.log_console, text="Main")
+
+        # Colour lines by firmware module ([AIS], [CVP], [CAN], [NET], [PLA], [FOT])
+        configure_tags(self.log_console)
+
+        # Status bar with the console pipeline counters
+        self.status_var = tk.StringVar()
+        status_bar = tk.Label(self.root, textvariable=self.status_var, anchor="w", font=("Consolas", 9))
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_bar.pack_configure(before=self.notebook)
+
+        # Lines from worker threads are queued here and drained by the Tk main loop
+        self.console_feed = ConsoleFeed(self.root, self.log_console, self.status_var)
+        self.console_feed.status_sources.append(self.log_status)
+        self.console_feed.status_sources.append(self.macro_status)
+        self.console_feed.status_sources.append(self.replay_status)
+        self.console_feed.status_sources.append(self.tty_status)
+        self.console_feed.status_sources.append(self.can_status)
+        self.console_feed.status_sources.append(self.can_capture_status)
+        self.console_feed.status_sources.append(self.net_status)
+        self.console_feed.start()
+
+
+    def port_added(self, device, role, info):
+        # Called from the port monitor thread; only the trial device role is logged here.
+        # Tk is only touched from the Tk thread, so the rest is handed over with after().
+        if device in self.capture_wanted:
+            self.root.after(0, self.start_capture, device)
+            return
+        if role != "device" or self.logging_active:
+            return
+        port = self.open_port(device)  # May retry for a moment; not on the Tk thread
+        if port:
+            self.root.after(0, self.use_port, port)
+
+    def port_removed(self, device, role):
+        # Called from the port monitor thread
+        if self.capture_engine and self.capture_engine.find(device):
+            self.capture_engine.remove_port(device)
+            return
+        self.root.after(0, self.main_port_removed, device)
+        serial_port = self.serial_port
+        if serial_port and serial_port.port == device:
+            # Carry on with another trial device if one is still plugged in. It is opened
+            # here, as in port_added, and used after main_port_removed has stopped logging.
+            other = self.port_monitor.find("device")
+            if other:
+                port = self.open_port(other)  # May retry for a moment; not on the Tk thread
+                if port:
+                    self.root.after(0, self.use_port, port)
+
+    def main_port_removed(self, device):
+        if self.serial_port and self.serial_port.port == device:
+            self.root.title("AEPL Logger (Disconnected)")
+            self.stop_logging()  # Stop logging when the connection is lost
+
+    def open_port(self, device):
+        # A new node can appear a moment before udev has set its permissions; retry briefly
+        deadline = time.monotonic() + settings.PORT_OPEN_RETRY_MS / 1000.0
+        delay = 0.01
         while True:
             try:
-                ports = serial.tools.list_ports.comports()
-                current_ports = [port.device for port in ports]
-
-                # Check if a new port has been connected
-                if len(current_ports) > len(previous_ports):
-                    self.serial_port = serial.Serial(current_ports[-1], baudrate=115200, timeout=1)
-                    self.root.title("AEPL Logger (Connected)")
-                    self.start_logging()  # Only start logging when a connection is made
-
-                # Check if the port was disconnected
-                elif len(current_ports) < len(previous_ports) or not self.serial_port.is_open:
-                    self.root.title("AEPL Logger (Disconnected)")
-                    self.stop_logging()  # Stop logging when the connection is lost
-
-                previous_ports = current_ports
-                time.sleep(2)  # Check every 2 seconds
+                return open_serial_port(device)
             except Exception as e:
-                print(f"Error checking ports: {e}")
-                break  # Optionally break on error to avoid infinite loop
-
+                if time.monotonic() >= deadline:
+                    print(f"Error opening {device}: {e}")
+                    return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def connect_port(self, device):
+        port = self.open_port(device)
+        if port:
+            self.use_port(port)
+
+    def use_port(self, port):
+        if self.logging_active:
+            port.close()  # Another connection was made while this port was opening
+            return
+        self.serial_port = port
+        self.root.title("AEPL Logger (Connected)")
+        self.start_logging()  # Only start logging when a connection is made
+
+    def connect_tcp(self, host, port, telnet=True):
+        # Logs a device behind a serial-over-IP server (ser2net etc.) through the same
+        # pipeline as a serial port; the reader keeps reconnecting until disconnected
+        self.stop_logging()
+        if not self.log_file:
+            self.open_log_file(new_log_path())
+        self.logging_active = True
+        self.reader = NetReader(host, port, self.handle_line, self.console_feed.put, telnet=telnet,
+                                strip_ansi=False)
+        self.console_feed.put(f"Logging started ({'Telnet' if telnet else 'raw TCP'} {host}:{port})...")
+        self.root.title(f"AEPL Logger ({host}:{port})")
+        self.reader.start()
 
     def start_logging(self):
         if not self.serial_port or not self.serial_port.is_open:
@@ -157,88 +275,200 @@ class SerialUtility:
         
         # Only open a new log file if one is not already open
         if not self.log_file:
-            self.log_file = open(f"serial_log_{time.strftime('%Y%m%d_%H%M%S')}.log", 'a')
+            self.open_log_file(new_log_path())
 
         if not self.logging_active:
             self.logging_active = True
-            self.log_console.insert(tk.END, "Logging started...\n")
-            self.thread = threading.Thread(target=self.read_serial)
-            self.thread.daemon = True  # Ensure thread exits when main program exits
-            self.thread.start()
+            self.console_feed.put("Logging started...")
+            # Lines keep their ANSI codes for the console; the log file gets them stripped
+            self.reader = SerialReader(self.serial_port, self.handle_line, self.handle_reader_error,
+                                       strip_ansi=False)
+            self.reader.start()
 
     def stop_logging(self):
         if self.logging_active:
             self.logging_active = False
+            self.stop_tty_record()
+            if self.reader:
+                self.reader.stop()
+                self.reader = None
             if self.serial_port and self.serial_port.is_open:
                 self.serial_port.close()  # Close the serial port
             if self.log_file:
                 self.log_file.close()
                 self.log_file = None  # Reset the log file handler
 
-            self.log_console.insert(tk.END, "Logging stopped.\n")
-
-    def read_serial(self):
-        ansi_escape = re.compile(r'(?:\x1B[@-_][0-?]*[ -/]*[@-~])')
-        
-        while self.serial_port and self.serial_port.is_open:
-            try:
-                if self.serial_port.in_waiting > 0:  # Only read if there is data
-                    line = self.serial_port.readline()
-                    
-                    # Attempt to decode the line, handle decoding errors
-                    try:
-                        line = line.decode('utf-8').rstrip()
-                        line = ansi_escape.sub('', line)  # Remove ANSI codes
-                    except UnicodeDecodeError:
-                        line = "<Decoding Error>"
-                    
-                    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
-                    log_entry = f"{timestamp} - {line}"
-                    
-                    # Insert cleaned log entry into the console
-                    self.log_console.insert(tk.END, log_entry + '\n')
-                    self.log_console.yview(END)  # Auto-scroll to the end
-
-                    # Log to file if needed
-                    if self.log_file:
-                        self.log_file.write(log_entry + '\n')
-
-                time.sleep(0.1)  # Small delay to avoid CPU overuse
-                
-            except serial.SerialException as e:
-                print(f"Serial exception: {e}")
-                self.stop_logging()  # Stop logging if there's a serial exception
-                break
+            self.console_feed.put("Logging stopped.")
 
-            except Exception as e:
-                print(f"Error reading from serial: {e}")
-                self.stop_logging()
-                break  # Break the loop in case of an error
+    def handle_line(self, line, stamp=None):
+        # Called from the reader thread for every complete line
+        log_entry = format_entry(line, stamp)
+        if '\x1b' in line:
+            clean_line = ANSI_ESCAPE.sub('', line)
+            clean_entry = format_entry(clean_line, stamp)
+        else:
+            clean_line, clean_entry = line, log_entry
+
+        # Log the cleaned entry to file if needed, then queue the coloured one for the
+        # console; the GUI thread renders and inserts it
+        offset = self.write_log(clean_entry, stamp, clean_line)
+        self.console_feed.put(log_entry, offset)
+        self.line_store.append(clean_entry)  # Panes classify and filter the text without ANSI codes
+        self.records.publish("Main", clean_line, stamp)
+
+    def open_log_file(self, file_path):
+        self.log_file = open_log_writer(file_path, on_rotate=self.console_feed.set_history)
+        self.console_feed.set_history(file_path)
+
+    def write_log(self, entry, stamp=None, line=None):
+        # Returns the byte offset the entry starts at, so the console can page it back in
+        log_file = self.log_file
+        if not log_file:
+            return None
+        return log_file.write(entry, stamp, line)
+
+    def log_status(self):
+        log_file = self.log_file
+        return log_file.status_text() if log_file else ""
+
+    def handle_reader_error(self, error):
+        self.stop_logging()  # Stop logging if there's a serial exception
+
+    def attach_logger(self):
+        # View the output of a headless logger (logger.py) running on this machine or the Pi
+        address = simpledialog.askstring("Attach to Logger", "Logger address (host:port):",
+                                         initialvalue=f"127.0.0.1:{settings.LOGGER_VIEW_PORT}")
+        if not address:
+            return
+        host, _, port = address.rpartition(':')
+        try:
+            self.detach_logger()
+            self.viewer_conn = logger.attach(host or "127.0.0.1", int(port), self.console_feed.put,
+                                             lambda: self.console_feed.put("Detached from logger."))
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Attach to Logger", f"Could not attach to {address}: {e}")
+            return
+        self.console_feed.put(f"Attached to logger at {address}")
+        self.root.title("AEPL Logger (Attached)")
 
+    def detach_logger(self):
+        if self.viewer_conn:
+            try:
+                self.viewer_conn.shutdown(socket.SHUT_RDWR)  # Wakes the receiving thread
+                self.viewer_conn.close()
+            except OSError:
+                pass
+            self.viewer_conn = None
+            self.root.title("AEPL Logger (Disconnected)")
+
+
+    def capture_port(self):
+        # Capture another port in its own tab, alongside the main session
+        device = simpledialog.askstring("Capture Port", "Serial port to capture:",
+                                        initialvalue=detect_port() or "")
+        if device:
+            self.capture_wanted.add(device)
+            self.start_capture(device)
+
+    def start_capture(self, device):
+        # Runs on the Tk thread: the tab and its feed exist before the first line arrives
+        if self.capture_engine is None:
+            self.capture_engine = CaptureEngine(self.handle_capture_line, self.handle_capture_closed,
+                                                records=self.records)
+            self.capture_engine.start()
+        if self.capture_engine.find(device):
+            return
+        if self.serial_port and self.serial_port.is_open and self.serial_port.port == device:
+            messagebox.showerror("Capture Port", f"{device} is already open in the main session.")
+            return
+        frame, feed = self.capture_tab(device)
+        try:
+            session = self.capture_engine.add_port(device, on_rotate=feed.set_history)
+        except Exception as e:
+            feed.put(f"Error opening {device}: {e}")
+            return
+        # The tab outlives its session, so the status follows whichever session is current
+        feed.status_sources[:] = [session.status_text]
+        feed.set_history(session.log_file.path)
+        feed.put(f"Capturing {device}...")
+        self.notebook.select(frame)
+
+    def capture_tab(self, device):
+        tab = self.capture_tabs.get(device)
+        if tab is None:
+            frame = tk.Frame(self.notebook)
+            status_var = tk.StringVar()
+            tk.Label(frame, textvariable=status_var, anchor="w", font=("Consolas", 9)).pack(side=tk.BOTTOM, fill=tk.X)
+            console = scrolledtext.ScrolledText(frame, wrap=tk.NONE, bg="black", fg="white", font=("Consolas", 10))
+            console.pack(expand=True, fill=tk.BOTH)
+            configure_tags(console)
+            feed = ConsoleFeed(self.root, console, status_var)
+            feed.start()
+            self.notebook.add(frame, text=os.path.basename(device))
+            tab = self.capture_tabs[device] = (frame, feed)
+        return tab
+
+    def handle_capture_line(self, session, entry, offset):
+        # Called on the capture engine's thread
+        tab = self.capture_tabs.get(session.device)
+        if tab:
+            tab[1].put(entry, offset)
+
+    def handle_capture_closed(self, session, error):
+        tab = self.capture_tabs.get(session.device)
+        if tab:
+            tab[1].put(f"Capture of {session.device} stopped." if error is None
+                       else f"Capture of {session.device} stopped: {error}")
+
+    def stop_capture(self):
+        # Stops the port shown in the current tab and closes the tab
+        current = self.notebook.select()
+        for device, (frame, feed) in list(self.capture_tabs.items()):
+            if str(frame) == current:
+                self.capture_wanted.discard(device)
+                if self.capture_engine:
+                    self.capture_engine.remove_port(device)
+                feed.stop()
+                self.notebook.forget(frame)
+                frame.destroy()
+                del self.capture_tabs[device]
+                return
+        messagebox.showinfo("Stop Capture", "Select the tab of a captured port first.")
 
     def insert_ansi_text(self, widget, text):
-        # This function interprets ANSI escape sequences and inserts colored text
-        converter = ansi2html.Ansi2HTMLConverter()
-        html = converter.convert(text, full=False)  # Convert ANSI to HTML for color
-
-        # Extract the text between <span> tags and apply corresponding color tags in the widget
-        # Add parsing logic here based on your preference and desired colors
-        widget.insert(END, text)
+        # This function interprets ANSI escape sequences and inserts colored text,
+        # using the session's renderer so colour state carries across calls
+        widget.insert(END, *insert_args(text.splitlines(), self.console_feed.renderer.render))
         widget.yview(END)  # Scroll to the end
 
+    def export_log_html(self):
+        source_path = filedialog.askopenfilename(filetypes=[("Log Files", "*.log *.txt"), ("All Files", "*.*")])
+        if not source_path:
+            return
+        target_path = filedialog.asksaveasfilename(defaultextension=".html", filetypes=[("HTML Files", "*.html")])
+        if not target_path:
+            return
+        try:
+            export_html(source_path, target_path)
+            messagebox.showinfo("Export HTML", f"Log exported to {target_path}.")
+        except ImportError:
+            messagebox.showerror("Export HTML", "HTML export needs the ansi2html package (pip install ansi2html).")
+        except OSError as e:
+            messagebox.showerror("Export HTML", f"An error occurred while exporting the log: {e}")
+
     def browse_file(self):
         if self.log_file:
             self.log_file.close()
         file_path = filedialog.askopenfilename(defaultextension=".txt", filetypes=[("Text Files", "*.txt")])
         if file_path:
-            self.log_file = open(file_path, 'a')
+            self.open_log_file(file_path)
 
     def create_new_file(self):
         if self.log_file:
             self.log_file.close()
         file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text Files", "*.txt")])
         if file_path:
-            self.log_file = open(file_path, 'a')
+            self.open_log_file(file_path)
 
     def save_log(self):
         if self.log_file:
@@ -279,13 +509,17 @@ class SerialUtility:
         tcp_port_entry = tk.Entry(tcp_frame)
         tcp_port_entry.grid(row=1, column=1, padx=5, pady=5)
 
-        service_var = tk.StringVar(value="SSH")
+        service_var = tk.StringVar(value="Telnet")
         ssh_radio = tk.Radiobutton(tcp_frame, text="SSH", variable=service_var, value="SSH")
         ssh_radio.grid(row=2, column=0, padx=5, pady=5, sticky="w")
 
         telnet_radio = tk.Radiobutton(tcp_frame, text="Telnet", variable=service_var, value="Telnet")
         telnet_radio.grid(row=3, column=0, padx=5, pady=5, sticky="w")
 
+        # ser2net's "raw" ports: the bytes as they are, no telnet commands
+        raw_radio = tk.Radiobutton(tcp_frame, text="Raw TCP", variable=service_var, value="Raw")
+        raw_radio.grid(row=4, column=0, padx=5, pady=5, sticky="w")
+
         # Serial frame (hidden initially)
         serial_frame = tk.Frame(connection_window)
 
@@ -315,16 +549,21 @@ class SerialUtility:
                 port = tcp_port_entry.get()
                 if not host or not port:
                     messagebox.showerror("Input Error", "Host and Port must be provided for TCP/IP.")
-                else:
-                    # Here, you would connect using the TCP/IP details
-                    print(f"Connecting to {host}:{port} via {service_var.get()}")
+                    return
+                if not port.isdigit() or not 0 < int(port) < 65536:
+                    messagebox.showerror("Input Error", f"Not a TCP port number: {port}")
+                    return
+                if service_var.get() == "SSH":
+                    messagebox.showerror("New Connection", "SSH connections are not supported; use Telnet or Raw TCP.")
+                    return
+                self.connect_tcp(host, int(port), telnet=service_var.get() == "Telnet")
             else:
                 port = port_entry.get()
                 if not port:
                     messagebox.showerror("Input Error", "Port must be provided for Serial connection.")
-                else:
-                    # Here, you would connect using the Serial details
-                    print(f"Connecting via Serial on port {port}")
+                    return
+                self.stop_logging()
+                self.connect_port(port)
 
             connection_window.destroy()  # Close the dialog after connection
 
@@ -441,37 +680,162 @@ class SerialUtility:
     def comment_to_log(self):
         comment = simpledialog.askstring("Comment to Log", "Enter comment:")
         if comment:
-            self.log_console.insert(tk.END, f"# {comment}\n")
-            if self.log_file:
-                self.log_file.write(f"# {comment}\n")
+            offset = self.write_log(f"# {comment}")
+            self.console_feed.put(f"# {comment}", offset)
 
     def view_log(self):
         # Do not close the log file here; just open it for reading
-        file_path = filedialog.askopenfilename(defaultextension=".txt", filetypes=[("Text Files", "*.txt")])
-        if file_path:
-            with open(file_path, 'r') as file:
-                log_content = file.read()
-            log_window = tk.Toplevel(self.root)
-            log_window.title("View Log")
-            log_text = tk.Text(log_window, bg="white", fg="black", font=("Consolas", 10))
-            log_text.pack(expand=True, fill=tk.BOTH)
-            log_text.insert(tk.END, log_content)
-            log_text.config(state=tk.DISABLED)
+        self.open_log_viewer("View Log")
 
 
     def show_log_dialog(self):
-        # Do not close the log file here; just open it for reading
-        file_path = filedialog.askopenfilename(defaultextension=".txt", filetypes=[("Text Files", "*.txt")])
-        if file_path:
-            with open(file_path, 'r') as file:
-                log_content = file.read()
-            log_window = tk.Toplevel(self.root)
-            log_window.title("Log Dialog")
-            log_text = tk.Text(log_window, bg="white", fg="black", font=("Consolas", 10))
-            log_text.pack(expand=True, fill=tk.BOTH)
-            log_text.insert(tk.END, log_content)
-            log_text.config(state=tk.DISABLED)
+        self.open_log_viewer("Log Dialog")
+
+    def open_log_viewer(self, title):
+        # The viewer maps the file and only renders what is on screen, so any size opens at once
+        file_path = filedialog.askopenfilename(defaultextension=".log",
+                                               filetypes=[("Log Files", "*.log *.txt"), ("All Files", "*.*")])
+        if not file_path:
+            return
+        if file_path.endswith('.cap'):
+            messagebox.showinfo(title, "Binary captures need converting first:\n"
+                                       "python3 capture_file.py " + os.path.basename(file_path))
+            return
+        try:
+            LogViewer(self.root, file_path, title)
+        except OSError as e:
+            messagebox.showerror(title, f"Could not open {file_path}: {e}")
+
+
+    def find_in_log(self):
+        # Search the log being written, or pick one when nothing is being logged
+        log_file = self.log_file
+        if not log_file or log_file.path.endswith('.cap'):
+            self.open_log_viewer("Find")
+            return
+        log_file.flush()
+        try:
+            LogViewer(self.root, log_file.path, "Find")
+        except OSError as e:
+            messagebox.showerror("Find", f"Could not open {log_file.path}: {e}")
+
+    def run_macro(self):
+        # Runs a Tera Term macro against the main session's port; see macro.py
+        if self.macro_runner and self.macro_runner.running:
+            messagebox.showinfo("Run Macro", "A macro is already running.")
+            return
+        path = filedialog.askopenfilename(title="Select Macro File",
+                                          filetypes=[("TTL Files", "*.ttl"), ("All Files", "*.*")])
+        if not path:
+            return
+        try:
+            macro = Macro.load(path)
+        except (OSError, MacroError) as e:
+            messagebox.showerror("Run Macro", f"Can't load {os.path.basename(path)}: {e}")
+            return
+        runner = MacroRunner(macro, self.send_to_device, on_message=lambda text: self.console_feed.put(f"# {text}"),
+                             on_done=lambda error: self.records.unsubscribe_lines(runner.feed_line))
+        self.records.subscribe_lines(runner.feed_line)
+        self.macro_runner = runner
+        runner.start()
+
+    def stop_macro(self):
+        if self.macro_runner:
+            self.macro_runner.stop()
+
+    def send_to_device(self, data):
+        # Called on the macro's thread
+        reader = self.reader
+        if isinstance(reader, NetReader):
+            reader.write(data)
+            return
+        port = self.serial_port
+        if not port or not port.is_open:
+            raise OSError("no serial port is open")
+        port.write(data)
+
+    def macro_status(self):
+        runner = self.macro_runner
+        return runner.status_text() if runner else ""
+
+    def can_simulator(self):
+        # Sends the periodic messages of a DBC file on a CAN interface; see can_sim.py
+        if self.can_window:
+            self.can_window.window.lift()
+            return
+        path = filedialog.askopenfilename(title="Select DBC File",
+                                          filetypes=[("DBC Files", "*.dbc"), ("All Files", "*.*")])
+        if not path:
+            return
+        channel = simpledialog.askstring("CAN Simulator", "SocketCAN interface, or interface:channel for python-can:",
+                                         initialvalue=settings.CAN_CHANNEL)
+        if not channel:
+            return
+        self.can_window = CanSimWindow(self.root, path, channel, on_close=self.can_closed)
+
+    def can_closed(self):
+        self.can_window = None
+
+    def can_status(self):
+        window = self.can_window
+        return window.status_text() if window else ""
+
+    def can_capture_toggle(self):
+        # Starts recording the frames on a CAN interface next to the serial log, or
+        # stops it; see can_capture.py
+        if self.can_capture:
+            capture = self.can_capture
+            self.can_capture = None
+            capture.stop()
+            self.console_feed.put(f"CAN capture saved: {capture.path} ({capture.writer.frames} frames)")
+            return
+        channel = simpledialog.askstring("CAN Capture", "SocketCAN interface, or interface:channel for python-can:",
+                                         initialvalue=settings.CAN_CHANNEL)
+        if not channel:
+            return
+        try:
+            capture = CanCapture(channel, on_error=lambda e: self.console_feed.put(f"CAN capture stopped: {e}"))
+        except ImportError as e:
+            messagebox.showerror("CAN Capture", f"{e.name} is not installed (pip install {e.name}).")
+            return
+        except OSError as e:
+            messagebox.showerror("CAN Capture", f"Can't open {channel}: {e}")
+            return
+        self.can_capture = capture
+        capture.start()
+        self.console_feed.put(f"Capturing CAN on {channel} to {capture.path}")
+
+    def can_capture_status(self):
+        capture = self.can_capture
+        return capture.status_text() if capture else ""
+
+    def can_timeline(self):
+        # Serial logs and CAN captures merged by time, e.g. to see what was on the bus
+        # when the device logged a DTC; the DBC for decoding frames is optional
+        paths = filedialog.askopenfilenames(title="Select Serial Logs and CAN Captures",
+                                            filetypes=[("Logs and Captures", "*.log *.log.gz *.cap *.cap.gz"),
+                                                       ("All Files", "*.*")])
+        if not paths:
+            return
+        dbc_path = filedialog.askopenfilename(title="DBC File for Decoding (Cancel for none)",
+                                              filetypes=[("DBC Files", "*.dbc"), ("All Files", "*.*")])
+        try:
+            TimelineWindow(self.root, list(paths), dbc_path or None)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("CAN Timeline", f"Can't open: {e}")
+
+    def filter_view(self):
+        # Another pane on the main session, showing only the modules/levels/regex picked in it
+        FilterPane(self.root, self.line_store, "Filter - Main")
 
+    def show_dashboard(self):
+        # Trend plots of the main session's status records
+        Dashboard(self.root, self.records, "Main")
+
+    def search_logs(self):
+        directory = filedialog.askdirectory(title="Folder with logs to search")
+        if directory:
+            SearchWindow(self.root, directory)
 
     def send_file(self):
         # Placeholder for sending a file
@@ -495,28 +859,169 @@ class SerialUtility:
             messagebox.showinfo("Change Directory", f"Directory changed to {directory_path}.")
 
     def replay_log(self):
-        # Placeholder for replaying a log
-        messagebox.showinfo("Replay Log", "Replay Log functionality would go here.")
+        # Plays a recorded log into the main console, filter panes, dashboards and
+        # macros as if it were coming from the port; see replay.py. Replayed lines are
+        # not written to the log file.
+        if self.log_replay and self.log_replay.running:
+            messagebox.showinfo("Replay Log", "A log is already being replayed.")
+            return
+        path = filedialog.askopenfilename(title="Select Log to Replay",
+                                          filetypes=[("Log Files", "*.log *.log.gz *.cap"), ("All Files", "*.*")])
+        if not path:
+            return
+        try:
+            replay = LogReplay(path, self.handle_replayed_line,
+                               on_done=lambda: self.console_feed.put(f"Replay of {os.path.basename(path)} finished."))
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Replay Log", f"Can't open {os.path.basename(path)}: {e}")
+            return
+        self.log_replay = replay
+
+        window = tk.Toplevel(self.root)
+        window.title(f"Replay - {replay.name}")
+        window.resizable(False, False)
+        pause_text = tk.StringVar(value="Pause")
+
+        def toggle_pause():
+            replay.pause(not replay.paused)
+            pause_text.set("Resume" if replay.paused else "Pause")
+
+        def close():
+            replay.stop()
+            window.destroy()
+
+        tk.Button(window, textvariable=pause_text, width=8, command=toggle_pause).grid(row=0, column=0, padx=5, pady=5)
+        speed_var = tk.StringVar(value="1x")
+        speeds = {"1x": 1, "2x": 2, "5x": 5, "10x": 10, "100x": 100, "Max": 0}
+        tk.OptionMenu(window, speed_var, *speeds,
+                      command=lambda choice: replay.set_speed(speeds[choice])).grid(row=0, column=1, padx=5, pady=5)
+        tk.Button(window, text="Stop", width=8, command=close).grid(row=0, column=2, padx=5, pady=5)
+        seek_var = tk.DoubleVar(value=0)
+        seek_scale = tk.Scale(window, variable=seek_var, from_=0, to=100, orient=tk.HORIZONTAL, length=300,
+                              label="Seek (%)", state=tk.NORMAL if replay.source.seekable else tk.DISABLED)
+        seek_scale.grid(row=1, column=0, columnspan=3, padx=5, pady=5)
+        seek_scale.bind("<ButtonRelease-1>", lambda e: replay.seek(seek_var.get() / 100))
+        window.protocol("WM_DELETE_WINDOW", close)
+
+        self.console_feed.put(f"Replaying {path}")
+        replay.start()
+
+    def handle_replayed_line(self, entry, line, stamp):
+        # Called on the replay thread; like handle_line, minus the log file
+        self.console_feed.put(entry)
+        if '\x1b' in line:
+            entry = ANSI_ESCAPE.sub('', entry)
+            line = ANSI_ESCAPE.sub('', line)
+        self.line_store.append(entry)
+        self.records.publish("Main", line, stamp)
+
+    def replay_status(self):
+        replay = self.log_replay
+        return replay.status_text() if replay else ""
 
     def tty_record(self):
-        # Placeholder for TTY record functionality
-        messagebox.showinfo("TTY Record", "TTY Record functionality would go here.")
+        # Starts or stops recording the main port's raw byte stream, every chunk as
+        # read with its arrival time, for TTY Replay; see log_writer.TtyRecordWriter
+        if self.tty_recorder:
+            self.stop_tty_record()
+            return
+        if not self.reader or not self.logging_active:
+            messagebox.showerror("TTY Record", "Start logging a port first.")
+            return
+        path = filedialog.asksaveasfilename(title="Record TTY To", defaultextension=".cap",
+                                            initialfile=os.path.basename(new_tty_record_path()),
+                                            filetypes=[("Capture Files", "*.cap"), ("All Files", "*.*")])
+        if not path:
+            return
+        try:
+            port_name = self.reader.name if isinstance(self.reader, NetReader) else self.serial_port.port
+            self.tty_recorder = TtyRecordWriter(path, port_name=port_name)
+        except OSError as e:
+            messagebox.showerror("TTY Record", f"Can't create {path}: {e}")
+            return
+        self.reader.recorder = self.tty_recorder
+        self.console_feed.put(f"Recording raw TTY data to {path}")
+
+    def stop_tty_record(self):
+        recorder = self.tty_recorder
+        if not recorder:
+            return
+        if self.reader:
+            self.reader.recorder = None
+        self.tty_recorder = None
+        recorder.close()
+        self.console_feed.put(f"TTY recording saved: {recorder.path} ({recorder.chunks} chunks)")
 
     def tty_replay(self):
-        # Placeholder for TTY replay functionality
-        messagebox.showinfo("TTY Replay", "TTY Replay functionality would go here.")
+        # Plays a TTY recording into a pseudo-terminal at its recorded pace; this
+        # session (or any other tool) can then open the pty like a real port
+        if self.tty_player:
+            self.tty_player.close()
+            self.console_feed.put(f"TTY replay on {self.tty_player.device} closed.")
+            self.tty_player = None
+            return
+        if not hasattr(os, "openpty"):
+            messagebox.showerror("TTY Replay", "TTY replay needs pseudo-terminals (Linux or macOS).")
+            return
+        path = filedialog.askopenfilename(title="Select TTY Recording",
+                                          filetypes=[("Capture Files", "*.cap *.cap.gz"), ("All Files", "*.*")])
+        if not path:
+            return
+        speed = simpledialog.askfloat("TTY Replay", "Speed (1 = as recorded, 0 = as fast as possible):",
+                                      initialvalue=1.0, minvalue=0.0)
+        if speed is None:
+            return
+        try:
+            player = TtyReplay(path, speed=speed)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("TTY Replay", f"Can't replay {os.path.basename(path)}: {e}")
+            return
+        self.tty_player = player
+        self.console_feed.put(f"Replaying {path} on {player.device}")
+        if not (self.serial_port and self.serial_port.is_open) and messagebox.askyesno(
+                "TTY Replay", f"Replaying on {player.device}.\nConnect this session to it?"):
+            self.connect_port(player.device)
+        player.start()
+
+    def tty_status(self):
+        parts = [source.status_text() for source in (self.tty_recorder, self.tty_player) if source]
+        return "  |  ".join(parts)
 
     def print_log(self):
         # Placeholder for print functionality
         messagebox.showinfo("Print", "Print functionality would go here.")
 
+    def net_status(self):
+        reader = self.reader
+        return reader.status_text() if isinstance(reader, NetReader) else ""
+
     def disconnect(self):
+        if isinstance(self.reader, NetReader):
+            name = self.reader.name
+            self.stop_logging()
+            self.console_feed.put(f"Disconnected from {name}.")
+            self.root.title("AEPL Logger (Disconnected)")
+            return
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()
-        self.log_console.insert(tk.END, "Disconnected from serial port.\n")
+        self.console_feed.put("Disconnected from serial port.")
         self.root.title("AEPL Logger (Disconnected)")
 
     def exit_all(self):
+        self.stop_macro()
+        if self.can_capture:
+            self.can_capture.stop()
+        if self.can_window:
+            self.can_window.close()
+        self.stop_tty_record()
+        if self.tty_player:
+            self.tty_player.close()
+        if self.log_replay:
+            self.log_replay.stop()
+        if self.capture_engine:
+            self.capture_engine.stop()
+        if isinstance(self.reader, NetReader):
+            self.reader.stop()
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()
         if self.log_file:
@@ -538,7 +1043,7 @@ class SerialUtility:
             messagebox.showwarning("Paste", "Clipboard is empty or cannot be accessed.")
 
     def clear_screen(self):
-        self.log_console.delete(1.0, tk.END)
+        self.console_feed.clear()
 
     def clear_buffer(self):
         # Implement buffer clearing if needed
@@ -557,6 +1062,8 @@ class SerialUtility:
         self.root.state('zoomed')
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Log compression runs in worker processes
+    settings.load()
     root = tk.Tk()
     app = SerialUtility(root)
     root.mainloop()
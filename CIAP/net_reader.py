@@ -0,0 +1,291 @@
+# TCP/Telnet transport (File > New Connection, TCP/IP) for devices behind a
+# serial-over-IP server such as ser2net, in telnet or raw mode. NetReader takes the
+# place of SerialReader: the same splitter, decoding and on_line(line, stamp)
+# callback, so the console, log file, parser and macros work unchanged.
+#
+# The connection runs on its own asyncio loop thread. Telnet commands are stripped
+# from the stream by TelnetFilter, a byte-at-a-time state machine that carries its
+# state across reads, so a command split between two packets is still recognised.
+# TCP keepalive notices a server or network that went away without closing the
+# connection, and a dropped connection is retried with exponential backoff.
+import asyncio
+import random
+import socket
+import threading
+import time
+
+import settings
+from reader import decode_line, new_splitter
+
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+OPTION_BINARY = 0
+OPTION_ECHO = 1
+OPTION_SGA = 3  # Suppress go-ahead
+
+# Options we let the server turn on (WILL -> DO) and turn on ourselves (DO -> WILL)
+SERVER_OPTIONS = {OPTION_BINARY, OPTION_ECHO, OPTION_SGA}
+CLIENT_OPTIONS = {OPTION_BINARY, OPTION_SGA}
+
+# TelnetFilter states
+DATA, COMMAND, OPTION, SUBNEGOTIATION, SUBNEGOTIATION_IAC, CARRIAGE_RETURN = range(6)
+
+
+class TelnetFilter:
+    # feed(data) -> (data without telnet commands, replies to send back). Every
+    # WILL/WONT/DO/DONT is answered once per change of the option's state, so the two
+    # ends can't get into a negotiation loop.
+    def __init__(self):
+        self.state = DATA
+        self.verb = None
+        self.server_on = set()  # Options the server has on (agreed WILL)
+        self.client_on = set()  # Options we have on (agreed DO)
+        self.commands = 0
+
+    def feed(self, data):
+        if IAC not in data and self.state in (DATA, CARRIAGE_RETURN):
+            # Nearly every read: plain text, at most with a CR NUL to undo
+            ends_in_cr = data[-1:] == b'\r'
+            if self.state == CARRIAGE_RETURN and data[:1] == b'\x00':
+                data = data[1:]
+            if b'\r\x00' in data:
+                data = data.replace(b'\r\x00', b'\r')
+            self.state = CARRIAGE_RETURN if ends_in_cr else DATA
+            return data, b''
+        out = bytearray()
+        replies = bytearray()
+        state = self.state
+        for byte in data:
+            if state == DATA:
+                if byte == IAC:
+                    state = COMMAND
+                else:
+                    out.append(byte)
+                    if byte == 13:
+                        state = CARRIAGE_RETURN
+            elif state == CARRIAGE_RETURN:
+                # NVT sends a bare CR as CR NUL
+                state = DATA
+                if byte == IAC:
+                    state = COMMAND
+                elif byte != 0:
+                    out.append(byte)
+                    if byte == 13:
+                        state = CARRIAGE_RETURN
+            elif state == COMMAND:
+                if byte == IAC:
+                    out.append(IAC)  # Escaped 255
+                    state = DATA
+                elif byte in (WILL, WONT, DO, DONT):
+                    self.verb = byte
+                    state = OPTION
+                elif byte == SB:
+                    state = SUBNEGOTIATION
+                else:
+                    self.commands += 1  # NOP, GA, AYT, ...: nothing to do
+                    state = DATA
+            elif state == OPTION:
+                replies += self.negotiate(self.verb, byte)
+                state = DATA
+            elif state == SUBNEGOTIATION:
+                if byte == IAC:
+                    state = SUBNEGOTIATION_IAC
+            elif state == SUBNEGOTIATION_IAC:
+                # IAC SE ends it; IAC IAC is an escaped 255 inside it
+                state = DATA if byte == SE else SUBNEGOTIATION
+        self.state = state
+        return bytes(out), bytes(replies)
+
+    def negotiate(self, verb, option):
+        self.commands += 1
+        if verb == WILL:
+            if option in self.server_on:
+                return b''
+            if option in SERVER_OPTIONS:
+                self.server_on.add(option)
+                return bytes((IAC, DO, option))
+            return bytes((IAC, DONT, option))
+        if verb == WONT:
+            if option not in self.server_on:
+                return b''
+            self.server_on.discard(option)
+            return bytes((IAC, DONT, option))
+        if verb == DO:
+            if option in self.client_on:
+                return b''
+            if option in CLIENT_OPTIONS:
+                self.client_on.add(option)
+                return bytes((IAC, WILL, option))
+            return bytes((IAC, WONT, option))
+        # DONT
+        if option not in self.client_on:
+            return b''
+        self.client_on.discard(option)
+        return bytes((IAC, WONT, option))
+
+
+def set_keepalive(sock):
+    # TCP keepalive probes after NET_KEEPALIVE_S idle; where the options exist, the
+    # connection is given up after three unanswered probes
+    idle = settings.NET_KEEPALIVE_S
+    if not idle:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    interval = max(1, idle // 2)
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+    elif hasattr(socket, 'TCP_KEEPALIVE'):  # macOS
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+    elif hasattr(socket, 'SIO_KEEPALIVE_VALS'):  # Windows
+        sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle * 1000, interval * 1000))
+        return
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+class NetReader:
+    # Connects to host:port and keeps reconnecting until stop(). on_line(line, stamp)
+    # gets the time.monotonic_ns() at which the line's first byte was read, as with
+    # SerialReader; on_status(text) is told about connects and disconnects.
+    def __init__(self, host, port, on_line, on_status=None, telnet=True, strip_ansi=True, chunk_size=4096):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.on_line = on_line
+        self.on_status = on_status
+        self.telnet = telnet
+        self.strip_ansi = strip_ansi
+        self.chunk_size = chunk_size
+        self.recorder = None  # TtyRecordWriter getting the stream (telnet commands removed)
+        self.running = False
+        self.loop = None
+        self.task = None
+        self.thread = None
+        self.writer = None  # asyncio StreamWriter while connected
+        self.state = "connecting"
+        self.retry_at = None
+        self.lines_read = 0
+        self.bytes_read = 0
+        self.connects = 0
+
+    def start(self):
+        self.running = True
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.task = self.loop.create_task(self.keep_connected())
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.running = False
+            self.loop.close()
+
+    def stop(self):
+        self.running = False
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.task.cancel)
+            except RuntimeError:
+                pass  # Loop already closed
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+
+    def write(self, data):
+        # Thread safe; raises OSError while there is no connection
+        if self.writer is None:
+            raise OSError(f"not connected to {self.name}")
+        if self.telnet and IAC in data:
+            data = data.replace(b'\xff', b'\xff\xff')
+        self.loop.call_soon_threadsafe(self.send, data)
+
+    def send(self, data):
+        writer = self.writer
+        if writer is not None and not writer.is_closing():
+            writer.write(data)
+
+    def status(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+    async def keep_connected(self):
+        delay = settings.NET_RECONNECT_MIN_S
+        while self.running:
+            self.state = "connecting"
+            started = time.monotonic()
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                        settings.NET_CONNECT_TIMEOUT_S)
+            except (OSError, asyncio.TimeoutError) as e:
+                error = e if str(e) else "timed out"
+            else:
+                error = await self.session(reader, writer)
+            if not self.running:
+                break
+            if time.monotonic() - started > settings.NET_RECONNECT_MAX_S:
+                delay = settings.NET_RECONNECT_MIN_S  # It was up for a while: start over
+            wait = delay * random.uniform(0.8, 1.2)  # Jitter, so many loggers don't retry in step
+            self.state = "retrying"
+            self.retry_at = time.monotonic() + wait
+            self.status(f"{self.name}: {error}; retrying in {wait:.1f} s")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, settings.NET_RECONNECT_MAX_S)
+
+    async def session(self, reader, writer):
+        # Reads until the connection drops; returns why it ended
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            try:
+                set_keepalive(sock)
+            except OSError as e:
+                print(f"Error setting keepalive on {self.name}: {e}")
+        telnet = TelnetFilter() if self.telnet else None
+        splitter = new_splitter()
+        self.writer = writer
+        self.state = "connected"
+        self.connects += 1
+        self.status(f"Connected to {self.name}")
+        try:
+            while True:
+                data = await reader.read(self.chunk_size)
+                if not data:
+                    return "connection closed"
+                arrival = time.monotonic_ns()
+                self.bytes_read += len(data)
+                if telnet is not None:
+                    data, replies = telnet.feed(data)
+                    if replies:
+                        writer.write(replies)
+                    if not data:
+                        continue
+                recorder = self.recorder
+                if recorder:
+                    recorder.write_chunk(data, arrival)
+                for raw, stamp in splitter.feed(data, arrival):
+                    self.lines_read += 1
+                    self.on_line(decode_line(raw, self.strip_ansi), stamp)
+        except OSError as e:
+            return e
+        finally:
+            self.writer = None
+            writer.close()
+
+    def status_text(self):
+        if self.state == "retrying" and self.retry_at is not None:
+            state = f"retrying in {max(0.0, self.retry_at - time.monotonic()):.0f} s"
+        else:
+            state = self.state
+        return f"{self.name}: {state}  {self.bytes_read // 1024} KB  connects: {self.connects}"
@@ -0,0 +1,137 @@
+import threading
+
+import serial.tools.list_ports
+
+import settings
+
+
+def parse_roles(spec):
+    # "device=10c4:ea60; can_tool=0403:6001:FT5ABC12" -> [(role, vid, pid, serial), ...]
+    roles = []
+    for entry in spec.replace(',', ';').split(';'):
+        if '=' not in entry:
+            continue
+        role, _, match = entry.partition('=')
+        parts = match.strip().split(':')
+        try:
+            vid = int(parts[0], 16) if parts[0] else None
+            pid = int(parts[1], 16) if len(parts) > 1 and parts[1] else None
+        except ValueError:
+            print(f"Invalid port role: {entry.strip()}")
+            continue
+        serial_number = parts[2] if len(parts) > 2 and parts[2] else None
+        roles.append((role.strip(), vid, pid, serial_number))
+    return roles
+
+
+def port_role(info, roles):
+    # Role of a port from its USB VID/PID/serial number. Ports that match no rule are the
+    # trial device, unless a rule claims that role for a specific adapter.
+    for role, vid, pid, serial_number in roles:
+        if vid is not None and info.vid != vid:
+            continue
+        if pid is not None and info.pid != pid:
+            continue
+        if serial_number is not None and info.serial_number != serial_number:
+            continue
+        return role
+    if any(role == "device" for role, _, _, _ in roles):
+        return None
+    return "device"
+
+
+def detect_port(role="device"):
+    # Newest port with the role (the one the GUI has always picked up), without monitoring
+    roles = parse_roles(settings.PORT_ROLES)
+    devices = [info.device for info in serial.tools.list_ports.comports() if port_role(info, roles) == role]
+    return devices[-1] if devices else None
+
+
+class PortMonitor:
+    # Reports serial ports coming and going as on_added(device, role, info) and
+    # on_removed(device, role). Uses udev events when pyudev is available and falls back
+    # to polling comports() every PORT_POLL_MS. Errors are reported and monitoring goes on.
+    def __init__(self, on_added, on_removed):
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.roles = parse_roles(settings.PORT_ROLES)
+        self.ports = {}  # device -> (role, info)
+        self.lock = threading.Lock()
+        self.running = False
+        self.stopped = threading.Event()
+        self.thread = None
+        self.backend = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stopped.set()
+
+    def find(self, role="device"):
+        # Newest known port with the role
+        with self.lock:
+            devices = [device for device, (name, _) in self.ports.items() if name == role]
+        return devices[-1] if devices else None
+
+    def run(self):
+        # Ports that are already plugged in count as added
+        self.rescan()
+        monitor = None
+        try:
+            import pyudev
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by('tty')
+            monitor.start()
+            self.backend = "udev"
+        except Exception as e:
+            # ImportError without pyudev; OSError where netlink isn't available
+            print(f"udev port monitoring unavailable ({e}), polling every {settings.PORT_POLL_MS} ms")
+            monitor = None
+            self.backend = "poll"
+
+        while self.running:
+            try:
+                if monitor is not None:
+                    # A udev event only tells us something changed; rescan to get full port info
+                    event = monitor.poll(timeout=1.0)
+                    if event is not None and self.running:
+                        self.rescan()
+                else:
+                    self.stopped.wait(settings.PORT_POLL_MS / 1000.0)
+                    if self.running:
+                        self.rescan()
+            except Exception as e:
+                print(f"Error checking ports: {e}")
+                self.stopped.wait(1.0)
+
+    def rescan(self):
+        current = {}
+        for info in serial.tools.list_ports.comports():
+            current[info.device] = info
+
+        with self.lock:
+            removed = [(device, role) for device, (role, _) in self.ports.items() if device not in current]
+            added = []
+            for device, info in current.items():
+                if device not in self.ports:
+                    role = port_role(info, self.roles)
+                    added.append((device, role, info))
+                    self.ports[device] = (role, info)
+            for device, _ in removed:
+                del self.ports[device]
+
+        for device, role in removed:
+            self.notify(self.on_removed, device, role)
+        for device, role, info in added:
+            self.notify(self.on_added, device, role, info)
+
+    def notify(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Error handling port change for {args[0]}: {e}")
@@ -0,0 +1,228 @@
+import os
+import threading
+import re
+import time
+import serial
+
+import settings
+
+ANSI_ESCAPE = re.compile(r'(?:\x1B[@-_][0-?]*[ -/]*[@-~])')
+# "[NET] GSM_Rx(70): |" opens a block of exactly 70 bytes of modem traffic closed by "|"
+MODEM_BLOCK = re.compile(rb'(?:GSM_Rx|GSM_TX|AURC_RX)\((\d+)\): \|')
+MAX_MODEM_BLOCK = 64 * 1024  # Larger counts are taken to be garbage
+MODEM_SLACK = 4  # A closing "|" this many bytes early still ends the block (CRs the count missed)
+
+
+def open_serial_port(device, baudrate=115200):
+    # Exclusive on POSIX, so the GUI and the headless logger can't both read one port
+    if os.name == 'posix':
+        return serial.Serial(device, baudrate=baudrate, timeout=1, exclusive=True)
+    return serial.Serial(device, baudrate=baudrate, timeout=1)
+
+
+class SerialReader:
+    # Blocking, chunked reader: waits on the port for the first byte, then drains
+    # everything the driver has buffered in one read and splits it into lines itself.
+    # on_line(line, stamp) gets the time.monotonic_ns() at which the line's first byte
+    # was read.
+    def __init__(self, serial_port, on_line, on_error=None, chunk_size=4096, strip_ansi=True):
+        self.serial_port = serial_port
+        self.strip_ansi = strip_ansi
+        self.on_line = on_line
+        self.on_error = on_error
+        self.chunk_size = chunk_size
+        self.running = False
+        self.thread = None
+        self.lines_read = 0
+        self.bytes_read = 0
+        self.recorder = None  # TtyRecordWriter getting every chunk as read, if recording
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True  # Ensure thread exits when main program exits
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        # The blocking read returns within the port timeout; never join from our own thread
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+
+    def run(self):
+        port = self.serial_port
+        splitter = new_splitter()
+
+        while self.running and port and port.is_open:
+            try:
+                # Blocks (up to the port timeout) until at least one byte arrives,
+                # then takes whatever else is already waiting in the same call
+                data = port.read(max(1, min(port.in_waiting, self.chunk_size)))
+                if not data:
+                    continue
+                arrival = time.monotonic_ns()
+                self.bytes_read += len(data)
+                recorder = self.recorder
+                if recorder:
+                    recorder.write_chunk(data, arrival)
+
+                for raw, stamp in splitter.feed(data, arrival):
+                    self.lines_read += 1
+                    self.on_line(decode_line(raw, self.strip_ansi), stamp)
+
+            except serial.SerialException as e:
+                # Closing the port from stop() also lands here; only report real failures
+                if self.running:
+                    print(f"Serial exception: {e}")
+                    self.fail(e)
+                break
+
+            except Exception as e:
+                print(f"Error reading from serial: {e}")
+                self.fail(e)
+                break
+
+    def fail(self, error):
+        self.running = False
+        if self.on_error:
+            self.on_error(error)
+
+
+class LineSplitter:
+    # Splits chunks into lines, carrying the incomplete tail into the next chunk. Each
+    # line is paired with the arrival time of the chunk holding its first byte, so a
+    # line split across reads keeps the time it started arriving.
+    def __init__(self):
+        self.pending = b''
+        self.pending_since = None
+
+    def feed(self, data, arrival):
+        if self.pending:
+            data = self.pending + data
+            first = self.pending_since
+        else:
+            first = arrival
+        lines = data.split(b'\n')
+        self.pending = lines.pop()
+        if self.pending:
+            self.pending_since = first if not lines else arrival
+        if not lines:
+            return []
+        stamped = [(raw, arrival) for raw in lines]
+        stamped[0] = (lines[0], first)
+        return stamped
+
+
+def decode_line(raw, strip_ansi=True):
+    # Attempt to decode the line, handle decoding errors
+    try:
+        line = raw.decode('utf-8').rstrip()
+        if strip_ansi:
+            line = ANSI_ESCAPE.sub('', line)  # Remove ANSI codes
+        return line
+    except UnicodeDecodeError:
+        return "<Decoding Error>"
+
+
+class BlockSplitter(LineSplitter):
+    # LineSplitter that also reassembles the modem dumps the firmware prints, e.g.
+    #
+    #   INFO:  [NET] GSM_Rx(70): |
+    #   +QISTATE: 2,"TCP","20.219.88.214",6100,27521,4,1,2,1,"uart1"
+    #
+    #   OK
+    #   |
+    #
+    # into one line, "GSM_Rx(70): |\r\n+QISTATE: ...\r\n\r\nOK\r\n|", with the
+    # payload's CR, LF and backslashes escaped so the log stays one entry per line. The
+    # declared count says where the block ends, so a "|" inside the payload is fine.
+    # If the byte after the count isn't the closing "|", the block goes out as the
+    # ordinary lines it would have been. Every byte is looked at a fixed number of
+    # times; chunks without a "|" take LineSplitter's path unchanged.
+    def __init__(self):
+        super().__init__()
+        self.block_head = None   # Header line up to its opening "|", while in a block
+        self.block = bytearray()  # Payload so far, then the closing "|"
+        self.block_need = 0       # Bytes still to come, including the closing "|"
+        self.block_since = None
+
+    def feed(self, data, arrival):
+        if self.block_head is None and b'|' not in data and b'|' not in self.pending:
+            return LineSplitter.feed(self, data, arrival)
+
+        lines = []
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self.block_head is not None:
+                taken = data[pos:pos + self.block_need]
+                self.block += taken
+                self.block_need -= len(taken)
+                pos += len(taken)
+                if not self.block_need:
+                    self.close_block(lines)
+                continue
+
+            newline = data.find(b'\n', pos)
+            if newline < 0:
+                if not self.pending:
+                    self.pending_since = arrival
+                self.pending += data[pos:]
+                break
+            if self.pending:
+                raw = self.pending + data[pos:newline]
+                since = self.pending_since
+                self.pending = b''
+            else:
+                raw = data[pos:newline]
+                since = arrival
+            pos = newline + 1
+            if not self.open_block(raw, since):
+                lines.append((raw, since))
+        return lines
+
+    def open_block(self, raw, since):
+        # Starts a block if raw is a header whose payload runs past the end of the line
+        if b'|' not in raw:
+            return False
+        header = MODEM_BLOCK.search(raw)
+        if header is None:
+            return False
+        count = int(header.group(1))
+        after = raw[header.end():] + b'\n'  # Payload bytes already read
+        if count > MAX_MODEM_BLOCK or len(after) > count:
+            return False  # Closed on this line already (e.g. "GSM_Rx(0): ||") or nonsense
+        self.block_head = raw[:header.end()]
+        self.block = bytearray(after)
+        self.block_need = count + 1 - len(after)
+        self.block_since = since
+        return True
+
+    def close_block(self, lines):
+        block = bytes(self.block)
+        head = self.block_head
+        self.block_head = None
+        self.block = bytearray()
+        close = len(block) - 1 if block.endswith(b'|') else block.rfind(b'\n|', len(block) - 1 - MODEM_SLACK) + 1
+        if close > 0:
+            payload = block[:close].replace(b'\\', b'\\\\').replace(b'\r', b'\\r').replace(b'\n', b'\\n')
+            newline = block.find(b'\n', close)
+            if newline < 0:
+                # The rest of the closing line (normally just "\r") ends the entry
+                self.pending = head + payload + block[close:]
+            else:
+                parts = block[newline + 1:].split(b'\n')
+                self.pending = parts.pop()
+                lines.append((head + payload + block[close:newline], self.block_since))
+                lines.extend((part, self.block_since) for part in parts)
+            self.pending_since = self.block_since
+            return
+        # Count didn't match: hand the bytes on as the lines they were
+        parts = (head + block).split(b'\n')
+        self.pending = parts.pop()
+        self.pending_since = self.block_since
+        lines.extend((part, self.block_since) for part in parts)
+
+
+def new_splitter():
+    return BlockSplitter() if settings.FRAME_MODEM_BLOCKS else LineSplitter()
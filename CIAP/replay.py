@@ -0,0 +1,231 @@
+# Plays a recorded log back into the app (console, filter panes, parser, dashboards
+# and macros) at the pace it was recorded, N times faster, or as fast as possible:
+#
+#   python3 replay.py serial_log_20241007_151727.log --speed 0    (benchmark, no GUI)
+#
+# The log is read a line at a time, never loaded whole. Line n is due at
+#   start + (time of line n - time of the first line) / speed
+# measured from one anchor, so sleeping late for one line doesn't delay the rest.
+# The anchor moves only on a seek, a resume, a speed change, or when the log's clock
+# jumps backwards.
+import argparse
+import gzip
+import os
+import re
+import threading
+import time
+
+from capture_file import CaptureFile, record_text
+from timestamps import clock, line_time_ms
+
+LOG_PREFIX = re.compile(r'\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d{3})? [-:] ')
+
+
+class TextSource:
+    # (time ms, entry as logged, line without its timestamp) from a text log
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+        self.size = os.path.getsize(path)
+        self.seconds = {}
+        self.last_ms = None
+        self.seekable = not path.endswith('.gz')
+
+    def next(self):
+        raw = self.file.readline()
+        if not raw:
+            return None
+        entry = raw.decode('utf-8', 'replace').rstrip('\r\n')
+        stamp_ms = line_time_ms(entry, self.seconds)
+        if stamp_ms is None:
+            stamp_ms = self.last_ms  # Continuation lines go out with the line before
+            line = entry
+        else:
+            self.last_ms = stamp_ms
+            prefix = LOG_PREFIX.match(entry)
+            line = entry[prefix.end():] if prefix else entry
+        return stamp_ms, entry, line
+
+    def seek(self, fraction):
+        position = int(self.size * fraction)
+        self.file.seek(position)
+        if position:
+            self.file.readline()  # Partial line
+        self.last_ms = None
+
+    def position(self):
+        if self.file.closed:
+            return 1.0
+        return self.file.tell() / self.size if self.seekable and self.size else 0.0
+
+    def close(self):
+        self.file.close()
+
+
+class CaptureSource:
+    # The same for a binary capture; seeking goes through its time index
+    def __init__(self, path):
+        self.capture = CaptureFile(path)
+        self.records = self.capture.records()
+        self.seekable = bool(self.capture.index_times)
+        self.size = os.path.getsize(path)
+        self.offset = 0
+
+    def next(self):
+        record = next(self.records, None)
+        if record is None:
+            return None
+        self.offset, wall_ns, _, flags, payload = record
+        entry = record_text(wall_ns, flags, payload)
+        return wall_ns // 1_000_000, entry, entry[26:]  # After "YYYY-mm-dd HH:MM:SS.mmm - "
+
+    def seek(self, fraction):
+        times = self.capture.index_times
+        if times:
+            self.records = self.capture.records_from(int(times[0] + (times[-1] - times[0]) * fraction))
+
+    def position(self):
+        return self.offset / self.size if self.size else 0.0
+
+    def close(self):
+        self.capture.close()
+
+
+def open_source(path):
+    base = path[:-3] if path.endswith('.gz') else path
+    return CaptureSource(path) if base.endswith('.cap') else TextSource(path)
+
+
+class LogReplay:
+    # on_line(entry, line, stamp) is called on the replay thread for every line:
+    # entry as it was logged, line without the timestamp and stamp the recorded time
+    # as a time.monotonic_ns() value, the way the readers stamp live lines.
+    # on_done() is called once the log ends or the replay is stopped. speed 0 plays
+    # as fast as possible. source replaces the reader open_source() would pick.
+    def __init__(self, path, on_line, on_done=None, speed=1.0, source=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.on_line = on_line
+        self.on_done = on_done
+        self.source = source or open_source(path)
+        self.speed = speed
+        self.paused = False
+        self.running = False
+        self.seek_to = None
+        self.wake = threading.Event()  # Interrupts the wait for the next line
+        self.anchor = None             # (monotonic s, log ms) the schedule is measured from
+        self.thread = None
+
+        # Stats
+        self.lines = 0
+        self.late = 0                  # Lines sent more than 100 ms after they were due
+        self.rate_sample = (time.monotonic(), 0)
+        self.rate = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def pause(self, paused=True):
+        self.paused = paused
+        self.anchor = None
+        self.wake.set()
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self.anchor = None
+        self.wake.set()
+
+    def seek(self, fraction):
+        if self.source.seekable:
+            self.seek_to = min(max(fraction, 0.0), 1.0)
+            self.wake.set()
+
+    def run(self):
+        held = None  # Line read but not yet due when the wait was interrupted
+        try:
+            while self.running:
+                if self.seek_to is not None:
+                    self.source.seek(self.seek_to)
+                    self.seek_to = None
+                    self.anchor = None
+                    held = None
+                if self.paused:
+                    self.wake.wait()
+                    self.wake.clear()
+                    continue
+                item = held or self.source.next()
+                held = None
+                if item is None:
+                    break
+                stamp_ms = item[0]
+                speed = self.speed
+                if speed > 0 and stamp_ms is not None:
+                    anchor = self.anchor
+                    if anchor is None or stamp_ms < anchor[1]:
+                        anchor = self.anchor = (time.monotonic(), stamp_ms)
+                    delay = anchor[0] + (stamp_ms - anchor[1]) / 1000 / speed - time.monotonic()
+                    if delay > 0:
+                        if self.wake.wait(delay):
+                            self.wake.clear()
+                            held = item  # Paused, sought, stopped or sped up: decide again
+                            continue
+                    elif delay < -0.1:
+                        self.late += 1
+                self.send(item)
+        except Exception as e:
+            print(f"Error replaying {self.path}: {e}")
+        finally:
+            self.running = False
+            self.source.close()
+            if self.on_done:
+                self.on_done()
+
+    def send(self, item):
+        stamp_ms, entry, line = item
+        stamp = stamp_ms * 1_000_000 - clock.base[0] if stamp_ms is not None else time.monotonic_ns()
+        self.on_line(entry, line, stamp)
+        self.lines += 1
+
+    def status_text(self):
+        now = time.monotonic()
+        sampled_at, sampled_lines = self.rate_sample
+        if now - sampled_at >= 1.0:
+            self.rate = (self.lines - sampled_lines) / (now - sampled_at)
+            self.rate_sample = (now, self.lines)
+        speed = "max" if self.speed <= 0 else f"{self.speed:g}x"
+        state = "paused" if self.paused else "stopped" if not self.running else speed
+        return (f"Replay {self.name}: {self.source.position():.0%}  {self.lines} lines"
+                f"  {self.rate:.0f} lines/s  late: {self.late}  ({state})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a CIAP log to stdout at its recorded pace")
+    parser.add_argument("log", help="text log (.log, .log.gz) or capture (.cap)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = as recorded, 0 = as fast as possible")
+    parser.add_argument("--quiet", action="store_true", help="don't print the lines, only the rate")
+    args = parser.parse_args()
+
+    done = threading.Event()
+    replay = LogReplay(args.log, (lambda entry, line, stamp: None) if args.quiet
+                       else (lambda entry, line, stamp: print(entry)), done.set, args.speed)
+    start = time.perf_counter()
+    replay.start()
+    try:
+        done.wait()
+    except KeyboardInterrupt:
+        replay.stop()
+        done.wait(2)
+    elapsed = time.perf_counter() - start
+    print(f"{replay.lines} lines in {elapsed:.2f} s: {replay.lines / max(elapsed, 1e-9):,.0f} lines/s,"
+          f" {replay.late} late")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Tunables for the logger. Every value below can be overridden from a
+# ciap.ini file next to the executable, e.g.
+#
+#   [settings]
+#   gui_max_fps = 10
+#
+import configparser
+import os
+
+# GUI update pipeline
+GUI_MAX_FPS = 20             # Upper bound on console redraws per second
+GUI_QUEUE_LINES = 20000      # Lines buffered for the console before the oldest are dropped
+GUI_MAX_BATCH_LINES = 5000   # Lines inserted per frame at most
+
+# Console scrollback (0 = no limit); older lines are paged back in from the log file
+CONSOLE_SCROLLBACK_LINES = 10000
+CONSOLE_SCROLLBACK_BYTES = 0
+CONSOLE_PAGE_LINES = 1000    # Lines loaded from the log file per page when scrolling past the top
+
+# Serial input
+FRAME_MODEM_BLOCKS = 1       # Join GSM_Rx/GSM_TX/AURC_RX modem dumps into one line each (0 = off)
+
+# Filter panes (Windows > Filter View)
+FILTER_HISTORY_LINES = 200000  # Recent lines kept in memory for filtering
+FILTER_PANE_LINES = 5000       # Lines a pane shows at most
+
+# Log file writer
+LOG_FLUSH_MS = 200           # Write the buffer out at least this often
+LOG_FLUSH_KB = 64            # ...or as soon as this much is buffered
+LOG_FSYNC_MS = 1000          # fsync to the SD card at least this often
+LOG_FORMAT = "text"          # text, or binary for .cap capture files (see capture_file.py)
+CAPTURE_INDEX_RECORDS = 256  # Binary captures: add an index entry every this many records
+
+# Log rotation and retention (0 = disabled)
+LOG_ROTATE_MB = 50           # Start a new segment once the current one reaches this size
+LOG_ROTATE_MINUTES = 0       # ...or after this many minutes
+LOG_COMPRESS = "gzip"        # Compression for closed segments: gzip, zstd or none
+LOG_QUOTA_MB = 2048          # Delete the oldest closed segments once the directory's logs use more
+
+# Serial port detection
+PORT_POLL_MS = 250           # Poll interval when udev (pyudev) isn't available
+# Stable roles for USB adapters, matched on VID:PID[:serial], e.g.
+#   device=10c4:ea60; can_tool=0403:6001:FT5ABC12
+# Unmatched ports are the trial device unless a rule names the device role.
+PORT_ROLES = ""
+PORT_OPEN_RETRY_MS = 2000    # Keep retrying a new port this long (udev may not have set permissions yet)
+
+# Macros (Control > Run Macro)
+MACRO_BUFFER_LINES = 10000   # Received lines kept for wait/waitregex; older ones are dropped
+
+# Telemetry dashboard (Windows > Dashboard)
+DASHBOARD_POINTS = 600       # Points kept per plot; older samples are merged to stay within it
+DASHBOARD_FPS = 2            # Upper bound on dashboard redraws per second
+
+# CAN (Control > CAN Simulator / CAN Capture, Windows > CAN Timeline; can_sim.py, can_capture.py)
+CAN_CHANNEL = "vcan0"        # SocketCAN interface, or interface:channel for python-can (e.g. slcan:/dev/ttyACM0)
+CAN_BITRATE = 500000         # Bit rate for python-can adapters; SocketCAN interfaces are set up with ip link
+CAN_SPIN_US = 200            # Busy-wait this long before each deadline instead of sleeping (0 = sleep only)
+CAN_STATS_MS = 500           # How often the GUI's scheduling stats are refreshed
+TIMELINE_PAGE_LINES = 2000   # CAN timeline: merged lines read per page
+TIMELINE_MAX_LINES = 20000   # ...and kept in the window at most
+
+# Network connections (File > New Connection, TCP/IP; net_reader.py)
+NET_CONNECT_TIMEOUT_S = 5    # Give up on a connection attempt after this long
+NET_KEEPALIVE_S = 10         # Idle seconds before TCP keepalive probes start (0 = no keepalive)
+NET_RECONNECT_MIN_S = 0.5    # First wait before reconnecting a dropped connection...
+NET_RECONNECT_MAX_S = 30     # ...doubling on each failure up to this
+
+# Log search
+SEARCH_INDEX = 1             # Build a word index (<log>.tokens) while logging (0 = off)
+SEARCH_MAX_HITS = 10000      # Stop a search after this many matching lines
+SEARCH_WORKERS = 0           # Processes scanning a large log in parallel (0 = one per core)
+
+# Timestamps
+CLOCK_RESYNC_S = 60          # Re-anchor line timestamps to the wall clock this often (0 = never)
+
+# Headless logger (logger.py)
+LOGGER_VIEW_PORT = 47015     # Local TCP port the GUI attaches to as a viewer (0 = off)
+LOGGER_RETRY_S = 1.0         # Wait between attempts to find/open the serial port
+
+
+def load(path="ciap.ini"):
+    if not os.path.exists(path):
+        return
+    parser = configparser.ConfigParser()
+    try:
+        parser.read(path)
+    except configparser.Error as e:
+        print(f"Error reading {path}: {e}")
+        return
+    if not parser.has_section("settings"):
+        return
+
+    values = globals()
+    for key, raw in parser.items("settings"):
+        name = key.upper()
+        if name not in values or name.startswith("_") or callable(values[name]):
+            print(f"Unknown setting in {path}: {key}")
+            continue
+        default = values[name]
+        try:
+            if isinstance(default, bool):
+                values[name] = parser.getboolean("settings", key)
+            elif isinstance(default, (int, float)):
+                values[name] = type(default)(raw)
+            else:
+                values[name] = raw
+        except ValueError:
+            print(f"Invalid value for {key} in {path}: {raw}")
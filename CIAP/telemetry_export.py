@@ -0,0 +1,232 @@
+# Converts logs to columnar tables of the parsed telemetry (see line_parser), one
+# table per record type, so a field trial can be loaded into pandas in seconds:
+#
+#   python3 telemetry_export.py trial_logs/ -o trial_tables/ [--format arrow] [-j 4]
+#   pandas.read_parquet("trial_tables/accel")
+#
+# Inputs are text logs (also rotated .log.gz segments) and binary .cap captures, or
+# directories of them. Each log is converted by its own worker process and streams
+# into <output>/<type>/<folder>_<log name>_<hash>.parquet (or .arrow) in row groups of
+# EXPORT_BATCH_ROWS, so memory use doesn't grow with the log. The folder name and a hash
+# of the log's directory keep logs of the same name from different folders apart.
+# Every table has a "time" column (timestamp[ms] in the local time zone the logs were
+# written in, the time the line was logged) followed by the record's fields as
+# float64, int64 or string.
+#
+# Needs pyarrow (pip install pyarrow); it is only imported when exporting.
+import argparse
+import concurrent.futures
+import gzip
+import hashlib
+import multiprocessing
+import os
+import time
+
+from line_parser import RECORD_TYPES, parse_line
+from timestamps import line_time_ms
+
+EXPORT_BATCH_ROWS = 65536
+LOG_PATTERNS = ('.log', '.log.gz', '.cap', '.cap.gz')
+
+
+def local_timezone():
+    # The log's "YYYY-mm-dd HH:MM:SS" stamps are local time; they are stored as epoch ms,
+    # so the column is labelled with the local zone to show the same wall-clock times.
+    # The IANA name where the system has one ($TZ or /etc/localtime), else the current
+    # UTC offset.
+    import zoneinfo
+
+    name = os.environ.get('TZ', '').lstrip(':')
+    if not name:
+        target = os.path.realpath('/etc/localtime')
+        name = target.split('/zoneinfo/', 1)[1] if '/zoneinfo/' in target else ''
+    if name:
+        try:
+            zoneinfo.ZoneInfo(name)
+            return name
+        except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+            pass  # A POSIX TZ string like "IST-5:30"
+    offset = time.localtime().tm_gmtoff // 60
+    sign = '-' if offset < 0 else '+'
+    return f"{sign}{abs(offset) // 60:02d}:{abs(offset) % 60:02d}"
+
+
+class TableSink:
+    # Columns of one record type from one log, written out every EXPORT_BATCH_ROWS rows
+    def __init__(self, record_class, path, file_format):
+        import pyarrow as pa
+
+        arrow_types = {float: pa.float64(), int: pa.int64(), str: pa.string()}
+        self.schema = pa.schema([("time", pa.timestamp("ms", tz=local_timezone()))] +
+                                [(name, arrow_types[value_type])
+                                 for name, value_type in zip(record_class._fields, record_class.types)])
+        self.path = path
+        self.file_format = file_format
+        self.columns = [[] for _ in self.schema.names]
+        self.writer = None
+        self.rows = 0
+
+    def add(self, stamp_ms, record):
+        columns = self.columns
+        columns[0].append(stamp_ms)
+        for column, value in zip(columns[1:], record):
+            column.append(value)
+        if len(columns[0]) >= EXPORT_BATCH_ROWS:
+            self.write_batch()
+
+    def write_batch(self):
+        import pyarrow as pa
+
+        if not self.columns[0]:
+            return
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(self.columns, self.schema)],
+            schema=self.schema)
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if self.file_format == "arrow":
+                import pyarrow.ipc
+                self.writer = pyarrow.ipc.new_file(self.path, self.schema)
+            else:
+                import pyarrow.parquet
+                self.writer = pyarrow.parquet.ParquetWriter(self.path, self.schema, compression="zstd")
+        if self.file_format == "arrow":
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        self.rows += batch.num_rows
+        self.columns = [[] for _ in self.columns]
+
+    def close(self):
+        self.write_batch()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def text_lines(path):
+    # (time in ms or None, line) for each line of a text log
+    seconds = {}
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as log:
+        for raw in log:
+            line = raw.decode('utf-8', 'replace')
+            yield line_time_ms(line, seconds), line
+
+
+def capture_lines(path):
+    from capture_file import CaptureFile
+    from log_writer import RECORD_CAN
+
+    capture = CaptureFile(path)
+    try:
+        for _, wall_ns, _, flags, payload in capture.records():
+            if flags & RECORD_CAN:
+                continue  # CAN frames, not device lines
+            yield wall_ns // 1_000_000, payload.decode('utf-8', 'replace')
+    finally:
+        capture.close()
+
+
+def table_name(path):
+    # serial_log_20241004_155709 from trial_3/ -> trial_3_serial_log_20241004_155709_<hash>
+    name = os.path.basename(path)
+    for suffix in LOG_PATTERNS:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    directory = os.path.dirname(os.path.abspath(path))
+    digest = hashlib.sha1(directory.encode('utf-8', 'replace')).hexdigest()[:8]
+    return f"{os.path.basename(directory)}_{name}_{digest}"
+
+
+def export_log(path, output_dir, file_format="parquet"):
+    # Runs in a worker process. Returns {type: rows written} for the log.
+    name = table_name(path)
+    extension = ".arrow" if file_format == "arrow" else ".parquet"
+    lines = capture_lines(path) if path.endswith(('.cap', '.cap.gz')) else text_lines(path)
+
+    sinks = {}
+    try:
+        for stamp_ms, line in lines:
+            record = parse_line(line)
+            if record is None:
+                continue
+            sink = sinks.get(record.kind)
+            if sink is None:
+                sink = sinks[record.kind] = TableSink(
+                    RECORD_TYPES[record.kind], os.path.join(output_dir, record.kind, name + extension),
+                    file_format)
+            sink.add(stamp_ms, record)
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    return {kind: sink.rows for kind, sink in sinks.items()}
+
+
+def find_logs(paths):
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                               if name.endswith(LOG_PATTERNS)))
+        else:
+            logs.append(path)
+    return logs
+
+
+def export_logs(paths, output_dir, file_format="parquet", workers=None, on_done=None):
+    # Converts the logs in parallel, one per worker process. on_done(path, counts or
+    # exception) is called as each log finishes. Returns the total rows per type.
+    import pyarrow  # noqa: F401  Fail here, not once per worker
+
+    logs = find_logs(paths)
+    totals = {}
+    if not logs:
+        return totals
+    workers = min(workers or os.cpu_count() or 1, len(logs))
+    # spawn, not fork: this may be started from the GUI process
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(export_log, path, output_dir, file_format): path for path in logs}
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                counts = future.result()
+            except Exception as e:
+                if on_done:
+                    on_done(path, e)
+                continue
+            for kind, rows in counts.items():
+                totals[kind] = totals.get(kind, 0) + rows
+            if on_done:
+                on_done(path, counts)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export parsed CIAP telemetry to Parquet/Arrow tables")
+    parser.add_argument("logs", nargs="+", help="log files or directories of logs")
+    parser.add_argument("-o", "--output", default="telemetry", help="output directory (default: telemetry)")
+    parser.add_argument("--format", choices=("parquet", "arrow"), default="parquet")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    def report(path, result):
+        if isinstance(result, Exception):
+            print(f"Error exporting {path}: {result}")
+        else:
+            print(f"{path}: {sum(result.values())} records")
+
+    start = time.perf_counter()
+    try:
+        totals = export_logs(args.logs, args.output, args.format, args.jobs, report)
+    except ImportError:
+        print("Export needs the pyarrow package (pip install pyarrow).")
+        return
+    for kind, rows in sorted(totals.items()):
+        print(f"  {kind:<15}: {rows} rows -> {os.path.join(args.output, kind)}")
+    print(f"Done in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
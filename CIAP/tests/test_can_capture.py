@@ -0,0 +1,94 @@
+import pytest
+
+import settings
+
+SMALL_DBC = '''VERSION ""
+
+NS_ :
+
+BS_:
+
+BU_: SIM
+
+BO_ 512 Fast: 8 SIM
+ SG_ Counter : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+'''
+
+
+def write_text_log(path, start_ns, count, step_ms):
+    from timestamps import clock
+
+    with open(path, "w") as log:
+        for i in range(count):
+            log.write(f"{clock.format_wall(start_ns + i * step_ms * 1_000_000)} - INFO:  [CAN] line {i}\n")
+            if i % 100 == 0:
+                log.write("continued without a timestamp\n")
+
+
+def write_can_log(path, start_ns, count, step_ms):
+    from log_writer import CanLogWriter
+
+    writer = CanLogWriter(path, channel="vcan0")
+    offset = writer.clock_offset
+    for i in range(count):
+        wall_ns = start_ns + i * step_ms * 1_000_000 + 5_000_000
+        writer.write_frame(wall_ns - offset, 0x100, 0, bytes([i & 0xFF] * 8))
+    writer.close()
+
+
+@pytest.fixture
+def timeline_files(tmp_path, monkeypatch):
+    from can_capture import parse_time
+
+    monkeypatch.setattr(settings, "CAPTURE_INDEX_RECORDS", 16)
+    monkeypatch.setattr(settings, "SEARCH_INDEX", 0)
+    start_ns = parse_time("2024-10-07 15:54:00.000")
+    text = str(tmp_path / "serial_log_20241007_155400.log")
+    capture = str(tmp_path / "can_log_20241007_155400.cap")
+    write_text_log(text, start_ns, 3000, 10)  # Big enough for the binary search to seek
+    write_can_log(capture, start_ns, 3000, 10)
+    return text, capture, start_ns
+
+
+def test_merge_interleaves_by_time(timeline_files):
+    from can_capture import merge_timeline
+
+    text, capture, start_ns = timeline_files
+    events = list(merge_timeline([text, capture]))
+    times = [event[0] for event in events]
+    assert times == sorted(times)
+    assert len([event for event in events if event[1] == 1]) == 3000
+    frames = [event for event in events if event[3] is not None]
+    assert len(frames) == 3000 and frames[0][3] == (0x100, bytes(8))
+    # A text line at t, then the frame at t + 5 ms, then the next line
+    lines = [event for event in events if event[1] == 0 and event[2].startswith("INFO")]
+    assert lines[0][0] == start_ns and lines[0][2].endswith("line 0")
+    assert frames[0][0] == start_ns + 5_000_000
+    assert events.index(frames[0]) > events.index(lines[0])
+
+
+def test_merge_from_a_start_time(timeline_files):
+    from can_capture import event_text, merge_timeline, parse_time, source_name
+
+    text, capture, start_ns = timeline_files
+    from_ns = parse_time("2024-10-07 15:54:20.000")  # Line 2000
+    events = list(merge_timeline([text, capture], from_ns))
+    assert events[0][0] == from_ns and events[0][2].endswith("line 2000")
+    assert min(event[0] for event in events) >= from_ns
+    assert len([event for event in events if event[3] is not None]) == 1000
+    names = [source_name(text), source_name(capture)]
+    first_frame = next(event for event in events if event[3] is not None)
+    assert event_text(first_frame, names).startswith("2024-10-07 15:54:20.005 can_log_20241007_155400: CAN 100")
+
+
+def test_decoder_adds_signal_values(tmp_path):
+    pytest.importorskip("cantools")
+    from can_capture import CanDecoder
+
+    path = tmp_path / "test.dbc"
+    path.write_text(SMALL_DBC)
+    decoder = CanDecoder(str(path))
+    assert decoder.decode(0x200, bytes([7, 0, 0, 0, 0, 0, 0, 0])) == "Fast Counter=7"
+    assert decoder.decode(0x7FF, bytes(8)) == ""
+    with pytest.raises(ValueError):
+        CanDecoder(str(tmp_path / "missing.dbc")).decode(0x200, bytes(8))
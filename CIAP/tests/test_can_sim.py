@@ -0,0 +1,144 @@
+import os
+import random
+import time
+
+import pytest
+
+cantools = pytest.importorskip("cantools")
+
+from can_sim import SimMessage  # noqa: E402
+
+DBC = '''VERSION ""
+
+NS_ :
+
+BS_:
+
+BU_: SIM
+
+BO_ 256 Mixed: 8 SIM
+ SG_ IntelUnsigned : 0|12@1+ (1,0) [0|4095] "" Vector__XXX
+ SG_ IntelSigned : 14|10@1- (0.5,-10) [-266|245.5] "" Vector__XXX
+ SG_ MotorolaUnsigned : 39|16@0+ (0.25,0) [0|16383.75] "" Vector__XXX
+ SG_ MotorolaSigned : 55|7@0- (1,0) [-64|63] "" Vector__XXX
+
+BO_ 2566834709 Muxed: 8 SIM
+ SG_ Selector M : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+ SG_ PageA m0 : 8|16@1+ (1,0) [0|65535] "" Vector__XXX
+ SG_ PageB m1 : 23|12@0- (1,0) [-2048|2047] "" Vector__XXX
+ SG_ Always : 56|8@1+ (1,0) [0|255] "" Vector__XXX
+
+BO_ 512 Fast: 8 SIM
+ SG_ Counter : 0|8@1+ (1,0) [0|255] "" Vector__XXX
+
+BA_DEF_ BO_ "GenMsgCycleTime" INT 0 65535;
+BA_DEF_DEF_ "GenMsgCycleTime" 0;
+BA_ "GenMsgCycleTime" BO_ 256 10;
+BA_ "GenMsgCycleTime" BO_ 2566834709 20;
+BA_ "GenMsgCycleTime" BO_ 512 5;
+'''
+
+
+@pytest.fixture
+def database():
+    return cantools.database.load_string(DBC, 'dbc')
+
+
+def random_raw(signal, rng):
+    if signal.is_signed:
+        return rng.randint(-(1 << signal.length - 1), (1 << signal.length - 1) - 1)
+    return rng.randint(0, (1 << signal.length) - 1)
+
+
+def test_encoder_matches_cantools(database):
+    rng = random.Random(1)
+    for message in database.messages:
+        sim = SimMessage(message)
+        for _ in range(1000):
+            values = {}
+            for name, signal in sim.signals.items():
+                if signal.is_multiplexer:
+                    raw = rng.choice([0, 1])
+                else:
+                    raw = random_raw(message.get_signal_by_name(name), rng)
+                signal.value = raw * signal.scale + signal.offset
+                values[name] = signal.value
+            if sim.multiplexer:
+                sim.encoder = None  # The multiplexer may have changed
+                selector = int(values[sim.multiplexer.name])
+                values = {name: value for name, value in values.items()
+                          if sim.signals[name].mux_ids is None or selector in sim.signals[name].mux_ids}
+            expected = message.encode(values, scaling=True, strict=False)
+            assert sim.encode() == expected, (message.name, values)
+
+
+def timing_skip(cores=2):
+    if os.environ.get("CIAP_SKIP_TIMING"):
+        return "CIAP_SKIP_TIMING is set"
+    if (os.cpu_count() or 1) < cores:
+        return "needs a second core for the scheduler thread"
+    return None
+
+
+def run_simulator(database, seconds, periods_ms=None):
+    pytest.importorskip("can")
+    from can_sim import CanSimulator, PythonCanBus
+
+    messages = [SimMessage(message) for message in database.messages]
+    for message in messages:
+        if periods_ms:
+            message.period_ns = periods_ms[message.name] * 1_000_000
+            message.enabled = True
+    channel = f"ciap_test_{os.getpid()}_{time.monotonic_ns()}"
+    bus = PythonCanBus("virtual", channel)
+    listener = PythonCanBus("virtual", channel)
+    simulator = CanSimulator(messages, bus)
+    received = {}
+    try:
+        simulator.stats()
+        simulator.start()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            frame = listener.recv(0.1)
+            if frame is not None:
+                received[frame[0] & 0x1FFFFFFF] = received.get(frame[0] & 0x1FFFFFFF, 0) + 1
+        stats = simulator.stats()
+    finally:
+        simulator.stop()
+        bus.close()
+        listener.close()
+    return messages, received, stats
+
+
+def test_scheduler_sends_each_message_at_its_cycle(database):
+    messages, received, stats = run_simulator(database, 2.0)
+    for message in messages:
+        expected = 2000 / (message.period_ns / 1e6)
+        # Received within the window, allowing for start-up and frames still queued
+        assert expected * 0.8 <= received.get(message.frame_id, 0) <= expected * 1.05, message.name
+        assert message.sent + message.skipped >= expected * 0.9
+    assert stats['errors'] == 0
+
+
+@pytest.mark.skipif(timing_skip() is not None, reason=str(timing_skip()))
+def test_scheduler_jitter_under_a_millisecond(database):
+    # About 1,800 frames/s, with a core for the scheduler thread to itself
+    _, _, stats = run_simulator(database, 3.0, {"Mixed": 1, "Muxed": 2, "Fast": 5})
+    assert stats['rate'] > 1500
+    assert stats['p99_us'] < 1000, stats
+    assert stats['skipped'] == 0, stats
+
+
+@pytest.mark.skipif(timing_skip(1) is not None, reason=str(timing_skip(1)))
+def test_scheduler_jitter_on_one_core(database):
+    # The same load with the scheduler, the listener and the interpreter sharing one
+    # core, as on the single-core target. Measured on a single-core VM:
+    # 1,610-1,660 frames/s, mean lateness 70-160 us, p99 2.0-3.9 ms, max 8.7-11.2 ms
+    # and 3-7% of cycles skipped. The bounds below leave 2-3x headroom over that; the
+    # < 1 ms figure only holds with a second core.
+    _, _, stats = run_simulator(database, 3.0, {"Mixed": 1, "Muxed": 2, "Fast": 5})
+    cycles = stats['sent'] + stats['skipped']
+    assert stats['rate'] > 1400, stats
+    assert stats['mean_us'] < 500, stats
+    assert stats['p99_us'] < 10000, stats
+    assert stats['skipped'] < cycles * 0.15, stats
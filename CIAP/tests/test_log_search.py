@@ -0,0 +1,86 @@
+import os
+import pickle
+
+import pytest
+
+import log_search
+from log_search import TokenIndex, find_index, search_file
+
+REPO = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SAMPLE_LOG = os.path.join(REPO, "CIAP Make Change Files", "serial_log_20241004_155709.log")
+QUERIES = ["[NET]", "+QISTATE:", "GSM_Rx(70)", "DTC_Code:0x900200"]
+LINES = [
+    "2024-10-04 15:57:14 - INFO:  [NET] GSM_Rx(70): |",
+    '2024-10-04 15:57:14 - +QISTATE: 2,"TCP","20.219.88.214",6100,27521,4,1,2,1,"uart1"',
+    "2024-10-04 15:57:15 - ERROR: [CAN] DTC_Code:0x900200",
+    "2024-10-04 15:57:15 - INFO:  [NETWORK] GSM_Rx(700): XDTC_Code:0x9002001",
+]
+
+
+def write_log(tmp_path, lines):
+    path = str(tmp_path / "serial_log_20241004_155709.log")
+    with open(path, "w") as log:
+        log.write("\n".join(lines) + "\n")
+    return path
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_queries_with_punctuation_at_the_ends(tmp_path, query):
+    path = write_log(tmp_path, LINES * 3)
+    hits = search_file(path, query)
+    # The last line only has them inside longer words
+    assert [line for _, line in hits] == [line for line in LINES[:3] * 3 if query in line]
+
+
+def test_word_queries_still_match_whole_words(tmp_path):
+    path = write_log(tmp_path, LINES)
+    assert len(search_file(path, "NET")) == 1
+    assert len(search_file(path, "GSM_Rx")) == 2
+    assert search_file(path, "QISTAT") == []
+
+
+@pytest.mark.skipif(not os.path.exists(SAMPLE_LOG), reason="sample log not in this checkout")
+@pytest.mark.parametrize("query", QUERIES)
+def test_sample_log_hits_every_line_containing_the_query(query):
+    with open(SAMPLE_LOG, "rb") as log:
+        expected = sum(query.lower().encode() in line.lower() for line in log)
+    assert len(search_file(SAMPLE_LOG, query, max_hits=10 ** 6)) == expected
+
+
+def test_token_index_round_trip(tmp_path):
+    path = write_log(tmp_path, LINES)
+    index = TokenIndex()
+    with open(path, "rb") as log:
+        index.add(log.read(), 0)
+    index.save(path + ".tokens")
+    loaded = find_index(path)
+    assert loaded is not None
+    assert {token: list(blocks) for token, blocks in loaded.blocks.items()} == \
+        {token: list(blocks) for token, blocks in index.blocks.items()}
+    assert [line for _, line in search_file(path, "[NET]")] == [LINES[0]]
+
+
+class Exploit:
+    def __reduce__(self):
+        return (os.system, ("touch exploited",))
+
+
+def test_pickled_index_is_never_loaded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = write_log(tmp_path, LINES)
+    with open(path + ".tokens", "wb") as index_file:
+        pickle.dump(Exploit(), index_file)
+    assert find_index(path) is None
+    assert not os.path.exists("exploited")
+    assert len(search_file(path, "[NET]")) == 1  # Falls back to scanning
+
+
+def test_truncated_index_is_ignored(tmp_path):
+    path = write_log(tmp_path, LINES)
+    index = TokenIndex()
+    with open(path, "rb") as log:
+        index.add(log.read(), 0)
+    index.save(path + ".tokens")
+    with open(path + ".tokens", "r+b") as index_file:
+        index_file.truncate(log_search.TOKENS_HEADER.size + 3)
+    assert find_index(path) is None
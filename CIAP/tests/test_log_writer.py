@@ -0,0 +1,63 @@
+import os
+import time
+
+import log_writer
+import settings
+
+MB = 1024 * 1024
+
+
+def make(path, size, age_s=3600):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    stamp = time.time() - age_s
+    os.utime(path, (stamp, stamp))
+
+
+def test_quota_covers_every_session_and_port(tmp_path, monkeypatch):
+    # Four closed sessions (two of them other ports) of 1 MB each against a 3 MB quota
+    monkeypatch.setattr(settings, "LOG_QUOTA_MB", 3)
+    oldest = str(tmp_path / "serial_log_20241005_090000.log.gz")
+    older = str(tmp_path / "serial_log_COM3_20241005_100000.cap")
+    newer = str(tmp_path / "serial_log_20241006_090000_20241006_100000.log")
+    newest = str(tmp_path / "serial_log_ttyUSB1_20241007_090000.log")
+    for age, path in enumerate((newest, newer, older, oldest)):
+        make(path, MB, age_s=3600 * (age + 1))
+    make(older + ".idx", 100)
+    make(str(tmp_path / "notes.log"), 5 * MB)  # Not a log segment
+    current = str(tmp_path / "serial_log_20241008_090000.log")
+    make(current, 10, age_s=0)
+
+    log_writer.enforce_quota(current)
+
+    assert not os.path.exists(oldest) and not os.path.exists(older)
+    assert not os.path.exists(older + ".idx")
+    assert os.path.exists(newer) and os.path.exists(newest)
+    assert os.path.exists(current) and os.path.exists(str(tmp_path / "notes.log"))
+
+
+def test_quota_never_deletes_open_pending_or_recent_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOG_QUOTA_MB", 1)
+    open_elsewhere = str(tmp_path / "serial_log_20241005_090000.log")
+    pending = str(tmp_path / "serial_log_20241005_100000.log")
+    recent = str(tmp_path / "serial_log_20241005_110000.log")  # e.g. the headless logger's
+    closed = str(tmp_path / "serial_log_20241005_120000.log")
+    for path in (open_elsewhere, pending, closed):
+        make(path, MB)
+    make(recent, MB, age_s=1)
+    monkeypatch.setattr(log_writer, "compress_pending", {os.path.abspath(pending)})
+    writer = log_writer.LogWriter(open_elsewhere)  # Opening applies the quota too
+    try:
+        log_writer.enforce_quota(str(tmp_path / "serial_log_20241008_090000.log"))
+        assert os.path.exists(open_elsewhere) and os.path.exists(pending) and os.path.exists(recent)
+        assert not os.path.exists(closed)
+    finally:
+        writer.close()
+
+
+def test_rotated_segments_are_named_after_the_session(tmp_path):
+    session = str(tmp_path / "serial_log_COM3_20241007_151727")
+    path = log_writer.next_segment_path(session, ".log")
+    assert os.path.basename(path).startswith("serial_log_COM3_20241007_151727_")
+    make(path, 1)
+    assert path in list(log_writer.log_segments(str(tmp_path)))
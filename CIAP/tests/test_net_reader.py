@@ -0,0 +1,158 @@
+# NetReader against a loopback stand-in for ser2net in telnet mode
+import asyncio
+import threading
+import time
+
+import pytest
+
+import settings
+from net_reader import DO, DONT, IAC, SB, SE, WILL, WONT, NetReader, TelnetFilter
+
+OPTION_TTYPE = 24
+NEGOTIATION = bytes([IAC, WILL, 1, IAC, WILL, 3, IAC, DO, OPTION_TTYPE, IAC, DO, 3])
+ANSWERS = bytes([IAC, DO, 1, IAC, DO, 3, IAC, WONT, OPTION_TTYPE, IAC, WILL, 3])
+STREAM = (NEGOTIATION + bytes([IAC, SB, OPTION_TTYPE, 1, IAC, IAC, IAC, SE])
+          + b'abc\xff\xffdef\r\x00x\r\n' + bytes([IAC, WILL, 1, IAC, 241]) + b'end')
+
+
+@pytest.mark.parametrize("step", [1, 2, 3, 5, len(STREAM)])
+def test_filter_handles_commands_split_across_reads(step):
+    telnet = TelnetFilter()
+    data = replies = b''
+    for i in range(0, len(STREAM), step):
+        out, answer = telnet.feed(STREAM[i:i + step])
+        data += out
+        replies += answer
+    assert data == b'abc\xffdef\rx\r\nend'
+    assert replies == ANSWERS  # The repeated WILL ECHO isn't answered again
+
+
+def test_filter_answers_each_change_once():
+    telnet = TelnetFilter()
+    assert telnet.feed(bytes([IAC, WILL, 1]))[1] == bytes([IAC, DO, 1])
+    assert telnet.feed(bytes([IAC, WILL, 1]))[1] == b''
+    assert telnet.feed(bytes([IAC, WONT, 1]))[1] == bytes([IAC, DONT, 1])
+    assert telnet.feed(bytes([IAC, WONT, 1]))[1] == b''
+    assert telnet.feed(bytes([IAC, WILL, 5]))[1] == bytes([IAC, DONT, 5])  # Not one we want
+    assert telnet.feed(bytes([IAC, DO, 0]))[1] == bytes([IAC, WILL, 0])
+    assert telnet.feed(bytes([IAC, DONT, 0]))[1] == bytes([IAC, WONT, 0])
+
+
+def test_filter_plain_text_keeps_cr_nul_state_across_reads():
+    telnet = TelnetFilter()
+    assert telnet.feed(b'one\r') == (b'one\r', b'')
+    assert telnet.feed(b'\x00two\r\x00\r\n') == (b'two\r\r\n', b'')
+    assert telnet.feed(b'\x00') == (b'\x00', b'')  # Not after a CR: data
+
+
+class Ser2netStandIn:
+    # Per connection: negotiates, sends lines split over two writes with an escaped
+    # 0xFF, collects what the client sends, and drops the first connection
+    def __init__(self):
+        self.received = []
+        self.ready = threading.Event()
+        self.loop = None
+        self.port = None
+
+    async def handle(self, reader, writer):
+        number = len(self.received)
+        received = bytearray()
+        self.received.append(received)
+        writer.write(NEGOTIATION)
+        for i in range(5):
+            line = f"session {number} line {i} ".encode() + b'\xff\xff\r\n'
+            writer.write(line[:len(line) // 2])
+            await writer.drain()
+            await asyncio.sleep(0.01)
+            writer.write(line[len(line) // 2:])
+            await writer.drain()
+        end = time.monotonic() + (0.5 if number == 0 else 10)
+        while time.monotonic() < end:
+            try:
+                data = await asyncio.wait_for(reader.read(100), 0.1)
+            except asyncio.TimeoutError:
+                continue
+            if not data:
+                break
+            received += data
+        writer.close()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(self.handle, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+        server.close()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        self.ready.wait(5)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.02)
+    return condition()
+
+
+class Recorder:
+    def __init__(self):
+        self.chunks = []
+
+    def write_chunk(self, data, stamp):
+        self.chunks.append(data)
+
+
+def test_reader_negotiates_reads_writes_and_reconnects(monkeypatch):
+    monkeypatch.setattr(settings, "NET_RECONNECT_MIN_S", 0.1)
+    server = Ser2netStandIn()
+    server.start()
+    lines = []
+    statuses = []
+    reader = NetReader('127.0.0.1', server.port, lambda line, stamp: lines.append((line, stamp)),
+                       statuses.append)
+    reader.recorder = Recorder()
+    reader.start()
+    try:
+        assert wait_for(lambda: reader.connects == 2 and len(lines) == 10)
+        assert wait_for(lambda: reader.writer is not None)
+        reader.write(b'AT\xff\r\n')
+        assert wait_for(lambda: server.received[1].endswith(b'AT\xff\xff\r\n'))
+    finally:
+        reader.stop()
+        server.stop()
+    assert not reader.thread.is_alive()
+    stream = b''.join(reader.recorder.chunks)
+    assert stream.startswith(b'session 0 line 0 \xff\r\nsession 0 line 1 \xff\r\n')
+    assert b'session 1 line 4 \xff\r\n' in stream
+    assert server.received[0].startswith(ANSWERS) and server.received[1].startswith(ANSWERS)
+    assert [stamp for _, stamp in lines] == sorted(stamp for _, stamp in lines)
+    assert any("connection closed; retrying" in status for status in statuses)
+
+
+def test_refused_connections_back_off(monkeypatch):
+    monkeypatch.setattr(settings, "NET_RECONNECT_MIN_S", 0.1)
+    monkeypatch.setattr(settings, "NET_RECONNECT_MAX_S", 0.4)
+    statuses = []
+    reader = NetReader('127.0.0.1', 1, lambda line, stamp: None, statuses.append)
+    reader.start()
+    try:
+        assert wait_for(lambda: len(statuses) >= 5)
+    finally:
+        reader.stop()
+    waits = [float(status.rsplit("retrying in ", 1)[1].split()[0]) for status in statuses[:5]]
+    assert waits[0] <= 0.15 and waits[1] >= 0.15  # Doubling, with jitter
+    assert max(waits) <= 0.5  # Capped at NET_RECONNECT_MAX_S
+    with pytest.raises(OSError):
+        reader.write(b'x')
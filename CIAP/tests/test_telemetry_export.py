@@ -0,0 +1,59 @@
+import os
+import time
+
+import pytest
+
+import telemetry_export
+
+pa = pytest.importorskip("pyarrow")
+LINES = [
+    "2024-10-04 15:57:14.120 - INFO:  [PLA] DIAG    HEAP (5551640/12582912)",
+    "2024-10-04 15:57:15 - INFO:  [PLA] DIAG    HEAP (5551000/12582912)",
+    "2024-10-04 15:57:15 - INFO:  [NET] nothing to parse here",
+]
+
+
+@pytest.fixture
+def kolkata(monkeypatch):
+    if not hasattr(time, "tzset"):
+        pytest.skip("needs time.tzset")
+    monkeypatch.setenv("TZ", "Asia/Kolkata")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def write_log(directory):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "serial_log_20241004_155709.log")
+    with open(path, "w") as log:
+        log.write("\n".join(LINES) + "\n")
+    return path
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_times_keep_the_local_wall_clock(tmp_path, kolkata, file_format):
+    log = write_log(str(tmp_path / "trial"))
+    counts = telemetry_export.export_log(log, str(tmp_path / "out"), file_format)
+    assert counts == {"heap": 2}
+
+    (table_file,) = os.listdir(tmp_path / "out" / "heap")
+    path = str(tmp_path / "out" / "heap" / table_file)
+    if file_format == "arrow":
+        import pyarrow.ipc
+        table = pyarrow.ipc.open_file(path).read_all()
+    else:
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+    assert table.schema.field("time").type == pa.timestamp("ms", tz="Asia/Kolkata")
+    times = [stamp.strftime("%Y-%m-%d %H:%M:%S.%f") for stamp in table.column("time").to_pylist()]
+    assert times == ["2024-10-04 15:57:14.120000", "2024-10-04 15:57:15.000000"]
+    assert table.column("used").to_pylist() == [5551640, 5551000]
+
+
+def test_same_log_name_in_two_folders_gets_two_tables(tmp_path):
+    first = write_log(str(tmp_path / "day1" / "trial"))
+    second = write_log(str(tmp_path / "day2" / "trial"))
+    assert telemetry_export.table_name(first) != telemetry_export.table_name(second)
+    assert telemetry_export.table_name(first).startswith("trial_serial_log_20241004_155709_")
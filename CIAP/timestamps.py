@@ -0,0 +1,67 @@
+# Line timestamps. Readers take time.monotonic_ns() when bytes come off the port;
+# WallClock maps that to local wall-clock time with millisecond resolution. The
+# "YYYY-mm-dd HH:MM:SS" part only changes once a second, so it is cached instead of
+# calling strftime for every line.
+import time
+
+import settings
+
+
+class WallClock:
+    def __init__(self):
+        self.resync()
+        self.cached = (None, "")  # (second, prefix), swapped as one so threads can share the clock
+
+    def resync(self):
+        # monotonic is immune to NTP steps between lines; re-anchoring every
+        # CLOCK_RESYNC_S lets the wall-clock side follow NTP corrections
+        mono_base = time.monotonic_ns()
+        interval = settings.CLOCK_RESYNC_S * 1_000_000_000
+        deadline = mono_base + interval if interval else float('inf')
+        self.base = (time.time_ns() - mono_base, deadline)  # (wall - monotonic offset, next resync)
+
+    def wall_ns(self, mono_ns):
+        offset, deadline = self.base
+        if mono_ns > deadline:
+            self.resync()
+            offset = self.base[0]
+        return mono_ns + offset
+
+    def format(self, mono_ns=None):
+        # "2024-10-07 15:17:27.123" for a monotonic_ns() timestamp (default: now)
+        if mono_ns is None:
+            mono_ns = time.monotonic_ns()
+        return self.format_wall(self.wall_ns(mono_ns))
+
+    def format_wall(self, wall_ns):
+        second, remainder = divmod(wall_ns, 1_000_000_000)
+        cached_second, prefix = self.cached
+        if second != cached_second:
+            prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+            self.cached = (second, prefix)
+        return f"{prefix}.{remainder // 1_000_000:03d}"
+
+
+def line_time_ms(line, seconds):
+    # Epoch milliseconds of a log line starting "2024-10-07 15:17:27.123 - " (or
+    # without the milliseconds, or " : " in old logs), or None if it has no timestamp.
+    # seconds caches "2024-10-07 15:17:27" -> epoch seconds between calls, so strptime
+    # runs once per second of log.
+    prefix = line[:19]
+    second = seconds.get(prefix)
+    if second is None:
+        try:
+            second = int(time.mktime(time.strptime(prefix, '%Y-%m-%d %H:%M:%S')))
+        except ValueError:
+            second = -1  # Not a timestamp (a line continued after a newline)
+        if len(seconds) > 100000:
+            seconds.clear()
+        seconds[prefix] = second
+    if second < 0:
+        return None
+    milliseconds = int(line[20:23]) if line[19:20] == '.' and line[20:23].isdigit() else 0
+    return second * 1000 + milliseconds
+
+
+# One clock per process so every port and the CAN log share the same time base
+clock = WallClock()
@@ -0,0 +1,129 @@
+# Plays a raw TTY recording (File > TTY Record, see log_writer.TtyRecordWriter) into
+# a pseudo-terminal, chunk by chunk at the pace it was read from the port, so the GUI,
+# the headless logger or any other serial tool can be tested against a real capture:
+#
+#   python3 tty_replay.py tty_20241007_151727.cap [--speed 10] [--link /tmp/ttyCIAP]
+#
+# and point the tool at the printed /dev/pts/N (or the link). The bytes come out
+# exactly as they were read, ANSI codes, broken UTF-8 and all. Any capture works;
+# decoded line records are sent with a CRLF. POSIX only (needs os.openpty).
+import argparse
+import os
+import select
+import threading
+import time
+
+from log_writer import RECORD_DECODED
+from replay import CaptureSource, LogReplay
+
+
+class RawSource(CaptureSource):
+    # (time ms, bytes to send, same bytes) for each record of a capture
+    def next(self):
+        record = next(self.records, None)
+        if record is None:
+            return None
+        self.offset, wall_ns, _, flags, payload = record
+        if flags & RECORD_DECODED:
+            payload += b'\r\n'
+        return wall_ns / 1_000_000, payload, payload
+
+
+class TtyReplay(LogReplay):
+    # The pty stays open after the recording ends, so readers can drain it, until
+    # close() (or stop() once the replay is over), which also stops the replay
+    def __init__(self, path, on_done=None, speed=1.0, link=None):
+        source = RawSource(path)
+        import tty
+
+        self.master, slave = os.openpty()
+        tty.setraw(slave)  # No echo or newline translation: bytes pass through untouched
+        self.slave = slave
+        self.device = os.ttyname(slave)
+        self.link = None
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        if link:
+            try:
+                if os.path.islink(link):
+                    os.remove(link)
+                os.symlink(self.device, link)
+                self.link = link
+            except OSError as e:
+                print(f"Error linking {link} to {self.device}: {e}")
+        super().__init__(path, self.write_chunk, on_done, speed, source)
+
+    def write_chunk(self, data, _, stamp):
+        # A pty only buffers a few KB; when nothing reads the other end the replay
+        # waits here (checking for stop() now and then) rather than lose data
+        view = memoryview(data)
+        while view and self.running:
+            _, writable, _ = select.select([], [self.master], [], 0.2)
+            if writable:
+                sent = os.write(self.master, view)
+                self.bytes_sent += sent
+                view = view[sent:]
+
+    def stop(self):
+        ended = not self.running
+        super().stop()
+        if ended:
+            self.close()
+
+    def close(self):
+        self.running = False
+        self.wake.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1)  # Out of write_chunk() before its fd goes
+        with self.lock:
+            if self.master is None:
+                return
+            for fd in (self.master, self.slave):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self.master = self.slave = None
+            if self.link:
+                try:
+                    os.remove(self.link)
+                except OSError:
+                    pass
+
+    def status_text(self):
+        speed = "max" if self.speed <= 0 else f"{self.speed:g}x"
+        state = "paused" if self.paused else "ended" if not self.running else speed
+        return (f"TTY replay {self.name} on {self.link or self.device}: {self.source.position():.0%}"
+                f"  {self.bytes_sent // 1024} KB  late: {self.late}  ({state})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a raw TTY recording into a pseudo-terminal")
+    parser.add_argument("recording", help="capture written by TTY Record (.cap)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = as recorded, 0 = as fast as possible")
+    parser.add_argument("--link", help="also make this symlink to the pty, e.g. /tmp/ttyCIAP")
+    parser.add_argument("--wait", type=float, default=0.0,
+                        help="seconds to wait before starting, to attach a reader")
+    parser.add_argument("--hold", type=float, default=1.0,
+                        help="seconds to keep the pty open after the end, for readers to drain it")
+    args = parser.parse_args()
+
+    done = threading.Event()
+    replay = TtyReplay(args.recording, done.set, args.speed, args.link)
+    print(f"Replaying {args.recording} on {replay.link or replay.device}", flush=True)
+    try:
+        time.sleep(args.wait)
+        start = time.perf_counter()
+        replay.start()
+        done.wait()
+        elapsed = time.perf_counter() - start
+        print(f"{replay.lines} chunks, {replay.bytes_sent} bytes in {elapsed:.2f} s, {replay.late} late")
+        time.sleep(args.hold)
+    except KeyboardInterrupt:
+        replay.stop()
+        done.wait(2)
+    replay.close()
+
+
+if __name__ == "__main__":
+    main()